@@ -7,7 +7,7 @@ Script para añadir una nueva clase al conjunto de datos
 import os
 import sys
 import argparse
-from utils import add_new_class
+from utils.utils import add_new_class
 
 def parse_args():
     """
@@ -19,6 +19,10 @@ def parse_args():
     parser = argparse.ArgumentParser(description='Añadir una nueva clase al conjunto de datos')
     parser.add_argument('class_dir', help='Directorio con imágenes de la nueva clase')
     parser.add_argument('--raw-dir', default='data/raw', help='Directorio raw')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Amplía el modelo actual y ajusta sólo la cabeza (sin reentrenar todo)')
+    parser.add_argument('--epochs', type=int, default=None,
+                        help='Épocas de ajuste de la cabeza en el modo incremental')
     return parser.parse_args()
 
 def main():
@@ -43,6 +47,28 @@ def main():
         'models/class_names.txt'
     )
     
+    if success and args.incremental:
+        # Importación diferida: TensorFlow sólo hace falta en este modo
+        from utils.incremental import incremental_add_class, INCREMENTAL_EPOCHS
+        
+        if not os.path.exists('models/best_model.h5'):
+            print("Error: No hay un modelo entrenado. Ejecute primero: python main.py")
+            return 1
+        
+        try:
+            incremental_add_class(
+                args.raw_dir,
+                'models/best_model.h5',
+                'models/class_names.txt',
+                epochs=args.epochs or INCREMENTAL_EPOCHS,
+                tflite_path='models/best_model.tflite',
+                tflite_quantization=os.environ.get('TFLITE_QUANTIZATION', 'int8') or 'none'
+            )
+        except Exception as e:
+            print(f"Error al ampliar el modelo: {e}")
+            return 1
+        return 0
+    
     if success:
         print("\nPara reentrenar el modelo con la nueva clase:")
         print("1. Ejecute: python main.py")
@@ -21,6 +21,28 @@ def parse_args():
     parser.add_argument('--port', type=int, default=5000, help='Puerto del servidor (default: 5000)')
     parser.add_argument('--host', default='0.0.0.0', help='Host del servidor (default: 0.0.0.0)')
     parser.add_argument('--debug', action='store_true', help='Ejecutar el servidor en modo debug')
+    parser.add_argument('--batch-size', type=int, default=None,
+                        help='Tamaño máximo del micro-lote de inferencia (default: 16)')
+    parser.add_argument('--batch-wait-ms', type=float, default=None,
+                        help='Espera máxima para completar un micro-lote en ms (default: 5)')
+    parser.add_argument('--backend', choices=['keras', 'tflite'], default=None,
+                        help='Backend de inferencia (default: keras o variable MODEL_BACKEND)')
+    parser.add_argument('--tflite-threads', type=int, default=None,
+                        help='Hilos del intérprete TFLite (default: número de CPUs)')
+    parser.add_argument('--async', dest='async_mode', action='store_true',
+                        help='Servir la API en modo asíncrono (ASGI con uvicorn)')
+    parser.add_argument('--production', action='store_true',
+                        default=os.environ.get('PRODUCTION_SERVER', '0').lower() in ('1', 'true', 'yes'),
+                        help='Servidor de producción con varios workers (gunicorn; '
+                             'también con la variable PRODUCTION_SERVER=1)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Número de workers en modo producción (default: CPUs / 2)')
+    parser.add_argument('--intra-op-threads', type=int, default=None,
+                        help='Hilos intra-op de TensorFlow por worker (default: CPUs / workers)')
+    parser.add_argument('--inter-op-threads', type=int, default=None,
+                        help='Hilos inter-op de TensorFlow por worker (default: 1)')
+    parser.add_argument('--full-decode', action='store_true',
+                        help='Decodificar los JPEG a resolución completa (desactiva la decodificación reducida)')
     return parser.parse_args()
 
 def check_directories():
@@ -105,7 +127,9 @@ def main():
     check_directories()
     
     # Verificamos si el modelo está entrenado
-    if not os.path.exists('models/best_model.h5'):
+    backend = args.backend or os.environ.get('MODEL_BACKEND', 'keras')
+    model_path = 'models/best_model.tflite' if backend == 'tflite' else 'models/best_model.h5'
+    if not os.path.exists(model_path):
         print("⚠️ Advertencia: No se encontró el modelo entrenado.")
         print("Por favor, ejecute main.py primero para entrenar el modelo.")
         print("El servidor se iniciará, pero no podrá realizar predicciones hasta que entrene el modelo.")
@@ -127,18 +151,37 @@ def main():
     print(" Clasificador de Gomitas - Servidor API y Web ".center(80, "="))
     print("="*80)
     print(f"📡 API REST: http://{args.host}:{args.port}/api")
-    print(f"🌐 Interfaz Web: http://{args.host}:{args.port}/")
+    if args.async_mode:
+        print("⚡ Modo asíncrono (ASGI): sólo se sirven las rutas /api/*")
+    else:
+        print(f"🌐 Interfaz Web: http://{args.host}:{args.port}/")
     print(f"🧪 Endpoints API disponibles:")
     print(f"   - GET  /api/info")
     print(f"   - POST /api/predict")
+    print(f"   - POST /api/predict_batch")
     print(f"   - GET  /api/classes")
     print(f"   - GET  /api/health")
+    print(f"   - GET  /api/cache_stats")
     print(f"   - GET  /api/model_status")
+    print(f"   - GET  /api/metrics")
     print("="*80)
     
     # Iniciamos el servidor con los parámetros pasados
     try:
-        run_server(custom_host=args.host, custom_port=args.port)
+        run_server(
+            custom_host=args.host,
+            custom_port=args.port,
+            batch_max_size=args.batch_size,
+            batch_max_wait_ms=args.batch_wait_ms,
+            backend=args.backend,
+            tflite_threads=args.tflite_threads,
+            full_decode=args.full_decode,
+            async_mode=args.async_mode,
+            production=args.production,
+            workers=args.workers,
+            intra_op_threads=args.intra_op_threads,
+            inter_op_threads=args.inter_op_threads
+        )
         return 0
     except KeyboardInterrupt:
         print("\n👋 Servidor detenido por el usuario")
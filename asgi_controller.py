@@ -0,0 +1,516 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Controller ASGI: modo de servicio asíncrono para la API del clasificador de gomitas
+
+Expone las mismas rutas /api/* que controller.py, pero la lectura de las
+subidas es asíncrona y el trabajo de CPU se envía a pools acotados:
+la decodificación a un pool de hilos o procesos y la inferencia al
+planificador de micro-lotes. Así, las subidas lentas desde el móvil no
+ocupan capacidad de inferencia.
+"""
+
+import os
+import json
+import asyncio
+import contextlib
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import numpy as np
+
+import controller
+from utils.image_utils import load_image_array
+from utils import metrics
+
+# Configuración de los pools del modo asíncrono
+ASYNC_DECODE_MODE = os.environ.get('ASYNC_DECODE_MODE', 'thread')  # 'thread' o 'process'
+ASYNC_DECODE_WORKERS = int(os.environ.get('ASYNC_DECODE_WORKERS', controller.DECODE_WORKERS))
+# Máximo de imágenes pendientes de decodificar / inferir antes de aplicar contrapresión
+ASYNC_MAX_PENDING_DECODES = int(os.environ.get('ASYNC_MAX_PENDING_DECODES', 4 * ASYNC_DECODE_WORKERS))
+ASYNC_MAX_PENDING_INFERENCES = int(os.environ.get('ASYNC_MAX_PENDING_INFERENCES', 4 * controller.BATCH_MAX_SIZE))
+
+# Pools y semáforos (se crean al arrancar, dentro del bucle de eventos)
+decode_executor = None
+model_executor = None
+decode_slots = None
+inference_slots = None
+
+# Peticiones idénticas en curso: clave de caché -> asyncio.Future
+_inflight = {}
+
+class RequestTooLarge(Exception):
+    """El cuerpo de la petición supera controller.MAX_CONTENT_LENGTH"""
+
+async def read_body(request):
+    """
+    Lee el cuerpo de la petición con el mismo límite que el modo Flask
+
+    Se comprueba la cabecera content-length y además los bytes recibidos,
+    para cortar a tiempo subidas sin cabecera o que mienten sobre su tamaño.
+
+    Returns:
+        Bytes del cuerpo
+
+    Raises:
+        RequestTooLarge: Si supera MAX_CONTENT_LENGTH
+    """
+    limit = controller.MAX_CONTENT_LENGTH
+    declared = request.headers.get('content-length', '')
+    if declared.isdigit() and int(declared) > limit:
+        raise RequestTooLarge()
+
+    chunks = []
+    size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > limit:
+            raise RequestTooLarge()
+        chunks.append(chunk)
+    return b''.join(chunks)
+
+async def read_form(request):
+    """
+    Lee un formulario multipart respetando MAX_CONTENT_LENGTH
+
+    Returns:
+        Formulario de starlette
+    """
+    from starlette.requests import Request
+
+    body = await read_body(request)
+
+    async def receive():
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+
+    return await Request(request.scope, receive).form()
+
+def decode_for_model(image_bytes, img_height, img_width, fast_decode):
+    """
+    Decodifica y redimensiona una imagen (se ejecuta en el pool de decodificación)
+
+    Devuelve uint8 para que el paso entre procesos sea 8 veces más pequeño;
+    la normalización se hace en el proceso principal.
+
+    Returns:
+        Array uint8 de forma (alto, ancho, 3)
+    """
+    if not image_bytes:
+        raise ValueError('Imagen vacía')
+    return load_image_array(image_bytes, img_height, img_width,
+                            fast_decode=fast_decode, normalize=False)
+
+def create_executors():
+    """Crea los pools acotados de decodificación y de carga del modelo"""
+    global decode_executor, model_executor, decode_slots, inference_slots
+
+    if ASYNC_DECODE_MODE == 'process':
+        decode_executor = ProcessPoolExecutor(max_workers=ASYNC_DECODE_WORKERS)
+    else:
+        decode_executor = ThreadPoolExecutor(max_workers=ASYNC_DECODE_WORKERS,
+                                             thread_name_prefix='async-decode')
+
+    # Un único hilo para tareas bloqueantes del modelo (carga, lectura de archivos)
+    model_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='async-model')
+
+    decode_slots = asyncio.Semaphore(ASYNC_MAX_PENDING_DECODES)
+    inference_slots = asyncio.Semaphore(ASYNC_MAX_PENDING_INFERENCES)
+
+def shutdown_executors():
+    """Libera los pools al detener el servidor"""
+    for executor in (decode_executor, model_executor):
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+async def decode_image(image_bytes, current):
+    """
+    Decodifica una imagen en el pool acotado
+
+    Args:
+        image_bytes: Contenido del archivo de imagen
+        current: Versión del modelo tomada al inicio de la petición (fija el tamaño)
+
+    Returns:
+        Array normalizado de forma (alto, ancho, 3)
+    """
+    loop = asyncio.get_running_loop()
+    async with decode_slots:
+        # Incluye la espera en el pool (en modo proceso no se mide dentro del worker)
+        try:
+            with metrics.STAGE_SECONDS.time('image_decode'):
+                img_array = await loop.run_in_executor(
+                    decode_executor, decode_for_model, image_bytes,
+                    current.img_height, current.img_width, controller.FAST_DECODE
+                )
+        except Exception as e:
+            raise controller.InvalidImageError(str(e))
+    with metrics.STAGE_SECONDS.time('resize_normalize'):
+        return img_array / 255.0
+
+async def run_inference(current, batch):
+    """
+    Envía un lote al planificador de micro-lotes sin bloquear el bucle de eventos
+
+    Args:
+        current: Versión del modelo tomada al inicio de la petición
+        batch: Array de forma (n, alto, ancho, 3)
+
+    Returns:
+        Array de forma (n, num_clases)
+    """
+    async with inference_slots:
+        with metrics.STAGE_SECONDS.time('inference'):
+            future = controller.get_batcher().submit(current.model, batch)
+            return await asyncio.wrap_future(future)
+
+async def ensure_model():
+    """Carga el modelo en el pool del modelo si aún no está cargado"""
+    if controller.get_current_model() is not None:
+        return True
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(model_executor, controller.load_model_if_needed)
+
+async def load_class_names():
+    """Lee los nombres de clases sin bloquear el bucle de eventos"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(model_executor, controller.load_class_names)
+
+async def predict_bytes(image_bytes, current):
+    """
+    Predice una imagen usando la caché y coalesciendo peticiones idénticas
+
+    Args:
+        image_bytes: Contenido del archivo de imagen
+        current: Versión del modelo tomada al inicio de la petición
+
+    Returns:
+        Lista de resultados ordenados por confianza
+    """
+    key = controller.prediction_cache.make_key(image_bytes, controller.get_model_version(current))
+    cached = controller.prediction_cache.get(key)
+    if cached is not None:
+        return cached
+
+    pending = _inflight.get(key)
+    if pending is not None:
+        controller.prediction_cache.record_coalesced()
+        return await asyncio.shield(pending)
+
+    future = asyncio.get_running_loop().create_future()
+    _inflight[key] = future
+    try:
+        img_array = await decode_image(image_bytes, current)
+        predictions = await run_inference(current, np.expand_dims(img_array, axis=0))
+        results = controller.build_results(predictions[0], current.class_names)
+        controller.prediction_cache.put(key, results)
+        future.set_result(results)
+        return results
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except Exception as e:
+        future.set_exception(e)
+        # Evitamos el aviso de excepción no recuperada si nadie más esperaba
+        future.exception()
+        raise
+    finally:
+        _inflight.pop(key, None)
+
+def record_request(endpoint, start, status_code):
+    """Registra la duración y el código de estado de una petición"""
+    status = str(status_code)
+    metrics.REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint)
+    metrics.REQUESTS_TOTAL.inc(endpoint, status)
+    if status_code >= 400:
+        metrics.ERRORS_TOTAL.inc(endpoint, status)
+
+def create_app():
+    """
+    Crea la aplicación ASGI con las rutas /api/*
+
+    Returns:
+        app: Aplicación Starlette
+    """
+    try:
+        from starlette.applications import Starlette
+        from starlette.responses import JSONResponse, Response
+        from starlette.routing import Route
+    except ImportError:
+        raise ImportError('El modo asíncrono requiere starlette y uvicorn. '
+                          'Instale: pip install starlette uvicorn python-multipart')
+
+    def error(message, status_code):
+        return JSONResponse({'status': 'error', 'message': message}, status_code=status_code)
+
+    def body_too_large():
+        return error(f'La petición supera el máximo de '
+                     f'{controller.MAX_CONTENT_LENGTH // (1024 * 1024)} MB', 413)
+
+    def batch_too_large(count):
+        return error(f'Demasiadas imágenes ({count}). '
+                     f'Máximo permitido: {controller.BATCH_MAX_IMAGES}', 413)
+
+    async def get_info(request):
+        """Devuelve información sobre el modelo (API)"""
+        loop = asyncio.get_running_loop()
+        info = await loop.run_in_executor(model_executor, controller.get_model_info)
+        return JSONResponse({'status': 'ok', **info})
+
+    async def read_single_image(request):
+        """Lee de forma asíncrona la imagen de /api/predict (JSON o multipart)"""
+        content_type = request.headers.get('content-type', '')
+
+        if 'application/json' in content_type:
+            with metrics.STAGE_SECONDS.time('body_read'):
+                payload = json.loads(await read_body(request))
+            if not isinstance(payload, dict) or 'image' not in payload:
+                return None, error('No se envió ninguna imagen', 400)
+            return controller.decode_base64_image(payload['image']), None
+
+        if 'multipart/form-data' in content_type:
+            form = await read_form(request)
+            upload = form.get('file')
+            if upload is None or isinstance(upload, str):
+                return None, error('No se envió ningún archivo', 400)
+            if upload.filename == '':
+                return None, error('No se seleccionó ningún archivo', 400)
+            with metrics.STAGE_SECONDS.time('body_read'):
+                return await upload.read(), None
+
+        return None, error('Tipo de contenido no soportado. Use application/json o multipart/form-data', 415)
+
+    async def predict(request):
+        """Realiza una predicción con una imagen enviada (API)"""
+        if not await ensure_model():
+            return error('Error al cargar el modelo', 500)
+
+        try:
+            try:
+                image_bytes, response = await read_single_image(request)
+            except RequestTooLarge:
+                return body_too_large()
+            except (json.JSONDecodeError, UnicodeDecodeError) as e:
+                return error(f'JSON inválido: {e}', 400)
+            if response is not None:
+                return response
+
+            try:
+                results = await predict_bytes(image_bytes, controller.get_current_model())
+            except controller.InvalidImageError as e:
+                return error(str(e), 400)
+
+            with metrics.STAGE_SECONDS.time('serialize'):
+                return JSONResponse({
+                    'status': 'ok',
+                    'prediction': results[0]['class'],
+                    'confidence': results[0]['confidence'],
+                    'all_predictions': results
+                })
+
+        except Exception as e:
+            print(f"Error en predicción: {e}")
+            import traceback
+            traceback.print_exc()
+            return error(str(e), 500)
+
+    async def predict_batch(request):
+        """Realiza predicciones para varias imágenes en una sola petición (API)"""
+        if not await ensure_model():
+            return error('Error al cargar el modelo', 500)
+
+        try:
+            content_type = request.headers.get('content-type', '')
+            items = []  # (nombre, bytes, error)
+
+            if 'application/json' in content_type:
+                try:
+                    with metrics.STAGE_SECONDS.time('body_read'):
+                        payload = json.loads(await read_body(request))
+                except RequestTooLarge:
+                    return body_too_large()
+                except (json.JSONDecodeError, UnicodeDecodeError) as e:
+                    return error(f'JSON inválido: {e}', 400)
+                images = payload.get('images') if isinstance(payload, dict) else None
+                if not isinstance(images, list) or not images:
+                    return error('No se envió ninguna imagen', 400)
+                if len(images) > controller.BATCH_MAX_IMAGES:
+                    return batch_too_large(len(images))
+                for image_data in images:
+                    try:
+                        items.append((None, controller.decode_base64_image(image_data), None))
+                    except Exception as e:
+                        items.append((None, None, f'Base64 inválido: {e}'))
+
+            elif 'multipart/form-data' in content_type:
+                try:
+                    form = await read_form(request)
+                except RequestTooLarge:
+                    return body_too_large()
+                uploads = [u for u in form.getlist('files') + form.getlist('file')
+                           if not isinstance(u, str)]
+                if not uploads:
+                    return error('No se envió ningún archivo', 400)
+                if len(uploads) > controller.BATCH_MAX_IMAGES:
+                    return batch_too_large(len(uploads))
+                for upload in uploads:
+                    if upload.filename == '' or not controller.allowed_file(upload.filename):
+                        items.append((upload.filename, None, 'Tipo de archivo no permitido'))
+                    else:
+                        items.append((upload.filename, await upload.read(), None))
+
+            else:
+                return error('Tipo de contenido no soportado. Use application/json o multipart/form-data', 415)
+
+            # Versión del modelo (y sus clases en memoria) para todo el lote
+            current = controller.get_current_model()
+            class_names = current.class_names
+
+            # Decodificamos en paralelo (los fallos de caché) en el pool acotado
+            model_version = controller.get_model_version(current)
+            cache = controller.prediction_cache
+            keys, results_by_index, errors, pending = {}, {}, {}, {}
+            for i, (_, image_bytes, item_error) in enumerate(items):
+                if item_error is not None:
+                    errors[i] = item_error
+                    continue
+                keys[i] = cache.make_key(image_bytes, model_version)
+                cached = cache.get(keys[i])
+                if cached is not None:
+                    results_by_index[i] = cached
+                else:
+                    pending[i] = decode_image(image_bytes, current)
+
+            decoded = await asyncio.gather(*pending.values(), return_exceptions=True)
+            arrays = []
+            for i, result in zip(pending.keys(), decoded):
+                if isinstance(result, Exception):
+                    errors[i] = f'Error al procesar la imagen: {result}'
+                else:
+                    arrays.append((i, result))
+
+            # Una sola inferencia para todas las imágenes válidas
+            if arrays:
+                predictions = await run_inference(current, np.stack([a for _, a in arrays]))
+                for (i, _), prediction in zip(arrays, predictions):
+                    results_by_index[i] = controller.build_results(prediction, class_names)
+                    cache.put(keys[i], results_by_index[i])
+
+            results = []
+            for i, (filename, _, _) in enumerate(items):
+                entry = {'index': i}
+                if filename is not None:
+                    entry['filename'] = filename
+                if i in results_by_index:
+                    all_predictions = results_by_index[i]
+                    entry.update({
+                        'status': 'ok',
+                        'prediction': all_predictions[0]['class'],
+                        'confidence': all_predictions[0]['confidence'],
+                        'all_predictions': all_predictions
+                    })
+                else:
+                    entry.update({'status': 'error', 'message': errors[i]})
+                results.append(entry)
+
+            with metrics.STAGE_SECONDS.time('serialize'):
+                return JSONResponse({
+                    'status': 'ok',
+                    'count': len(results),
+                    'errors': len(errors),
+                    'results': results
+                })
+
+        except Exception as e:
+            print(f"Error en predicción por lotes: {e}")
+            import traceback
+            traceback.print_exc()
+            return error(str(e), 500)
+
+    async def get_classes(request):
+        """Devuelve la lista de clases disponibles (API)"""
+        return JSONResponse({'status': 'ok', 'classes': await load_class_names()})
+
+    async def health_check(request):
+        """Comprueba si el servidor está funcionando (API)"""
+        return JSONResponse({'status': 'ok', 'message': 'El servidor está en funcionamiento'})
+
+    async def cache_stats(request):
+        """Devuelve los contadores de la caché de predicciones (API)"""
+        return JSONResponse({'status': 'ok', 'cache': controller.prediction_cache.stats()})
+
+    async def model_status(request):
+        """Comprueba el estado del modelo (API)"""
+        current = controller.get_current_model()
+        status = {
+            'model_file_exists': os.path.exists(controller.get_model_path()),
+            'class_names_file_exists': os.path.exists(controller.CLASS_NAMES_PATH),
+            'model_loaded': current is not None
+        }
+        return JSONResponse({
+            'status': 'ok' if all(status.values()) else 'warning',
+            'backend': controller.MODEL_BACKEND,
+            'model_version': current.version if current else None,
+            'details': status
+        })
+
+    async def metrics_endpoint(request):
+        """Exporta las métricas del proceso en formato de texto de Prometheus"""
+        return Response(metrics.registry.render(), headers={'content-type': metrics.CONTENT_TYPE})
+
+    def timed(path, handler):
+        """Envuelve un handler para registrar la duración y el estado de cada petición"""
+        async def endpoint(request):
+            start = time.perf_counter()
+            try:
+                response = await handler(request)
+            except Exception:
+                record_request(path, start, 500)
+                raise
+            record_request(path, start, response.status_code)
+            return response
+        return endpoint
+
+    @contextlib.asynccontextmanager
+    async def lifespan(app):
+        create_executors()
+        # Cargamos el modelo al inicio sin bloquear el bucle de eventos
+        await ensure_model()
+        try:
+            yield
+        finally:
+            shutdown_executors()
+
+    handlers = [
+        ('/api/info', get_info, ['GET']),
+        ('/api/predict', predict, ['POST']),
+        ('/api/predict_batch', predict_batch, ['POST']),
+        ('/api/classes', get_classes, ['GET']),
+        ('/api/health', health_check, ['GET']),
+        ('/api/cache_stats', cache_stats, ['GET']),
+        ('/api/model_status', model_status, ['GET']),
+        ('/api/metrics', metrics_endpoint, ['GET']),
+    ]
+    routes = [Route(path, timed(path, handler), methods=methods) for path, handler, methods in handlers]
+
+    return Starlette(routes=routes, lifespan=lifespan)
+
+def run_async_server(host=None, port=None):
+    """
+    Inicia el servidor ASGI con uvicorn
+
+    Args:
+        host: Host del servidor
+        port: Puerto del servidor
+    """
+    try:
+        import uvicorn
+    except ImportError:
+        raise ImportError('El modo asíncrono requiere uvicorn. Instale: pip install uvicorn')
+
+    host = host or controller.HOST
+    port = port or controller.PORT
+
+    print(f"Iniciando servidor asíncrono (ASGI) en http://{host}:{port}")
+    print(f"Decodificación: pool de {ASYNC_DECODE_MODE} con {ASYNC_DECODE_WORKERS} workers")
+    print(f"Micro-batching: lote máximo {controller.BATCH_MAX_SIZE}, "
+          f"espera máxima {controller.BATCH_MAX_WAIT_MS} ms")
+    uvicorn.run(create_app(), host=host, port=port, log_level='info')
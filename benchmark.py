@@ -0,0 +1,471 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmarks de rendimiento: preprocesamiento, inferencia y API de extremo a extremo
+
+Genera imágenes sintéticas (JPEG, PNG y HEIC si pillow-heif está instalado)
+a varias resoluciones y mide:
+- decode: decodificación (reducida y completa) con open_image
+- resize_normalize: redimensionado a la entrada del modelo y normalización
+- inference: model.predict con varios tamaños de lote
+- prepare_dataset: construcción del dataset en frío y con la caché
+- http: POST /api/predict completo con el cliente de pruebas de Flask
+
+Funciona sin conexión y en CPU: si no hay modelo entrenado se usa uno con
+pesos aleatorios. Los resultados se guardan en JSON con percentiles y se
+pueden comparar con una ejecución anterior (--compare) para detectar
+regresiones.
+
+Uso:
+    python benchmark.py [--quick] [--only decode,inference] [--compare anterior.json]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import numpy as np
+from PIL import Image
+from utils.image_utils import open_image, normalize_images, heic_decoder_available
+from utils.models_utils import read_model_config
+
+# Directorio por defecto de los resultados
+BENCHMARK_DIR = os.path.join('output', 'benchmarks')
+# Resoluciones (ancho, alto) de las imágenes sintéticas
+RESOLUTIONS = [(640, 480), (1920, 1080), (4032, 3024)]
+# Tamaños de lote de la inferencia
+BATCH_SIZES = [1, 8, 32]
+# Secciones disponibles
+SECTIONS = ('decode', 'resize_normalize', 'inference', 'prepare_dataset', 'http')
+# Regresión: aumento relativo de la mediana a partir del cual se marca
+REGRESSION_THRESHOLD = 0.10
+
+def parse_args():
+    """
+    Analiza los argumentos de línea de comandos
+
+    Returns:
+        args: Argumentos analizados
+    """
+    parser = argparse.ArgumentParser(description='Benchmarks de rendimiento del clasificador')
+    parser.add_argument('--only', default=','.join(SECTIONS),
+                        help=f"Secciones a ejecutar, separadas por comas ({', '.join(SECTIONS)})")
+    parser.add_argument('--repeats', type=int, default=20, help='Mediciones por caso')
+    parser.add_argument('--quick', action='store_true',
+                        help='Menos repeticiones y resoluciones (para comprobaciones rápidas)')
+    parser.add_argument('--model', default='models/best_model.h5',
+                        help='Modelo entrenado; si no existe se usa uno con pesos aleatorios')
+    parser.add_argument('--classes', default='models/class_names.txt', help='Ruta a los nombres de clases')
+    parser.add_argument('--random-model', action='store_true',
+                        help='Usa un modelo con pesos aleatorios aunque exista el entrenado')
+    parser.add_argument('--output', default=None,
+                        help=f'Archivo JSON de resultados (por defecto {BENCHMARK_DIR}/benchmark_<fecha>.json)')
+    parser.add_argument('--compare', default=None,
+                        help='Resultados anteriores con los que comparar (marca las regresiones)')
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                        help='Aumento relativo de la mediana que se considera regresión (default: 0.10)')
+    return parser.parse_args()
+
+def summarize(samples, items_per_sample=1):
+    """
+    Resume una lista de tiempos
+
+    Args:
+        samples: Segundos de cada medición
+        items_per_sample: Elementos procesados en cada medición (para el rendimiento)
+
+    Returns:
+        Diccionario con media, mínimo, máximo y percentiles en milisegundos
+    """
+    ms = np.asarray(samples, dtype=np.float64) * 1000.0
+    stats = {
+        'unit': 'ms',
+        'count': int(len(ms)),
+        'mean': float(ms.mean()),
+        'min': float(ms.min()),
+        'max': float(ms.max()),
+    }
+    for p in (50, 90, 95, 99):
+        stats[f'p{p}'] = float(np.percentile(ms, p))
+    stats['items_per_sec'] = float(items_per_sample * 1000.0 / stats['p50']) if stats['p50'] else None
+    return stats
+
+def measure(fn, repeats, warmup=2, items_per_sample=1):
+    """
+    Ejecuta una función varias veces y resume sus tiempos
+
+    Args:
+        fn: Función que recibe el índice de la repetición
+        repeats: Mediciones
+        warmup: Ejecuciones previas descartadas
+        items_per_sample: Elementos procesados por llamada
+
+    Returns:
+        Diccionario de summarize
+    """
+    for i in range(warmup):
+        fn(i)
+    samples = []
+    for i in range(repeats):
+        start = time.perf_counter()
+        fn(warmup + i)
+        samples.append(time.perf_counter() - start)
+    return summarize(samples, items_per_sample)
+
+def synthetic_image(width, height, seed=0):
+    """
+    Genera una imagen RGB sintética con degradados, manchas y ruido
+
+    El contenido no es uniforme para que el tamaño comprimido y el coste de
+    decodificación se parezcan a los de una foto.
+
+    Returns:
+        Imagen PIL
+    """
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    image = np.empty((height, width, 3), dtype=np.float32)
+    for channel in range(3):
+        fx, fy = rng.uniform(1, 6, size=2)
+        image[..., channel] = 127 + 60 * np.sin(x / width * fx * np.pi + channel) * np.cos(y / height * fy * np.pi)
+    for _ in range(8):
+        cx, cy = rng.uniform(0, width), rng.uniform(0, height)
+        radius = rng.uniform(0.05, 0.2) * min(width, height)
+        blob = np.exp(-((x - cx) ** 2 + (y - cy) ** 2) / (2 * radius ** 2))
+        image += blob[..., None] * rng.uniform(-80, 80, size=3)
+    image += rng.normal(0, 8, size=image.shape)
+    return Image.fromarray(np.clip(image, 0, 255).astype(np.uint8))
+
+def available_formats():
+    """Formatos de entrada disponibles (HEIC sólo con pillow-heif)"""
+    formats = ['jpeg', 'png']
+    if heic_decoder_available():
+        try:
+            import pillow_heif
+            pillow_heif.register_heif_opener()
+            formats.append('heic')
+        except ImportError:
+            print("⚠️ pyheif sólo decodifica HEIC; se omiten las entradas HEIC")
+    else:
+        print("⚠️ pillow-heif no instalado; se omiten las entradas HEIC")
+    return formats
+
+def encode_image(img, fmt):
+    """
+    Codifica una imagen en memoria
+
+    Returns:
+        Bytes del archivo
+    """
+    buffer = io.BytesIO()
+    if fmt == 'jpeg':
+        img.save(buffer, 'JPEG', quality=90)
+    elif fmt == 'png':
+        img.save(buffer, 'PNG')
+    else:
+        img.save(buffer, 'HEIF', quality=90)
+    return buffer.getvalue()
+
+def load_benchmark_model(model_path, classes_path, random_model=False, num_classes=5, model_config=None):
+    """
+    Carga el modelo entrenado o crea uno con pesos aleatorios
+
+    Args:
+        model_config: Configuración del modelo (alpha y tamaño de entrada) para
+            el modelo aleatorio (None = la de models/model_config.json)
+
+    Returns:
+        model: Modelo de Keras
+        class_names: Nombres de las clases
+        source: 'trained' o 'random'
+    """
+    if not random_model and os.path.exists(model_path) and os.path.exists(classes_path):
+        from utils.models_utils import load_prediction_model
+        from utils.model_manager import read_class_names
+        return load_prediction_model(model_path), read_class_names(classes_path), 'trained'
+
+    # Misma arquitectura que el entrenamiento, sin descargar los pesos de ImageNet
+    from main import create_model
+    print("Usando un modelo con pesos aleatorios (sin descargar pesos preentrenados)")
+    model_config = model_config or read_model_config()
+    model = create_model(num_classes, weights=None, alpha=model_config['alpha'],
+                         img_size=model_config['img_height'])
+    return model, [f'clase_{i}' for i in range(num_classes)], 'random'
+
+def bench_decode(inputs, repeats, img_size):
+    """Tiempo de decodificación por formato y resolución (img_size = alto, ancho del modelo)"""
+    img_height, img_width = img_size
+    results = {}
+    for (fmt, width, height), data in inputs.items():
+        modes = [('fast', True), ('full', False)] if fmt == 'jpeg' else [('full', False)]
+        for label, fast_decode in modes:
+            key = f"decode/{fmt}/{width}x{height}/{label}"
+            results[key] = measure(
+                lambda i: open_image(data, target_size=(img_width, img_height), fast_decode=fast_decode),
+                repeats
+            )
+            print(f"  {key}: p50 {results[key]['p50']:.2f} ms")
+    return results
+
+def bench_resize_normalize(resolutions, repeats, img_size):
+    """Tiempo de redimensionado a la entrada del modelo y normalización"""
+    img_height, img_width = img_size
+    results = {}
+    for width, height in resolutions:
+        img = synthetic_image(width, height)
+        key = f"resize_normalize/{width}x{height}"
+        results[key] = measure(
+            lambda i: normalize_images(np.asarray(img.resize((img_width, img_height)))[None]),
+            repeats
+        )
+        print(f"  {key}: p50 {results[key]['p50']:.2f} ms")
+    return results
+
+def bench_inference(model, repeats, batch_sizes=BATCH_SIZES):
+    """Tiempo de model.predict por tamaño de lote"""
+    results = {}
+    rng = np.random.default_rng(0)
+    input_shape = tuple(int(d) for d in model.input_shape[1:])
+    for batch_size in batch_sizes:
+        batch = rng.random((batch_size,) + input_shape, dtype=np.float32)
+        key = f"inference/batch_{batch_size}"
+        results[key] = measure(lambda i: model.predict(batch, verbose=0), repeats,
+                               items_per_sample=batch_size)
+        print(f"  {key}: p50 {results[key]['p50']:.2f} ms ({results[key]['items_per_sec']:.1f} img/s)")
+    return results
+
+@contextlib.contextmanager
+def working_directory(path):
+    """Cambia temporalmente el directorio de trabajo"""
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+def bench_prepare_dataset(repeats, img_size, num_classes=3, images_per_class=40, resolution=(1280, 960)):
+    """
+    Rendimiento de prepare_dataset sobre un dataset sintético
+
+    Se ejecuta en un directorio temporal (prepare_dataset escribe la caché y
+    data/splits.json relativos al directorio de trabajo).
+    """
+    from utils.utils import prepare_dataset
+
+    img_height, img_width = img_size
+    results = {}
+    workspace = tempfile.mkdtemp(prefix='benchmark_dataset_')
+    total = num_classes * images_per_class
+    try:
+        for c in range(num_classes):
+            class_dir = os.path.join(workspace, 'data', 'raw', f'clase_{c}')
+            os.makedirs(class_dir)
+            for i in range(images_per_class):
+                synthetic_image(*resolution, seed=c * images_per_class + i).save(
+                    os.path.join(class_dir, f'img_{i}.jpg'), 'JPEG', quality=90)
+
+        with working_directory(workspace), contextlib.redirect_stdout(io.StringIO()):
+            cache_dir = os.path.join('data', 'cache')
+            cold = []
+            for _ in range(max(1, repeats // 5)):
+                shutil.rmtree(cache_dir, ignore_errors=True)
+                start = time.perf_counter()
+                prepare_dataset('data/raw', img_height, img_width, cache_dir=cache_dir)
+                cold.append(time.perf_counter() - start)
+
+            warm = []
+            for _ in range(max(1, repeats // 5)):
+                start = time.perf_counter()
+                prepare_dataset('data/raw', img_height, img_width, cache_dir=cache_dir)
+                warm.append(time.perf_counter() - start)
+    finally:
+        shutil.rmtree(workspace, ignore_errors=True)
+
+    for label, samples in (('cold', cold), ('cached', warm)):
+        key = f"prepare_dataset/{label}/{total}_images_{resolution[0]}x{resolution[1]}"
+        results[key] = summarize(samples, items_per_sample=total)
+        print(f"  {key}: p50 {results[key]['p50']:.0f} ms ({results[key]['items_per_sec']:.1f} img/s)")
+    return results
+
+def bench_http(model, class_names, inputs, repeats, model_path=None, classes_path=None):
+    """
+    Tiempo de POST /api/predict con el cliente de pruebas de Flask
+
+    Cada petición envía una imagen distinta para no medir la caché de
+    predicciones.
+
+    Args:
+        model: Modelo (se guarda en un directorio temporal si no hay model_path)
+        class_names: Nombres de las clases
+        inputs: Diccionario (formato, ancho, alto) -> bytes
+        repeats: Mediciones por caso
+        model_path: Modelo entrenado que sirve el controlador (None = guardar `model`)
+        classes_path: Nombres de clases del modelo entrenado
+    """
+    workspace = tempfile.mkdtemp(prefix='benchmark_http_')
+    if model_path is None:
+        model_path = os.path.join(workspace, 'model.h5')
+        classes_path = os.path.join(workspace, 'class_names.txt')
+        model.save(model_path)
+        with open(classes_path, 'w') as f:
+            f.write('\n'.join(class_names) + '\n')
+
+    import controller
+    if model_path.endswith('.tflite'):
+        controller.MODEL_BACKEND = 'tflite'
+        controller.TFLITE_MODEL_PATH = model_path
+    else:
+        controller.MODEL_BACKEND = 'keras'
+        controller.MODEL_PATH = model_path
+    controller.CLASS_NAMES_PATH = classes_path
+    controller.MODEL_RELOAD_INTERVAL = 0
+    if not controller.load_model_if_needed():
+        raise RuntimeError(f"El controlador no pudo cargar {model_path}")
+    client = controller.app.test_client()
+
+    results = {}
+    try:
+        for (fmt, width, height), _ in inputs.items():
+            # Imágenes distintas por petición, codificadas antes de medir
+            payloads = [encode_image(synthetic_image(width, height, seed=1000 + i), fmt)
+                        for i in range(repeats + 2)]
+
+            def post(i):
+                response = client.post('/api/predict', data={
+                    'file': (io.BytesIO(payloads[i]), f'bench.{fmt}')
+                }, content_type='multipart/form-data')
+                if response.status_code != 200:
+                    raise RuntimeError(f"/api/predict devolvió {response.status_code}: {response.get_data(True)}")
+
+            key = f"http/api_predict/{fmt}/{width}x{height}"
+            results[key] = measure(post, repeats)
+            print(f"  {key}: p50 {results[key]['p50']:.2f} ms")
+    finally:
+        shutil.rmtree(workspace, ignore_errors=True)
+    return results
+
+def compare_results(current, previous, threshold):
+    """
+    Compara la mediana de cada caso con una ejecución anterior
+
+    Args:
+        current: Resultados actuales (diccionario caso -> estadísticas)
+        previous: Resultados anteriores
+        threshold: Aumento relativo que se considera regresión
+
+    Returns:
+        Diccionario caso -> {'previous_p50', 'p50', 'change', 'regression'}
+    """
+    comparison = {}
+    for key, stats in current.items():
+        old = previous.get(key)
+        if not old or not old.get('p50'):
+            continue
+        change = stats['p50'] / old['p50'] - 1.0
+        comparison[key] = {
+            'previous_p50': old['p50'],
+            'p50': stats['p50'],
+            'change': change,
+            'regression': change > threshold,
+        }
+    return comparison
+
+def main():
+    """Función principal"""
+    args = parse_args()
+    sections = [section.strip() for section in args.only.split(',') if section.strip()]
+    unknown = [section for section in sections if section not in SECTIONS]
+    if unknown:
+        print(f"Error: Secciones desconocidas: {', '.join(unknown)}")
+        return 1
+
+    repeats = 5 if args.quick else args.repeats
+    resolutions = RESOLUTIONS[:2] if args.quick else RESOLUTIONS
+
+    formats = available_formats()
+    print("Generando imágenes sintéticas...")
+    inputs = {(fmt, width, height): encode_image(synthetic_image(width, height), fmt)
+              for fmt in formats for width, height in resolutions}
+
+    # Tamaño de entrada registrado con el modelo; si se carga, manda el del propio modelo
+    model_config = read_model_config(os.path.join(os.path.dirname(args.model), 'model_config.json'))
+    img_size = (model_config['img_height'], model_config['img_width'])
+
+    results = {}
+    model = class_names = None
+    model_source = None
+    if 'inference' in sections or 'http' in sections:
+        model, class_names, model_source = load_benchmark_model(args.model, args.classes, args.random_model,
+                                                                model_config=model_config)
+        img_size = tuple(int(d) for d in model.input_shape[1:3])
+    print(f"Tamaño de entrada del modelo: {img_size[0]}x{img_size[1]}")
+
+    for section in sections:
+        print(f"\n=== {section} ===")
+        if section == 'decode':
+            results.update(bench_decode(inputs, repeats, img_size))
+        elif section == 'resize_normalize':
+            results.update(bench_resize_normalize(resolutions, repeats, img_size))
+        elif section == 'inference':
+            results.update(bench_inference(model, repeats))
+        elif section == 'prepare_dataset':
+            results.update(bench_prepare_dataset(repeats, img_size))
+        elif section == 'http':
+            # Una resolución por formato: el resto del camino no depende de ella
+            http_inputs = {key: data for key, data in inputs.items() if key[1:] == resolutions[0]}
+            trained = model_source == 'trained'
+            results.update(bench_http(model, class_names, http_inputs, repeats,
+                                      model_path=args.model if trained else None,
+                                      classes_path=args.classes if trained else None))
+
+    import tensorflow as tf
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'tensorflow': tf.__version__,
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+            'cpu_count': os.cpu_count(),
+            'model': model_source,
+            'input_size': list(img_size),
+            'repeats': repeats,
+            'formats': formats,
+        },
+        'benchmarks': results,
+    }
+
+    exit_code = 0
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            previous = json.load(f).get('benchmarks', {})
+        comparison = compare_results(results, previous, args.threshold)
+        report['comparison'] = comparison
+        regressions = [key for key, entry in comparison.items() if entry['regression']]
+        print(f"\n=== Comparación con {args.compare} ===")
+        for key, entry in sorted(comparison.items()):
+            marker = '⚠️ ' if entry['regression'] else '  '
+            print(f"{marker}{key}: {entry['previous_p50']:.2f} -> {entry['p50']:.2f} ms ({entry['change']:+.1%})")
+        if regressions:
+            print(f"\n⚠️ {len(regressions)} regresión(es) por encima del {args.threshold:.0%}")
+            exit_code = 2
+        else:
+            print("\n✅ Sin regresiones")
+
+    output_path = args.output or os.path.join(BENCHMARK_DIR, f"benchmark_{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    with open(output_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResultados guardados en {output_path}")
+
+    return exit_code
+
+if __name__ == "__main__":
+    sys.exit(main())
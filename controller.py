@@ -11,57 +11,193 @@ import json
 import io
 import uuid
 import sys  # Necesario para el manejo de pillow_heif y pyheif
-from flask import Flask, request, jsonify, render_template, redirect, url_for, flash, send_from_directory
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import time
+from flask import Flask, request, jsonify, render_template, redirect, url_for, flash, send_from_directory, g, Response
 from werkzeug.utils import secure_filename
 from PIL import Image
 import numpy as np
 from utils.utils import predict_image
+from utils.batching import MicroBatcher
+from utils.models_utils import TFLiteModel, read_model_config
+from utils.prediction_cache import PredictionCache
+from utils.model_manager import ModelManager
+from utils.image_utils import FAST_DECODE, open_image, decode_heic_bytes, is_heic_data
+from utils import metrics
 import tensorflow as tf
 
 # Configuración
 MODEL_PATH = 'models/best_model.h5'
+TFLITE_MODEL_PATH = 'models/best_model.tflite'
+# Backend de inferencia: 'keras' (modelo completo) o 'tflite' (modelo cuantizado)
+MODEL_BACKEND = os.environ.get('MODEL_BACKEND', 'keras')
+TFLITE_NUM_THREADS = int(os.environ.get('TFLITE_NUM_THREADS', os.cpu_count() or 1))
+# Segundos entre comprobaciones de cambios del modelo (0 desactiva la recarga en caliente)
+MODEL_RELOAD_INTERVAL = float(os.environ.get('MODEL_RELOAD_INTERVAL', 5))
 CLASS_NAMES_PATH = 'models/class_names.txt'
-IMG_HEIGHT = 224
-IMG_WIDTH = 224
+# Tamaño de entrada registrado con el modelo (models/model_config.json). Sólo
+# se usa antes de cargar el modelo: después manda el de cada ModelVersion
+MODEL_CONFIG = read_model_config()
+IMG_HEIGHT = MODEL_CONFIG['img_height']
+IMG_WIDTH = MODEL_CONFIG['img_width']
 HOST = '0.0.0.0'  # Escucha en todas las interfaces
 PORT = int(os.environ.get('PORT', 5000))
 UPLOAD_FOLDER = 'temp_uploads'
 # Actualizamos la lista de extensiones permitidas para incluir HEIC/HEIF
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'heic', 'heif'}
+# Micro-batching: tamaño máximo de lote y espera máxima para completarlo
+BATCH_MAX_SIZE = int(os.environ.get('BATCH_MAX_SIZE', 16))
+BATCH_MAX_WAIT_MS = float(os.environ.get('BATCH_MAX_WAIT_MS', 5))
+# Endpoint por lotes: máximo de imágenes por petición e hilos de decodificación.
+# El tamaño total de la petición lo limita además MAX_CONTENT_LENGTH: 50 fotos
+# de móvil (3-4 MB cada una) ocupan unos 200 MB, y un 33% más en base64
+BATCH_MAX_IMAGES = int(os.environ.get('BATCH_MAX_IMAGES', 64))
+MAX_CONTENT_LENGTH = int(os.environ.get('MAX_CONTENT_LENGTH', 256 * 1024 * 1024))
+DECODE_WORKERS = int(os.environ.get('DECODE_WORKERS', min(8, os.cpu_count() or 1)))
+# Caché de predicciones: número máximo de resultados y segundos de validez
+PREDICTION_CACHE_SIZE = int(os.environ.get('PREDICTION_CACHE_SIZE', 1024))
+PREDICTION_CACHE_TTL = float(os.environ.get('PREDICTION_CACHE_TTL', 3600))
 
 # Creamos la aplicación Flask
 app = Flask(__name__)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # Máximo 16MB
+app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH  # Máximo 256MB por defecto (lotes de fotos)
 app.secret_key = os.environ.get('SECRET_KEY', 'dev_key_12345')
 
 # Aseguramos que existan los directorios necesarios
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs('static/uploads', exist_ok=True)
 
-# Cargamos el modelo una sola vez al inicio
+# El gestor carga el modelo una vez y lo recarga en caliente cuando cambia
 print("Cargando modelo...")
-model = None
+model_manager = None
+model_load_lock = threading.Lock()
+batcher = None
+# Contenido del modelo TFLite precargado en el proceso maestro (modo producción)
+tflite_model_content = None
+
+# Pool de hilos para decodificar imágenes en paralelo
+decode_executor = ThreadPoolExecutor(max_workers=DECODE_WORKERS, thread_name_prefix='decode')
+
+# Caché de predicciones por contenido de la imagen y versión del modelo
+prediction_cache = PredictionCache(max_entries=PREDICTION_CACHE_SIZE, ttl_seconds=PREDICTION_CACHE_TTL)
 
 def allowed_file(filename):
     """Verifica si es un tipo de archivo permitido"""
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def get_model_path():
+    """Devuelve la ruta del modelo según el backend configurado"""
+    return TFLITE_MODEL_PATH if MODEL_BACKEND == 'tflite' else MODEL_PATH
+
+def load_backend_model(model_path):
+    """
+    Carga el modelo con el backend configurado
+    
+    Args:
+        model_path: Ruta del archivo del modelo
+        
+    Returns:
+        Modelo de Keras o TFLiteModel
+    """
+    global tflite_model_content
+    if MODEL_BACKEND == 'tflite':
+        # El contenido precargado sólo corresponde a la primera versión
+        content, tflite_model_content = tflite_model_content, None
+        return TFLiteModel(model_path, num_threads=TFLITE_NUM_THREADS, model_content=content)
+    return tf.keras.models.load_model(model_path)
+
+def get_model_manager():
+    """Devuelve el gestor del modelo, creándolo si es necesario"""
+    global model_manager
+    if model_manager is None:
+        model_manager = ModelManager(
+            load_backend_model,
+            get_model_path(),
+            CLASS_NAMES_PATH,
+            poll_interval=MODEL_RELOAD_INTERVAL
+        )
+    return model_manager
+
+def get_current_model():
+    """
+    Devuelve la versión del modelo en servicio
+    
+    Las peticiones deben tomarla una sola vez y usarla hasta el final, de modo
+    que una recarga en caliente no mezcle modelo y nombres de clases.
+    
+    Returns:
+        ModelVersion (model, class_names, version) o None si no hay modelo
+    """
+    if model_manager is None:
+        return None
+    return model_manager.current()
+
 def load_model_if_needed():
-    """Carga el modelo si no está ya cargado"""
-    global model
-    if model is None:
-        try:
-            model = tf.keras.models.load_model(MODEL_PATH)
-            print("Modelo cargado correctamente")
-        except Exception as e:
-            print(f"Error al cargar el modelo: {e}")
-            return False
+    """Carga el modelo si no está ya cargado y vigila sus cambios"""
+    manager = get_model_manager()
+    if manager.current() is None:
+        with model_load_lock:
+            if manager.current() is None:
+                manager.load()
+                # Aunque falle la carga, la vigilancia lo cargará cuando aparezca
+                manager.start_watching()
+    return manager.current() is not None
+
+def preload_model_content():
+    """
+    Lee el modelo TFLite en memoria antes de crear los workers
+    
+    Los workers creados con fork comparten estas páginas de solo lectura, por lo
+    que los pesos no se duplican por proceso. El modelo de Keras no se precarga:
+    TensorFlow no admite fork después de inicializarse.
+    
+    Returns:
+        True si se precargó el modelo
+    """
+    global tflite_model_content
+    if MODEL_BACKEND != 'tflite' or not os.path.exists(TFLITE_MODEL_PATH):
+        return False
+    with open(TFLITE_MODEL_PATH, 'rb') as f:
+        tflite_model_content = f.read()
+    print(f"Modelo TFLite precargado ({len(tflite_model_content) / 1024 / 1024:.2f} MB)")
     return True
 
+def reset_after_fork():
+    """Recrea los hilos y pools del proceso tras un fork (no sobreviven a fork)"""
+    global batcher, decode_executor, model_manager
+    batcher = None
+    model_manager = None
+    decode_executor = ThreadPoolExecutor(max_workers=DECODE_WORKERS, thread_name_prefix='decode')
+
+def get_batcher():
+    """Devuelve el planificador de micro-lotes, creándolo si es necesario"""
+    global batcher
+    if batcher is None:
+        batcher = MicroBatcher(max_batch_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS,
+                               on_batch=metrics.observe_batch)
+    return batcher
+
+def get_model_version(current=None):
+    """
+    Identifica la versión del modelo en servicio
+    
+    Args:
+        current: ModelVersion ya tomada por la petición (None = la actual)
+    
+    Returns:
+        Cadena con el backend y la versión de los artefactos
+    """
+    current = current or get_current_model()
+    return f"{MODEL_BACKEND}:{current.version if current else 'none'}"
+
 def load_class_names():
-    """Carga los nombres de las clases"""
+    """Carga los nombres de las clases (desde memoria si el modelo está cargado)"""
+    current = get_current_model()
+    if current is not None:
+        return list(current.class_names)
     try:
         with open(CLASS_NAMES_PATH, 'r') as f:
             return [line.strip() for line in f.readlines()]
@@ -85,66 +221,204 @@ def get_model_info():
     except Exception as e:
         print(f"Error al leer resumen: {e}")
     
+    # Un modelo reentrenado con otra resolución (ver sweep.py) cambia el tamaño
+    img_height, img_width = get_input_size()
+    
     return {
         'model_name': 'Clasificador de Gomitas',
         'classes': class_names,
         'num_classes': len(class_names),
-        'image_size': f"{IMG_HEIGHT}x{IMG_WIDTH}",
+        'image_size': f"{img_height}x{img_width}",
+        'backend': MODEL_BACKEND,
+        'fast_decode': FAST_DECODE,
         'summary': summary_data
     }
 
-def process_heic_image(filepath):
+def process_heic_image(filepath, save_jpg=False):
     """
-    Procesa una imagen HEIC y la convierte a JPG
+    Procesa una imagen HEIC y opcionalmente la guarda como JPG
     
     Args:
         filepath: Ruta al archivo HEIC
+        save_jpg: Si es True, guarda también una versión JPG junto al original
         
     Returns:
-        Ruta al archivo JPG convertido y la imagen PIL
+        Ruta al archivo JPG convertido (None si no se guardó) y la imagen PIL
+    """
+    with open(filepath, 'rb') as f:
+        img = decode_heic_bytes(f.read())
+    
+    jpg_filepath = None
+    if save_jpg:
+        jpg_filepath = os.path.splitext(filepath)[0] + ".jpg"
+        img.save(jpg_filepath, "JPEG")
+    
+    return jpg_filepath, img
+
+class InvalidImageError(ValueError):
+    """La imagen enviada no se pudo decodificar"""
+
+def decode_base64_image(image_data):
+    """
+    Decodifica una imagen enviada en base64
+    
+    Args:
+        image_data: Cadena base64, con o sin prefijo 'data:image/...;base64,'
+        
+    Returns:
+        Bytes de la imagen
+    """
+    # Eliminamos el prefijo 'data:image/jpeg;base64,' si existe
+    if ',' in image_data:
+        image_data = image_data.split(',', 1)[1]
+    with metrics.STAGE_SECONDS.time('base64_decode'):
+        return base64.b64decode(image_data)
+
+def get_input_size(current=None):
+    """
+    Tamaño de entrada de una versión del modelo
+    
+    Args:
+        current: Versión del modelo (None = la versión en servicio)
+        
+    Returns:
+        Tupla (alto, ancho); antes de cargar el modelo, la de model_config.json
+    """
+    if current is None and model_manager is not None:
+        current = model_manager.current()
+    if current is None:
+        return IMG_HEIGHT, IMG_WIDTH
+    return current.img_height, current.img_width
+
+def load_image_from_bytes(image_bytes, for_model=True, current=None):
+    """
+    Abre una imagen a partir de sus bytes, convirtiendo HEIC si es necesario
+    
+    Args:
+        image_bytes: Contenido del archivo de imagen
+        for_model: Si es True, decodifica JPEG a resolución reducida cerca del
+            tamaño de entrada del modelo (ver FAST_DECODE)
+        current: Versión del modelo cuyo tamaño de entrada se usa
+        
+    Returns:
+        Imagen PIL en modo RGB
+    """
+    img_height, img_width = get_input_size(current)
+    
+    # HEIC se detecta por su firma y se decodifica sin pasar por disco
+    target_size = (img_width, img_height) if for_model else None
+    stage = 'heic_decode' if is_heic_data(image_bytes[:12]) else 'image_decode'
+    with metrics.STAGE_SECONDS.time(stage):
+        return open_image(image_bytes, target_size=target_size, fast_decode=FAST_DECODE)
+
+def prepare_image_array(img, current=None):
+    """
+    Redimensiona y normaliza una imagen para el modelo
+    
+    Args:
+        img: Imagen PIL en modo RGB
+        current: Versión del modelo cuyo tamaño de entrada se usa
+        
+    Returns:
+        Array de forma (alto, ancho, 3) con valores en [0, 1]
+    """
+    img_height, img_width = get_input_size(current)
+    with metrics.STAGE_SECONDS.time('resize_normalize'):
+        img = img.resize((img_width, img_height))
+        return np.array(img) / 255.0
+
+def build_results(prediction, class_names):
+    """
+    Ordena las probabilidades de una predicción por confianza
+    
+    Args:
+        prediction: Vector de probabilidades de una imagen
+        class_names: Nombres de las clases
+        
+    Returns:
+        Lista de diccionarios {'class', 'confidence'} en orden descendente
+    """
+    with metrics.STAGE_SECONDS.time('sort_results'):
+        sorted_indices = np.argsort(prediction)[::-1]
+        return [
+            {'class': class_names[idx], 'confidence': float(prediction[idx])}
+            for idx in sorted_indices
+        ]
+
+def predict_image_bytes(image_bytes, current):
+    """
+    Decodifica una imagen y realiza la predicción
+    
+    Args:
+        image_bytes: Contenido del archivo de imagen
+        current: Versión del modelo (ModelVersion) tomada al inicio de la petición
+        
+    Returns:
+        Lista de resultados ordenados por confianza (ver build_results)
     """
     try:
-        # Intentamos importar pillow_heif primero
-        try:
-            import pillow_heif
-            pillow_heif.register_heif_opener()
-            
-            # Al registrar el opener, PIL puede abrir archivos HEIC directamente
-            img = Image.open(filepath).convert('RGB')
-            
-            # También guardamos una versión JPG por compatibilidad
-            jpg_filepath = os.path.splitext(filepath)[0] + ".jpg"
-            img.save(jpg_filepath, "JPEG")
-            return jpg_filepath, img
-            
-        except ImportError:
-            # Si no está disponible pillow_heif, intentamos con pyheif
-            try:
-                import pyheif
-                
-                # Abrimos el archivo HEIC
-                heif_file = pyheif.read(filepath)
-                
-                # Convertimos a PIL Image
-                img = Image.frombytes(
-                    heif_file.mode, 
-                    heif_file.size, 
-                    heif_file.data,
-                    "raw", 
-                    heif_file.mode, 
-                    heif_file.stride,
-                )
-                
-                # Guardamos como JPG
-                jpg_filepath = os.path.splitext(filepath)[0] + ".jpg"
-                img.save(jpg_filepath, "JPEG")
-                return jpg_filepath, img
-                
-            except ImportError:
-                # Si ninguna librería está disponible
-                raise ImportError('No se puede procesar HEIC. Instale pillow_heif o pyheif')
+        img = load_image_from_bytes(image_bytes, current=current)
     except Exception as e:
-        raise Exception(f'Error al convertir imagen HEIC: {str(e)}')
+        raise InvalidImageError(str(e))
+    
+    # Procesamos la imagen para el modelo
+    img_array = np.expand_dims(prepare_image_array(img, current), axis=0)
+    
+    # Realizamos la predicción (agrupada con otras peticiones concurrentes)
+    # (incluye la espera en la cola del planificador)
+    with metrics.STAGE_SECONDS.time('inference'):
+        predictions = get_batcher().predict(current.model, img_array)
+    
+    # Preparamos los resultados con los nombres de clases en memoria de esta versión
+    return build_results(predictions[0], current.class_names)
+
+def decode_batch_item(image_bytes, current):
+    """
+    Decodifica y prepara una imagen de un lote (se ejecuta en el pool de hilos)
+    
+    Args:
+        image_bytes: Contenido del archivo de imagen
+        current: Versión del modelo tomada al inicio de la petición
+        
+    Returns:
+        Array preparado para el modelo
+    """
+    if not image_bytes:
+        raise ValueError('Imagen vacía')
+    return prepare_image_array(load_image_from_bytes(image_bytes, current=current), current)
+
+def collect_metrics():
+    """Actualiza las métricas de modelo y caché antes de exportarlas"""
+    current = get_current_model()
+    metrics.MODEL_INFO.clear()
+    if current is not None:
+        metrics.MODEL_INFO.set(MODEL_BACKEND, current.version, value=1)
+    
+    stats = prediction_cache.stats()
+    for event in ('hits', 'misses', 'coalesced', 'evictions', 'expirations'):
+        metrics.CACHE_EVENTS.set_total(event, value=stats[event])
+    metrics.CACHE_ENTRIES.set(value=stats['entries'])
+
+metrics.registry.add_collector(collect_metrics)
+
+@app.before_request
+def start_request_timer():
+    """Guarda el instante de inicio de la petición"""
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    """Registra la duración y el código de estado de cada petición"""
+    start = g.pop('request_start', None)
+    if start is not None:
+        # Usamos la regla de la ruta para no crear una serie por cada URL
+        endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        status = str(response.status_code)
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint)
+        metrics.REQUESTS_TOTAL.inc(endpoint, status)
+        if response.status_code >= 400:
+            metrics.ERRORS_TOTAL.inc(endpoint, status)
+    return response
 
 # ======================================================================
 # ENDPOINTS API (para aplicación móvil)
@@ -171,48 +445,13 @@ def predict():
         
         # Caso 1: application/json - imagen en base64
         if 'application/json' in content_type:
-            if 'image' not in request.json:
+            with metrics.STAGE_SECONDS.time('body_read'):
+                payload = request.json
+            if 'image' not in payload:
                 return jsonify({'status': 'error', 'message': 'No se envió ninguna imagen'}), 400
             
             # Decodificamos la imagen en base64
-            image_data = request.json['image']
-            # Eliminamos el prefijo 'data:image/jpeg;base64,' si existe
-            if ',' in image_data:
-                image_data = image_data.split(',', 1)[1]
-            
-            # Convertimos de base64 a bytes
-            image_bytes = base64.b64decode(image_data)
-            
-            # Guardamos temporalmente para detectar si es HEIC
-            temp_filepath = os.path.join(UPLOAD_FOLDER, f"temp_{uuid.uuid4()}.bin")
-            with open(temp_filepath, 'wb') as f:
-                f.write(image_bytes)
-            
-            # Verificamos si es HEIC por los primeros bytes (signature)
-            is_heic = False
-            with open(temp_filepath, 'rb') as f:
-                header = f.read(12)
-                # Verificamos si tiene los bytes característicos de HEIC/HEIF
-                if b'ftyp' in header and (b'heic' in header or b'heif' in header or b'mif1' in header):
-                    is_heic = True
-            
-            # Procesamos según el tipo de imagen
-            if is_heic:
-                try:
-                    jpg_filepath, img = process_heic_image(temp_filepath)
-                    # Limpiamos el archivo temporal original
-                    if os.path.exists(temp_filepath):
-                        os.remove(temp_filepath)
-                except Exception as e:
-                    # Limpiamos el archivo temporal
-                    if os.path.exists(temp_filepath):
-                        os.remove(temp_filepath)
-                    return jsonify({'status': 'error', 'message': str(e)}), 400
-            else:
-                # Limpiamos el archivo temporal
-                os.remove(temp_filepath)
-                # Procesamos como imagen normal
-                img = Image.open(io.BytesIO(image_bytes)).convert('RGB')
+            image_bytes = decode_base64_image(payload['image'])
             
         # Caso 2: multipart/form-data - archivo de imagen
         elif 'multipart/form-data' in content_type or request.files:
@@ -223,28 +462,9 @@ def predict():
             if file.filename == '':
                 return jsonify({'status': 'error', 'message': 'No se seleccionó ningún archivo'}), 400
             
-            # Verificamos si el archivo es HEIC/HEIF
-            is_heic = file.filename.lower().endswith(('.heic', '.heif'))
-            
-            if is_heic:
-                # Guardamos temporalmente el archivo HEIC
-                temp_filepath = os.path.join(UPLOAD_FOLDER, secure_filename(file.filename))
-                file.save(temp_filepath)
-                
-                try:
-                    # Procesamos el archivo HEIC
-                    jpg_filepath, img = process_heic_image(temp_filepath)
-                    # Limpiamos el archivo HEIC original
-                    if os.path.exists(temp_filepath):
-                        os.remove(temp_filepath)
-                except Exception as e:
-                    # Limpiamos el archivo temporal
-                    if os.path.exists(temp_filepath):
-                        os.remove(temp_filepath)
-                    return jsonify({'status': 'error', 'message': str(e)}), 400
-            else:
-                # Procesamos normalmente
-                img = Image.open(file.stream).convert('RGB')
+            # Leemos el archivo completo (HEIC/HEIF se detecta por su firma)
+            with metrics.STAGE_SECONDS.time('body_read'):
+                image_bytes = file.read()
         
         else:
             return jsonify({
@@ -252,28 +472,17 @@ def predict():
                 'message': 'Tipo de contenido no soportado. Use application/json o multipart/form-data'
             }), 415
         
-        # Procesamos la imagen para el modelo
-        img = img.resize((IMG_WIDTH, IMG_HEIGHT))
-        img_array = np.expand_dims(np.array(img) / 255.0, axis=0)
-        
-        # Cargamos nombres de clases
-        class_names = load_class_names()
-        if not class_names:
-            return jsonify({'status': 'error', 'message': 'Error al cargar nombres de clases'}), 500
+        # Tomamos la versión del modelo una sola vez para toda la petición
+        current = get_current_model()
         
-        # Realizamos la predicción
-        predictions = model.predict(img_array)
-        
-        # Obtenemos los índices ordenados por confianza (descendente)
-        sorted_indices = np.argsort(predictions[0])[::-1]
-        
-        # Preparamos los resultados
-        results = []
-        for idx in sorted_indices:
-            results.append({
-                'class': class_names[idx],
-                'confidence': float(predictions[0][idx])
-            })
+        # Buscamos el resultado en caché (o esperamos a una petición idéntica en curso)
+        cache_key = prediction_cache.make_key(image_bytes, get_model_version(current))
+        try:
+            results = prediction_cache.get_or_compute(
+                cache_key, lambda: predict_image_bytes(image_bytes, current)
+            )
+        except InvalidImageError as e:
+            return jsonify({'status': 'error', 'message': str(e)}), 400
         
         # Guardamos la imagen para diagnósticos si se solicita
         save_image = False
@@ -283,15 +492,18 @@ def predict():
             save_image = True
             
         if save_image:
+            img_height, img_width = get_input_size(current)
+            img = load_image_from_bytes(image_bytes, current=current).resize((img_width, img_height))
             temp_path = os.path.join(UPLOAD_FOLDER, f"predict_{len(os.listdir(UPLOAD_FOLDER))}.jpg")
             img.save(temp_path)
         
-        return jsonify({
-            'status': 'ok', 
-            'prediction': results[0]['class'],
-            'confidence': results[0]['confidence'],
-            'all_predictions': results
-        })
+        with metrics.STAGE_SECONDS.time('serialize'):
+            return jsonify({
+                'status': 'ok', 
+                'prediction': results[0]['class'],
+                'confidence': results[0]['confidence'],
+                'all_predictions': results
+            })
         
     except Exception as e:
         print(f"Error en predicción: {e}")
@@ -299,6 +511,131 @@ def predict():
         traceback.print_exc()
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
+def batch_too_large(count):
+    """Respuesta 413 para un lote con más imágenes de las permitidas"""
+    return jsonify({
+        'status': 'error',
+        'message': f'Demasiadas imágenes ({count}). Máximo permitido: {BATCH_MAX_IMAGES}'
+    }), 413
+
+@app.route('/api/predict_batch', methods=['POST'])
+def predict_batch():
+    """Realiza predicciones para varias imágenes en una sola petición (API)"""
+    if not load_model_if_needed():
+        return jsonify({'status': 'error', 'message': 'Error al cargar el modelo'}), 500
+    
+    try:
+        content_type = request.headers.get('Content-Type', '')
+        
+        # Reunimos los elementos del lote como (nombre, bytes o error)
+        items = []
+        
+        # Caso 1: application/json - lista de imágenes en base64
+        if 'application/json' in content_type:
+            with metrics.STAGE_SECONDS.time('body_read'):
+                payload = request.json
+            images = payload.get('images') if isinstance(payload, dict) else None
+            if not isinstance(images, list) or not images:
+                return jsonify({'status': 'error', 'message': 'No se envió ninguna imagen'}), 400
+            if len(images) > BATCH_MAX_IMAGES:
+                return batch_too_large(len(images))
+            
+            for image_data in images:
+                try:
+                    items.append((None, decode_base64_image(image_data), None))
+                except Exception as e:
+                    items.append((None, None, f'Base64 inválido: {e}'))
+        
+        # Caso 2: multipart/form-data - varios archivos
+        elif 'multipart/form-data' in content_type or request.files:
+            files = request.files.getlist('files') + request.files.getlist('file')
+            if not files:
+                return jsonify({'status': 'error', 'message': 'No se envió ningún archivo'}), 400
+            if len(files) > BATCH_MAX_IMAGES:
+                return batch_too_large(len(files))
+            
+            for file in files:
+                if file.filename == '' or not allowed_file(file.filename):
+                    items.append((file.filename, None, 'Tipo de archivo no permitido'))
+                else:
+                    items.append((file.filename, file.read(), None))
+        
+        else:
+            return jsonify({
+                'status': 'error', 
+                'message': 'Tipo de contenido no soportado. Use application/json o multipart/form-data'
+            }), 415
+        
+        # Tomamos la versión del modelo (y sus clases en memoria) para todo el lote
+        current = get_current_model()
+        class_names = current.class_names
+        
+        # Consultamos la caché y decodificamos en paralelo sólo los fallos
+        model_version = get_model_version(current)
+        cache_keys = {}
+        results_by_index = {}
+        futures = {}
+        errors = {}
+        for i, (_, image_bytes, error) in enumerate(items):
+            if error is not None:
+                errors[i] = error
+                continue
+            cache_keys[i] = prediction_cache.make_key(image_bytes, model_version)
+            cached = prediction_cache.get(cache_keys[i])
+            if cached is not None:
+                results_by_index[i] = cached
+            else:
+                futures[i] = decode_executor.submit(decode_batch_item, image_bytes, current)
+        
+        # Recogemos las imágenes decodificadas conservando el orden de entrada
+        arrays = []
+        for i, future in futures.items():
+            try:
+                arrays.append((i, future.result()))
+            except Exception as e:
+                errors[i] = f'Error al procesar la imagen: {e}'
+        
+        # Una sola inferencia para todas las imágenes válidas
+        if arrays:
+            batch = np.stack([array for _, array in arrays])
+            with metrics.STAGE_SECONDS.time('inference'):
+                batch_predictions = get_batcher().predict(current.model, batch)
+            for (i, _), prediction in zip(arrays, batch_predictions):
+                results_by_index[i] = build_results(prediction, class_names)
+                prediction_cache.put(cache_keys[i], results_by_index[i])
+        
+        # Construimos la respuesta en el orden de entrada
+        results = []
+        for i, (filename, _, _) in enumerate(items):
+            entry = {'index': i}
+            if filename is not None:
+                entry['filename'] = filename
+            if i in results_by_index:
+                all_predictions = results_by_index[i]
+                entry.update({
+                    'status': 'ok',
+                    'prediction': all_predictions[0]['class'],
+                    'confidence': all_predictions[0]['confidence'],
+                    'all_predictions': all_predictions
+                })
+            else:
+                entry.update({'status': 'error', 'message': errors[i]})
+            results.append(entry)
+        
+        with metrics.STAGE_SECONDS.time('serialize'):
+            return jsonify({
+                'status': 'ok',
+                'count': len(results),
+                'errors': len(errors),
+                'results': results
+            })
+        
+    except Exception as e:
+        print(f"Error en predicción por lotes: {e}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
 @app.route('/api/classes', methods=['GET'])
 def get_classes():
     """Devuelve la lista de clases disponibles (API)"""
@@ -313,22 +650,37 @@ def health_check():
     """Comprueba si el servidor está funcionando (API)"""
     return jsonify({'status': 'ok', 'message': 'El servidor está en funcionamiento'})
 
+@app.route('/api/cache_stats', methods=['GET'])
+def cache_stats():
+    """Devuelve los contadores de la caché de predicciones (API)"""
+    return jsonify({'status': 'ok', 'cache': prediction_cache.stats()})
+
 @app.route('/api/model_status', methods=['GET'])
 def model_status():
     """Comprueba el estado del modelo (API)"""
-    model_exists = os.path.exists(MODEL_PATH)
+    model_exists = os.path.exists(get_model_path())
     class_names_exist = os.path.exists(CLASS_NAMES_PATH)
     
+    current = get_current_model()
     status = {
         'model_file_exists': model_exists,
         'class_names_file_exists': class_names_exist,
-        'model_loaded': model is not None
+        'model_loaded': current is not None
     }
     
-    if all(status.values()):
-        return jsonify({'status': 'ok', 'details': status})
-    else:
-        return jsonify({'status': 'warning', 'details': status})
+    response = {
+        'status': 'ok' if all(status.values()) else 'warning',
+        'backend': MODEL_BACKEND,
+        'model_version': current.version if current else None,
+        'reloads': model_manager.reloads if model_manager else 0,
+        'details': status
+    }
+    return jsonify(response)
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Exporta las métricas del proceso en formato de texto de Prometheus"""
+    return Response(metrics.registry.render(), content_type=metrics.CONTENT_TYPE)
 
 # ======================================================================
 # RUTAS WEB (para interfaz de navegador)
@@ -371,26 +723,27 @@ def web_predict():
                 
                 if is_heic:
                     try:
-                        jpg_filepath, img = process_heic_image(filepath)
-                        filepath = jpg_filepath  # Usamos el JPG para el resto del proceso
+                        with metrics.STAGE_SECONDS.time('heic_decode'):
+                            _, img = process_heic_image(filepath)
+                        # La imagen se mostrará como JPG en la página de resultados
+                        filepath = os.path.splitext(filepath)[0] + ".jpg"
                     except Exception as e:
                         flash(str(e))
                         return redirect(request.url)
                 else:
                     # Abrimos y procesamos la imagen normal
-                    img = Image.open(filepath).convert('RGB')
+                    with metrics.STAGE_SECONDS.time('image_decode'):
+                        img = Image.open(filepath).convert('RGB')
                 
-                img_resized = img.resize((IMG_WIDTH, IMG_HEIGHT))
-                img_array = np.expand_dims(np.array(img_resized) / 255.0, axis=0)
+                # Tomamos la versión del modelo con sus nombres de clases en memoria
+                current = get_current_model()
+                class_names = current.class_names
                 
-                # Cargamos nombres de clases
-                class_names = load_class_names()
-                if not class_names:
-                    flash('Error al cargar nombres de clases')
-                    return redirect(request.url)
+                img_array = np.expand_dims(prepare_image_array(img, current), axis=0)
                 
-                # Realizamos la predicción
-                predictions = model.predict(img_array)
+                # Realizamos la predicción (agrupada con otras peticiones concurrentes)
+                with metrics.STAGE_SECONDS.time('inference'):
+                    predictions = get_batcher().predict(current.model, img_array)
                 
                 # Obtenemos los índices ordenados por confianza (descendente)
                 sorted_indices = np.argsort(predictions[0])[::-1]
@@ -463,9 +816,11 @@ def uploaded_file(filename):
     return send_from_directory('static/uploads', filename)
 
 
-def run_server(custom_host=None, custom_port=None):
-    """Inicia el servidor Flask"""
-    global HOST, PORT
+def run_server(custom_host=None, custom_port=None, batch_max_size=None, batch_max_wait_ms=None,
+               backend=None, tflite_threads=None, full_decode=False, async_mode=False,
+               production=False, workers=None, intra_op_threads=None, inter_op_threads=None):
+    """Inicia el servidor Flask (o el servidor ASGI si async_mode es True)"""
+    global HOST, PORT, BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS, MODEL_BACKEND, TFLITE_NUM_THREADS, FAST_DECODE
     
     # Actualizamos host y puerto si se proporcionan
     if custom_host:
@@ -473,11 +828,47 @@ def run_server(custom_host=None, custom_port=None):
     if custom_port:
         PORT = custom_port
     
+    # Configuración del micro-batching
+    if batch_max_size:
+        BATCH_MAX_SIZE = batch_max_size
+    if batch_max_wait_ms is not None:
+        BATCH_MAX_WAIT_MS = batch_max_wait_ms
+    
+    # Backend de inferencia
+    if backend:
+        MODEL_BACKEND = backend
+    if tflite_threads:
+        TFLITE_NUM_THREADS = tflite_threads
+    
+    # Decodificación completa de JPEG (para comparar precisión con la reducida)
+    if full_decode:
+        FAST_DECODE = False
+    
+    # Modo producción: varios workers con gunicorn
+    if production:
+        from production_server import run_production_server
+        run_production_server(
+            HOST, PORT,
+            workers=workers,
+            intra_op_threads=intra_op_threads,
+            inter_op_threads=inter_op_threads,
+            async_mode=async_mode,
+            tflite_threads=tflite_threads
+        )
+        return
+    
+    # Modo asíncrono: las mismas rutas /api/* servidas por ASGI
+    if async_mode:
+        from asgi_controller import run_async_server
+        run_async_server(HOST, PORT)
+        return
+    
     # Cargamos el modelo al inicio
     load_model_if_needed()
     
     print(f"Iniciando servidor en http://{HOST}:{PORT}")
-    app.run(host=HOST, port=PORT, debug=False)
+    print(f"Micro-batching: lote máximo {BATCH_MAX_SIZE}, espera máxima {BATCH_MAX_WAIT_MS} ms")
+    app.run(host=HOST, port=PORT, debug=False, threaded=True)
 
 if __name__ == "__main__":
     run_server()
\ No newline at end of file
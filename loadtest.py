@@ -0,0 +1,536 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Generador de carga para la API del clasificador
+
+Sólo usa la biblioteca estándar (y Pillow para las imágenes sintéticas).
+Envía peticiones a /api/predict (multipart y JSON en base64), /api/info y
+/api/classes y mide el rendimiento, la latencia (p50/p95/p99) y la tasa de
+errores.
+
+Modos:
+- Lazo cerrado (--concurrency N): N clientes envían peticiones seguidas.
+- Lazo abierto (--rate R): las peticiones llegan a R por segundo aunque el
+  servidor se retrase; la latencia se mide desde la llegada programada, así
+  que la cola también cuenta.
+- Barrido (--sweep 1,2,4,8 con lazo cerrado, o con --rate para tasas): busca
+  el punto de saturación (donde el rendimiento deja de crecer o se incumple
+  el objetivo de latencia/errores).
+
+Las peticiones se pueden reproducir desde un corpus JSONL (--corpus), una
+por línea:
+    {"path": "/api/predict", "file": "data/raw/x/img.jpg"}       (multipart)
+    {"path": "/api/predict", "image": "img.jpg"}                  (JSON en base64)
+    {"path": "/api/predict", "json": {"image": "<base64>"}}
+    {"path": "/api/info"}
+
+Uso:
+    python loadtest.py --url http://localhost:5000 --concurrency 8 --duration 30
+    python loadtest.py --rate 20 --duration 60 --corpus requests.jsonl
+    python loadtest.py --sweep 1,2,4,8,16 --duration 15 --output output/loadtest.json
+"""
+
+import argparse
+import base64
+import glob
+import http.client
+import io
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+# Mezcla por defecto de peticiones (peso relativo de cada tipo)
+DEFAULT_MIX = 'predict_multipart=6,predict_json=3,info=1,classes=1'
+# Criterios de saturación por defecto
+DEFAULT_SLO_P99_MS = 1000.0
+DEFAULT_MAX_ERROR_RATE = 0.01
+
+def parse_args():
+    """
+    Analiza los argumentos de línea de comandos
+
+    Returns:
+        args: Argumentos analizados
+    """
+    parser = argparse.ArgumentParser(description='Prueba de carga de la API del clasificador')
+    parser.add_argument('--url', default='http://localhost:5000', help='URL base del servidor')
+    parser.add_argument('--duration', type=float, default=30.0, help='Segundos de cada etapa')
+    parser.add_argument('--warmup', type=float, default=3.0, help='Segundos de calentamiento no medidos')
+    parser.add_argument('--concurrency', type=int, default=4, help='Clientes simultáneos (lazo cerrado)')
+    parser.add_argument('--rate', type=float, default=None,
+                        help='Peticiones por segundo (lazo abierto); con --sweep, las tasas a barrer')
+    parser.add_argument('--arrivals', choices=['poisson', 'constant'], default='poisson',
+                        help='Distribución de llegadas en lazo abierto')
+    parser.add_argument('--max-inflight', type=int, default=256,
+                        help='Peticiones simultáneas como máximo en lazo abierto')
+    parser.add_argument('--sweep', default=None,
+                        help='Lista de concurrencias (o de tasas si se da --rate) separadas por comas')
+    parser.add_argument('--mix', default=DEFAULT_MIX,
+                        help=f'Pesos de cada tipo de petición (default: {DEFAULT_MIX})')
+    parser.add_argument('--images', default=None,
+                        help='Directorio o patrón glob con las imágenes a enviar (default: sintéticas)')
+    parser.add_argument('--corpus', default=None, help='Archivo JSONL con peticiones grabadas a reproducir')
+    parser.add_argument('--timeout', type=float, default=30.0, help='Segundos de espera por petición')
+    parser.add_argument('--slo-p99-ms', type=float, default=DEFAULT_SLO_P99_MS,
+                        help='p99 máximo aceptable para el punto de saturación')
+    parser.add_argument('--max-error-rate', type=float, default=DEFAULT_MAX_ERROR_RATE,
+                        help='Tasa de errores máxima aceptable para el punto de saturación')
+    parser.add_argument('--seed', type=int, default=42, help='Semilla de la mezcla y de las llegadas')
+    parser.add_argument('--output', default=None, help='Archivo JSON donde guardar el informe')
+    return parser.parse_args()
+
+class Payload:
+    """
+    Petición preparada para enviarse repetidamente
+
+    Args:
+        kind: Tipo de petición (para el informe)
+        method: Método HTTP
+        path: Ruta de la API
+        body: Cuerpo en bytes (o None)
+        headers: Cabeceras adicionales
+    """
+
+    __slots__ = ('kind', 'method', 'path', 'body', 'headers')
+
+    def __init__(self, kind, method, path, body=None, headers=None):
+        self.kind = kind
+        self.method = method
+        self.path = path
+        self.body = body
+        self.headers = headers or {}
+
+def multipart_payload(image_bytes, filename):
+    """Petición multipart/form-data a /api/predict"""
+    boundary = uuid.uuid4().hex
+    body = (f'--{boundary}\r\n'
+            f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+            f'Content-Type: application/octet-stream\r\n\r\n').encode('utf-8')
+    body += image_bytes + f'\r\n--{boundary}--\r\n'.encode('utf-8')
+    return Payload('predict_multipart', 'POST', '/api/predict', body,
+                   {'Content-Type': f'multipart/form-data; boundary={boundary}'})
+
+def json_payload(data, path='/api/predict', kind='predict_json'):
+    """Petición con cuerpo JSON"""
+    return Payload(kind, 'POST', path, json.dumps(data).encode('utf-8'),
+                   {'Content-Type': 'application/json'})
+
+def load_images(pattern):
+    """
+    Lee las imágenes que se enviarán
+
+    Args:
+        pattern: Directorio, patrón glob o None para generar imágenes sintéticas
+
+    Returns:
+        Lista de (nombre, bytes)
+    """
+    if pattern is None:
+        from PIL import Image
+        rng = random.Random(0)
+        images = []
+        for i in range(16):
+            img = Image.new('RGB', (1280, 960), tuple(rng.randrange(256) for _ in range(3)))
+            # Ruido por bloques para que el JPEG no sea trivial de decodificar
+            pixels = bytes(rng.randrange(256) for _ in range(160 * 120 * 3))
+            img.paste(Image.frombytes('RGB', (160, 120), pixels).resize((1280, 960)))
+            buffer = io.BytesIO()
+            img.save(buffer, 'JPEG', quality=90)
+            images.append((f'synthetic_{i}.jpg', buffer.getvalue()))
+        return images
+
+    if os.path.isdir(pattern):
+        paths = [os.path.join(root, name) for root, _, files in os.walk(pattern) for name in files
+                 if name.lower().endswith(('.jpg', '.jpeg', '.png', '.heic', '.heif'))]
+    else:
+        paths = glob.glob(pattern, recursive=True)
+    images = []
+    for path in sorted(paths):
+        with open(path, 'rb') as f:
+            images.append((os.path.basename(path), f.read()))
+    if not images:
+        raise ValueError(f"No se encontraron imágenes en {pattern}")
+    return images
+
+def build_mix(mix, images):
+    """
+    Construye las peticiones de cada tipo según la mezcla
+
+    Args:
+        mix: Texto 'tipo=peso,...' (predict_multipart, predict_json, info, classes)
+        images: Lista de (nombre, bytes)
+
+    Returns:
+        Lista de (lista de Payload, peso)
+    """
+    builders = {
+        'predict_multipart': lambda: [multipart_payload(data, name) for name, data in images],
+        'predict_json': lambda: [json_payload({'image': base64.b64encode(data).decode('ascii')})
+                                 for _, data in images],
+        'info': lambda: [Payload('info', 'GET', '/api/info')],
+        'classes': lambda: [Payload('classes', 'GET', '/api/classes')],
+    }
+    groups = []
+    for item in mix.split(','):
+        kind, _, weight = item.strip().partition('=')
+        if kind not in builders:
+            raise ValueError(f"Tipo de petición desconocido: {kind}. Opciones: {', '.join(builders)}")
+        if float(weight or 1) > 0:
+            groups.append((builders[kind](), float(weight or 1)))
+    return groups
+
+def load_corpus(corpus_path):
+    """
+    Lee un corpus JSONL de peticiones grabadas
+
+    Returns:
+        Lista de Payload en el orden del archivo
+    """
+    payloads = []
+    base_dir = os.path.dirname(os.path.abspath(corpus_path))
+    with open(corpus_path, 'r') as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            path = entry.get('path', '/api/predict')
+            image_path = entry.get('file') or entry.get('image')
+            if image_path and not os.path.isabs(image_path):
+                image_path = os.path.join(base_dir, image_path)
+
+            if 'file' in entry:
+                with open(image_path, 'rb') as image:
+                    payload = multipart_payload(image.read(), os.path.basename(image_path))
+            elif 'image' in entry:
+                with open(image_path, 'rb') as image:
+                    payload = json_payload({'image': base64.b64encode(image.read()).decode('ascii')}, path)
+            elif 'json' in entry:
+                payload = json_payload(entry['json'], path, kind=entry.get('kind', 'json'))
+            else:
+                payload = Payload(entry.get('kind', path.rsplit('/', 1)[-1]), entry.get('method', 'GET'), path)
+            payload.path = path
+            payloads.append(payload)
+    if not payloads:
+        raise ValueError(f"El corpus {corpus_path} no tiene peticiones")
+    print(f"Corpus: {len(payloads)} peticiones de {corpus_path}")
+    return payloads
+
+class PayloadSource:
+    """
+    Elige la siguiente petición: en orden cíclico (corpus) o al azar según los pesos
+
+    Es seguro entre hilos.
+    """
+
+    def __init__(self, corpus=None, groups=None, seed=42):
+        self.corpus = corpus
+        self.groups = groups
+        self._rng = random.Random(seed)
+        self._index = 0
+        self._lock = threading.Lock()
+
+    def next(self):
+        with self._lock:
+            if self.corpus:
+                payload = self.corpus[self._index % len(self.corpus)]
+                self._index += 1
+                return payload
+            payloads = self._rng.choices([group for group, _ in self.groups],
+                                         weights=[weight for _, weight in self.groups])[0]
+            return self._rng.choice(payloads)
+
+class Client:
+    """
+    Cliente HTTP con una conexión persistente por hilo
+
+    Args:
+        base_url: URL base del servidor
+        timeout: Segundos de espera por petición
+    """
+
+    def __init__(self, base_url, timeout=30.0):
+        parsed = urlparse(base_url)
+        self.scheme = parsed.scheme or 'http'
+        self.host = parsed.hostname or 'localhost'
+        self.port = parsed.port
+        self.prefix = parsed.path.rstrip('/')
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            cls = http.client.HTTPSConnection if self.scheme == 'https' else http.client.HTTPConnection
+            conn = cls(self.host, self.port, timeout=self.timeout)
+            self._local.conn = conn
+        return conn
+
+    def send(self, payload):
+        """
+        Envía una petición
+
+        Returns:
+            (código de estado o None, mensaje de error o None)
+        """
+        conn = self._connection()
+        try:
+            conn.request(payload.method, self.prefix + payload.path, body=payload.body, headers=payload.headers)
+            response = conn.getresponse()
+            response.read()
+            error = None if response.status < 400 else f'HTTP {response.status}'
+            return response.status, error
+        except (OSError, http.client.HTTPException) as e:
+            # La conexión queda inservible: se abre otra en la siguiente petición
+            conn.close()
+            self._local.conn = None
+            return None, type(e).__name__
+
+class Recorder:
+    """Acumula latencias y errores de una etapa (seguro entre hilos)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.records = []
+
+    def add(self, kind, latency, status, error):
+        with self._lock:
+            self.records.append((kind, latency, status, error))
+
+def percentile(sorted_values, p):
+    """Percentil por el método del rango más cercano"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(p / 100.0 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+def summarize_records(records, elapsed):
+    """
+    Resume las peticiones de una etapa
+
+    Args:
+        records: Lista de (tipo, segundos, estado, error); las peticiones
+            descartadas sin enviar tienen latencia None
+        elapsed: Duración de la etapa en segundos
+
+    Returns:
+        Diccionario con rendimiento, latencias en ms y errores (total y por tipo)
+    """
+    def stats(items):
+        # Las descartadas cuentan como errores pero no como latencias ni rendimiento
+        latencies = sorted(latency * 1000.0 for _, latency, _, _ in items if latency is not None)
+        errors = sum(1 for _, _, _, error in items if error)
+        return {
+            'requests': len(items),
+            'errors': errors,
+            'error_rate': errors / len(items) if items else 0.0,
+            'throughput_rps': len(latencies) / elapsed if elapsed else 0.0,
+            'latency_ms': {
+                'mean': sum(latencies) / len(latencies) if latencies else None,
+                'p50': percentile(latencies, 50),
+                'p95': percentile(latencies, 95),
+                'p99': percentile(latencies, 99),
+                'max': latencies[-1] if latencies else None,
+            },
+        }
+
+    summary = stats(records)
+    summary['duration_s'] = elapsed
+    summary['by_kind'] = {kind: stats([r for r in records if r[0] == kind])
+                          for kind in sorted({r[0] for r in records})}
+    error_types = {}
+    for _, _, _, error in records:
+        if error:
+            error_types[error] = error_types.get(error, 0) + 1
+    summary['error_types'] = error_types
+    return summary
+
+def run_closed_loop(client, source, concurrency, duration, warmup):
+    """
+    Lazo cerrado: `concurrency` clientes envían peticiones una tras otra
+
+    Returns:
+        Resumen de la etapa (ver summarize_records)
+    """
+    recorder = Recorder()
+    start = time.perf_counter()
+    measure_from = start + warmup
+    stop_at = measure_from + duration
+
+    def worker():
+        while True:
+            payload = source.next()
+            sent = time.perf_counter()
+            if sent >= stop_at:
+                return
+            status, error = client.send(payload)
+            if sent >= measure_from:
+                recorder.add(payload.kind, time.perf_counter() - sent, status, error)
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    summary = summarize_records(recorder.records, duration)
+    summary.update({'mode': 'closed', 'concurrency': concurrency})
+    return summary
+
+def run_open_loop(client, source, rate, duration, warmup, arrivals='poisson', max_inflight=256, seed=42):
+    """
+    Lazo abierto: las peticiones llegan a `rate` por segundo
+
+    La latencia se mide desde la llegada programada, de modo que si el
+    servidor se satura la espera en cola aparece en los percentiles.
+
+    Returns:
+        Resumen de la etapa (ver summarize_records)
+    """
+    recorder = Recorder()
+    rng = random.Random(seed)
+    inflight = threading.BoundedSemaphore(max_inflight)
+    dropped = 0
+
+    def send(payload, scheduled, measured):
+        try:
+            status, error = client.send(payload)
+            if measured:
+                recorder.add(payload.kind, time.perf_counter() - scheduled, status, error)
+        finally:
+            inflight.release()
+
+    start = time.perf_counter()
+    measure_from = start + warmup
+    stop_at = measure_from + duration
+    scheduled = start
+    with ThreadPoolExecutor(max_workers=max_inflight) as executor:
+        while True:
+            scheduled += rng.expovariate(rate) if arrivals == 'poisson' else 1.0 / rate
+            if scheduled >= stop_at:
+                break
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            payload = source.next()
+            if not inflight.acquire(blocking=False):
+                # Demasiadas peticiones pendientes: el generador no puede seguir la tasa
+                if scheduled >= measure_from:
+                    dropped += 1
+                    recorder.add(payload.kind, None, None, 'dropped (max-inflight)')
+                continue
+            executor.submit(send, payload, scheduled, scheduled >= measure_from)
+
+    summary = summarize_records(recorder.records, duration)
+    summary.update({'mode': 'open', 'target_rps': rate, 'arrivals': arrivals, 'dropped': dropped})
+    return summary
+
+def is_saturated(stage, slo_p99_ms, max_error_rate, previous=None):
+    """
+    Indica si una etapa está saturada
+
+    Lo está si supera el p99 o la tasa de errores aceptables, si en lazo
+    abierto no alcanza el 90% de la tasa objetivo o si en lazo cerrado el
+    rendimiento crece menos de un 5% respecto a la etapa anterior.
+
+    Returns:
+        Motivo de la saturación o None
+    """
+    p99 = stage['latency_ms']['p99']
+    if p99 is not None and p99 > slo_p99_ms:
+        return f'p99 {p99:.0f} ms > {slo_p99_ms:.0f} ms'
+    if stage['error_rate'] > max_error_rate:
+        return f"errores {stage['error_rate']:.1%} > {max_error_rate:.1%}"
+    if stage['mode'] == 'open' and stage['throughput_rps'] < 0.9 * stage['target_rps']:
+        return f"rendimiento {stage['throughput_rps']:.1f} < 90% de {stage['target_rps']:.1f} req/s"
+    if stage['mode'] == 'closed' and previous is not None and \
+            stage['throughput_rps'] < 1.05 * previous['throughput_rps']:
+        return f"el rendimiento no crece ({previous['throughput_rps']:.1f} -> {stage['throughput_rps']:.1f} req/s)"
+    return None
+
+def print_stage(stage):
+    """Muestra el resumen de una etapa"""
+    load = (f"{stage['concurrency']} clientes" if stage['mode'] == 'closed'
+            else f"{stage['target_rps']:.1f} req/s objetivo")
+    latency = stage['latency_ms']
+    if latency['p50'] is None:
+        print(f"{load}: sin peticiones completadas ({stage['requests']} descartadas)")
+        return
+    print(f"{load}: {stage['throughput_rps']:.1f} req/s, "
+          f"p50 {latency['p50']:.1f} ms, p95 {latency['p95']:.1f} ms, p99 {latency['p99']:.1f} ms, "
+          f"errores {stage['error_rate']:.2%}")
+    for kind, kind_stats in stage['by_kind'].items():
+        p99 = kind_stats['latency_ms']['p99']
+        print(f"    {kind}: {kind_stats['requests']} peticiones, "
+              f"p99 {'-' if p99 is None else f'{p99:.1f}'} ms, errores {kind_stats['error_rate']:.2%}")
+    for error, count in stage['error_types'].items():
+        print(f"    ⚠️ {error}: {count}")
+
+def main():
+    """Función principal"""
+    args = parse_args()
+    client = Client(args.url, timeout=args.timeout)
+
+    # Comprobamos que el servidor responde antes de empezar
+    status, error = client.send(Payload('health', 'GET', '/api/health'))
+    if error:
+        print(f"Error: El servidor {args.url} no responde correctamente ({error})")
+        return 1
+
+    if args.corpus:
+        source = PayloadSource(corpus=load_corpus(args.corpus))
+    else:
+        source = PayloadSource(groups=build_mix(args.mix, load_images(args.images)), seed=args.seed)
+
+    if args.sweep:
+        levels = [float(level) if args.rate else int(level) for level in args.sweep.split(',')]
+    else:
+        levels = [args.rate if args.rate else args.concurrency]
+
+    stages = []
+    saturation = None
+    for level in levels:
+        if args.rate:
+            stage = run_open_loop(client, source, level, args.duration, args.warmup,
+                                  arrivals=args.arrivals, max_inflight=args.max_inflight, seed=args.seed)
+        else:
+            stage = run_closed_loop(client, source, level, args.duration, args.warmup)
+        print_stage(stage)
+
+        reason = is_saturated(stage, args.slo_p99_ms, args.max_error_rate, stages[-1] if stages else None)
+        stage['saturated'] = reason
+        stages.append(stage)
+        if reason and saturation is None:
+            # Las etapas anteriores no estaban saturadas
+            sustained = [s['throughput_rps'] for s in stages[:-1]] or [stage['throughput_rps']]
+            saturation = {'level': level, 'reason': reason, 'max_sustained_rps': max(sustained)}
+            if len(levels) > 1:
+                print(f"⚠️ Saturación con {level}: {reason}")
+
+    report = {
+        'url': args.url,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'mode': 'open' if args.rate else 'closed',
+        'corpus': args.corpus,
+        'mix': None if args.corpus else args.mix,
+        'stages': stages,
+        'saturation': saturation,
+    }
+    if len(levels) > 1 and saturation is None:
+        print("✅ Sin saturación en los niveles probados")
+
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Informe guardado en {args.output}")
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,6 +7,12 @@ Fecha: 2025.04.02
 """
 
 import os
+import argparse
+import hashlib
+import multiprocessing
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from types import SimpleNamespace
 import numpy as np
 import matplotlib.pyplot as plt
 import tensorflow as tf
@@ -16,56 +22,291 @@ from sklearn.model_selection import KFold
 from sklearn.metrics import confusion_matrix, classification_report
 import seaborn as sns
 import pandas as pd
-from utils.utils import convert_heic_to_jpg, prepare_dataset
+from utils.utils import convert_heic_to_jpg, prepare_dataset, SPLIT_MODE, SPLIT_MODES
+from utils.models_utils import (export_tflite_model, TFLiteModel, compare_tflite_accuracy,
+                                configure_tensorflow_threads, save_model_artifacts, DEFAULT_MODEL_CONFIG)
+from utils.image_utils import FAST_DECODE, normalize_images
+from utils.feature_cache import load_or_compute_features, feature_cache_key
+from utils.checkpoints import TrainingRun, ResumableEarlyStopping
+from utils.data_pipeline import create_augmentation_layers, make_dataset, compare_input_pipelines
 
 # Configuración
 NUM_CLASSES = 6  # Ajustar según número de clases actuales
-IMG_HEIGHT = 224
-IMG_WIDTH = 224
+# Backbone: multiplicador de anchura de MobileNetV2 y tamaño de entrada (ver sweep.py).
+# Se leen del entorno para que los procesos de los folds paralelos usen los mismos
+MODEL_ALPHA = float(os.environ.get('MODEL_ALPHA', 1.0))
+IMG_HEIGHT = int(os.environ.get('IMG_SIZE', 224))
+IMG_WIDTH = IMG_HEIGHT
 BATCH_SIZE = 32
 EPOCHS = 20
 K_FOLDS = 5
 LEARNING_RATE = 0.001
+# Exportación a TFLite: 'int8', 'float16' o None para desactivarla
+TFLITE_QUANTIZATION = os.environ.get('TFLITE_QUANTIZATION', 'int8') or None
+TFLITE_CALIBRATION_SAMPLES = 100
+# Procesos para decodificar el dataset (por defecto, todos los núcleos)
+DECODE_WORKERS = int(os.environ.get('DECODE_WORKERS', os.cpu_count() or 1))
+# HEIC: 'convert' (a JPG en disco, sólo los pendientes) o 'stream' (decodificación directa al dataset)
+HEIC_MODE = os.environ.get('HEIC_MODE', 'convert')
+# Épocas sin mejorar val_loss antes de detener un fold (0 = entrenar todas las EPOCHS)
+EARLY_STOPPING_PATIENCE = int(os.environ.get('EARLY_STOPPING_PATIENCE', 0))
+# Directorio de la ejecución con los puntos de control por fold y época
+RUN_DIR = os.path.join('output', 'run')
+# Modo 'features': variantes aumentadas precalculadas por imagen
+FEATURE_AUGMENTED_COPIES = 2
 
-def create_model(num_classes):
+# Parámetros del aumento de datos (compartidos por ambos modos de entrenamiento)
+AUGMENTATION_PARAMS = {
+    'rotation_range': 20,
+    'width_shift_range': 0.2,
+    'height_shift_range': 0.2,
+    'horizontal_flip': True,
+    'zoom_range': 0.2,
+}
+
+def create_backbone(weights='imagenet', alpha=None, img_size=None):
     """
-    Crea un modelo de red neuronal convolucional para clasificación de imágenes
+    Crea el extractor de características MobileNetV2 congelado
     
     Args:
-        num_classes: Número de clases a clasificar
+        weights: Pesos preentrenados ('imagenet') o None para una inicialización
+            aleatoria (sin descargas, p. ej. para benchmarks sin conexión)
+        alpha: Multiplicador de anchura (None = MODEL_ALPHA)
+        img_size: Lado de la imagen de entrada (None = IMG_HEIGHT)
     
     Returns:
-        modelo: Modelo de red neuronal compilado
+        base_model: MobileNetV2 sin la capa de clasificación
     """
-    # Utilizamos una arquitectura basada en MobileNetV2 para eficiencia
+    img_size = img_size or IMG_HEIGHT
     base_model = tf.keras.applications.MobileNetV2(
-        input_shape=(IMG_HEIGHT, IMG_WIDTH, 3),
+        input_shape=(img_size, img_size, 3),
+        alpha=alpha or MODEL_ALPHA,
         include_top=False,
-        weights='imagenet'
+        weights=weights
     )
     
     # Congelamos las capas base para fine-tuning
     base_model.trainable = False
+    return base_model
+
+def create_head_layers(num_classes):
+    """
+    Crea las capas densas de clasificación que se entrenan sobre el backbone
     
-    modelo = models.Sequential([
-        base_model,
-        layers.GlobalAveragePooling2D(),
+    Args:
+        num_classes: Número de clases a clasificar
+    
+    Returns:
+        Lista de capas de Keras
+    """
+    return [
         layers.Dense(128, activation='relu'),
         layers.Dropout(0.2),
         layers.Dense(64, activation='relu'),
         layers.Dense(num_classes, activation='softmax')
-    ])
-    
-    # Compilamos el modelo
+    ]
+
+def compile_model(modelo):
+    """Compila un modelo con el optimizador y la pérdida del entrenamiento"""
     modelo.compile(
         optimizer=optimizers.Adam(learning_rate=LEARNING_RATE),
         loss='categorical_crossentropy',
         metrics=['accuracy']
     )
+    return modelo
+
+def create_model(num_classes, weights='imagenet', alpha=None, img_size=None):
+    """
+    Crea un modelo de red neuronal convolucional para clasificación de imágenes
     
+    Args:
+        num_classes: Número de clases a clasificar
+        weights: Pesos del backbone ('imagenet' o None, ver create_backbone)
+        alpha: Multiplicador de anchura (None = MODEL_ALPHA)
+        img_size: Lado de la imagen de entrada (None = IMG_HEIGHT)
+    
+    Returns:
+        modelo: Modelo de red neuronal compilado
+    """
+    # Utilizamos una arquitectura basada en MobileNetV2 para eficiencia
+    modelo = models.Sequential([
+        create_backbone(weights, alpha, img_size),
+        layers.GlobalAveragePooling2D(),
+    ] + create_head_layers(num_classes))
+    
+    # Compilamos el modelo
+    return compile_model(modelo)
+
+def create_feature_extractor(alpha=None, img_size=None):
+    """
+    Crea el backbone congelado con el pooling global (un vector por imagen)
+    
+    Args:
+        alpha: Multiplicador de anchura (None = MODEL_ALPHA)
+        img_size: Lado de la imagen de entrada (None = IMG_HEIGHT)
+    
+    Returns:
+        Modelo de Keras que produce las entradas de la cabeza densa
+    """
+    return models.Sequential([create_backbone(alpha=alpha, img_size=img_size), layers.GlobalAveragePooling2D()])
+
+def model_config():
+    """Configuración que se guarda junto al modelo (models/model_config.json)"""
+    return dict(DEFAULT_MODEL_CONFIG, alpha=MODEL_ALPHA, img_height=IMG_HEIGHT, img_width=IMG_WIDTH)
+
+def create_head_model(feature_dim, num_classes):
+    """
+    Crea la cabeza densa sola, entrenable sobre características precalculadas
+    
+    Args:
+        feature_dim: Dimensión de las características del backbone
+        num_classes: Número de clases a clasificar
+    
+    Returns:
+        Modelo compilado
+    """
+    modelo = models.Sequential([layers.Input(shape=(feature_dim,))] + create_head_layers(num_classes))
+    return compile_model(modelo)
+
+def assemble_full_model(head_model, num_classes):
+    """
+    Une el backbone con una cabeza entrenada en el modo 'features'
+    
+    El resultado es el mismo modelo que produce create_model(), por lo que se
+    guarda, se exporta a TFLite y se sirve sin cambios.
+    
+    Args:
+        head_model: Cabeza entrenada (ver create_head_model)
+        num_classes: Número de clases
+    
+    Returns:
+        Modelo completo compilado
+    """
+    modelo = create_model(num_classes)
+    # Las capas de la cabeza siguen al backbone y al pooling en el mismo orden
+    for target, source in zip(modelo.layers[2:], head_model.layers):
+        target.set_weights(source.get_weights())
     return modelo
 
-def train_with_cross_validation(X, y, num_classes, k_folds=K_FOLDS):
+def adjust_k_folds(sample_count, k_folds):
+    """Reduce el número de folds si hay pocas muestras"""
+    if sample_count < k_folds * 2:
+        new_k_folds = max(2, sample_count // 2)
+        print(f"⚠️ Advertencia: Demasiados folds ({k_folds}) para {sample_count} muestras.")
+        print(f"Ajustando a {new_k_folds} folds para evitar errores.")
+        return new_k_folds
+    return k_folds
+
+def train_fold(X, y, train_idx, val_idx, num_classes, input_pipeline='tfdata', run=None, fold_no=None,
+               early_stopping_patience=0):
+    """
+    Entrena y evalúa el modelo de un fold
+    
+    Args:
+        X: Datos de imágenes (uint8, puede estar mapeado en memoria)
+        y: Etiquetas
+        train_idx: Índices de entrenamiento
+        val_idx: Índices de validación
+        num_classes: Número de clases
+        input_pipeline: 'tfdata' o 'generator'
+        run: TrainingRun para guardar y reanudar el fold (opcional)
+        fold_no: Número del fold (necesario con `run`)
+        early_stopping_patience: Épocas sin mejorar val_loss antes de parar (0 = sin parada temprana)
+    
+    Returns:
+        model: Modelo entrenado
+        history: Historial de entrenamiento (atributo .history)
+        val_accuracy: Precisión de validación
+    """
+    # La validación se normaliza una vez por fold; el entrenamiento con tf.data
+    # lee las filas de X (uint8, puede estar mapeado en memoria) sin copiarlas
+    X_val, y_val = normalize_images(X[val_idx]), y[val_idx]
+    
+    # Creamos el modelo o lo recuperamos del último punto de control
+    callbacks = []
+    initial_epoch = 0
+    resume = run.resume_state(fold_no) if run is not None else None
+    if resume is not None:
+        model_path, initial_epoch, previous_history = resume
+        print(f'Reanudando fold {fold_no} desde la época {initial_epoch}')
+        model = models.load_model(model_path)
+    else:
+        model = create_model(num_classes)
+        previous_history = {}
+    
+    # La parada temprana va antes del punto de control, que guarda su estado
+    early_stopping = None
+    if early_stopping_patience:
+        if run is not None:
+            early_stopping = run.early_stopping_callback(fold_no, early_stopping_patience)
+        else:
+            early_stopping = ResumableEarlyStopping(early_stopping_patience)
+        callbacks.append(early_stopping)
+    if run is not None:
+        checkpoint = run.checkpoint_callback(fold_no, previous_history, early_stopping)
+        callbacks.append(checkpoint)
+    
+    # Aumento de datos para mejorar generalización
+    if input_pipeline == 'tfdata':
+        train_data = make_dataset(
+            X, y,
+            batch_size=BATCH_SIZE,
+            augmentation=create_augmentation_layers(**AUGMENTATION_PARAMS),
+            shuffle=True,
+            indices=train_idx
+        )
+    else:
+        data_augmentation = ImageDataGenerator(rescale=1.0 / 255.0, **AUGMENTATION_PARAMS)
+        train_data = data_augmentation.flow(X[train_idx], y[train_idx], batch_size=BATCH_SIZE)
+    
+    # Entrenamos el modelo
+    history = model.fit(
+        train_data,
+        validation_data=(X_val, y_val),
+        epochs=EPOCHS,
+        initial_epoch=initial_epoch,
+        callbacks=callbacks,
+        verbose=1
+    )
+    
+    # Evaluamos el modelo
+    val_loss, val_accuracy = model.evaluate(X_val, y_val, verbose=0)
+    
+    if run is not None:
+        # Historial completo, incluidas las épocas de antes de reanudar
+        history = SimpleNamespace(history=checkpoint.history)
+        run.record_fold(fold_no, model, checkpoint.history, val_accuracy)
+    
+    return model, history, val_accuracy
+
+def _train_fold_worker(fold_no, x_path, y, train_idx, val_idx, num_classes, input_pipeline,
+                       intra_op_threads, model_dir, run_dir, early_stopping_patience):
+    """
+    Entrena un fold en un proceso aparte (ver train_with_cross_validation)
+    
+    El dataset se abre con memoria mapeada desde `x_path`, de modo que los
+    procesos comparten las páginas en lugar de recibir una copia serializada.
+    
+    Returns:
+        fold_no, historial (diccionario), precisión de validación y ruta del modelo
+    """
+    configure_tensorflow_threads(intra_op_threads, 1)
+    X = np.load(x_path, mmap_mode='r')
+    run = TrainingRun(run_dir) if run_dir else None
+    
+    model, history, val_accuracy = train_fold(X, y, train_idx, val_idx, num_classes, input_pipeline,
+                                              run=run, fold_no=fold_no,
+                                              early_stopping_patience=early_stopping_patience)
+    
+    if run is not None:
+        model_path = run.completed_folds()[fold_no]['model_path']
+    else:
+        model_path = os.path.join(model_dir, f'fold_{fold_no}.h5')
+        model.save(model_path)
+    return fold_no, history.history, val_accuracy, model_path
+
+def train_with_cross_validation(X, y, num_classes, k_folds=K_FOLDS, input_pipeline='tfdata',
+                                parallel_folds=1, run=None, early_stopping_patience=0):
     """
     Entrena el modelo utilizando validación cruzada
     
@@ -74,6 +315,11 @@ def train_with_cross_validation(X, y, num_classes, k_folds=K_FOLDS):
         y: Etiquetas
         num_classes: Número de clases
         k_folds: Número de particiones para validación cruzada
+        input_pipeline: 'tfdata' (aumento vectorizado y prefetch) o
+            'generator' (ImageDataGenerator.flow)
+        parallel_folds: Folds entrenados a la vez en procesos separados (1 = secuencial)
+        run: TrainingRun con los puntos de control (None = sin reanudación)
+        early_stopping_patience: Épocas sin mejorar val_loss antes de parar (0 = sin parada temprana)
     
     Returns:
         histories: Historiales de entrenamiento
@@ -81,61 +327,191 @@ def train_with_cross_validation(X, y, num_classes, k_folds=K_FOLDS):
         best_model: Mejor modelo entrenado
     """
     # Ajustamos k_folds si hay pocas muestras
-    sample_count = X.shape[0]
-    if sample_count < k_folds * 2:
-        new_k_folds = max(2, sample_count // 2)
-        print(f"⚠️ Advertencia: Demasiados folds ({k_folds}) para {sample_count} muestras.")
-        print(f"Ajustando a {new_k_folds} folds para evitar errores.")
-        k_folds = new_k_folds
+    k_folds = adjust_k_folds(X.shape[0], k_folds)
     
     # Definimos la validación cruzada
     kfold = KFold(n_splits=k_folds, shuffle=True, random_state=42)
-    fold_no = 1
+    splits = list(enumerate(kfold.split(X), start=1))
+    
+    # Folds terminados en una ejecución anterior: (historial, precisión, modelo o ruta)
+    results = {}
+    if run is not None:
+        for fold_no, result in run.completed_folds().items():
+            if fold_no <= k_folds:
+                print(f"Fold {fold_no}: ya terminado (precisión {result['val_accuracy']:.4f}), se omite")
+                results[fold_no] = (SimpleNamespace(history=result['history']),
+                                    result['val_accuracy'], result['model_path'])
+    pending = [(fold_no, split) for fold_no, split in splits if fold_no not in results]
+    
+    if parallel_folds > 1 and len(pending) > 1:
+        results.update(_train_folds_in_parallel(X, y, pending, num_classes, input_pipeline,
+                                                min(parallel_folds, len(pending)), run,
+                                                early_stopping_patience))
+    else:
+        for fold_no, (train_idx, val_idx) in pending:
+            print(f'Entrenando fold {fold_no}/{k_folds}')
+            
+            model, history, val_accuracy = train_fold(
+                X, y, train_idx, val_idx, num_classes, input_pipeline,
+                run=run, fold_no=fold_no, early_stopping_patience=early_stopping_patience
+            )
+            print(f'Fold {fold_no}: Precisión de validación = {val_accuracy:.4f}')
+            
+            # Sólo el mejor modelo hasta ahora se queda en memoria; los de
+            # ejecuciones anteriores ya son rutas y no ocupan memoria
+            best_so_far = max((result[1] for result in results.values()), default=0)
+            if val_accuracy > best_so_far:
+                for other_no, (other_history, other_accuracy, other_model) in results.items():
+                    if not isinstance(other_model, str):
+                        results[other_no] = (other_history, other_accuracy, None)
+            else:
+                model = None
+            results[fold_no] = (history, val_accuracy, model)
+    
     histories = []
     val_accuracies = []
     best_accuracy = 0
     best_model = None
+    for fold_no in sorted(results):
+        history, val_accuracy, model = results[fold_no]
+        histories.append(history)
+        val_accuracies.append(val_accuracy)
+        
+        # Guardamos el mejor modelo
+        if model is not None and val_accuracy > best_accuracy:
+            best_accuracy = val_accuracy
+            best_model = model
+    
+    # Los folds de otras ejecuciones o de otros procesos se cargan desde disco
+    if isinstance(best_model, str):
+        best_model = models.load_model(best_model)
+    
+    return histories, val_accuracies, best_model
 
-    for train_idx, val_idx in kfold.split(X):
-        print(f'Entrenando fold {fold_no}/{k_folds}')
+def _train_folds_in_parallel(X, y, pending, num_classes, input_pipeline, num_processes, run,
+                             early_stopping_patience):
+    """
+    Entrena los folds en varios procesos, repartiendo los núcleos entre ellos
+    
+    Returns:
+        Diccionario fold_no -> (historial, precisión, modelo). Con `run` el
+        modelo es la ruta guardada en la ejecución; sin él, el mejor modelo
+        ya cargado y None en el resto (los archivos temporales se borran)
+    """
+    intra_op_threads = max(1, (os.cpu_count() or 1) // num_processes)
+    print(f"Entrenando {len(pending)} folds en {num_processes} procesos "
+          f"({intra_op_threads} hilos de TensorFlow cada uno)")
+    
+    with tempfile.TemporaryDirectory(prefix='folds_data_') as work_dir:
+        # Sin directorio de ejecución, los modelos de los folds van al temporal
+        model_dir = run.run_dir if run is not None else work_dir
         
-        # Dividimos los datos
-        X_train, X_val = X[train_idx], X[val_idx]
-        y_train, y_val = y[train_idx], y[val_idx]
+        # Los workers abren el dataset con memoria mapeada: si no está ya en
+        # disco (caché del dataset) lo escribimos una vez
+        if isinstance(X, np.memmap) and X.filename:
+            x_path = X.filename
+        else:
+            x_path = os.path.join(work_dir, 'X.npy')
+            np.save(x_path, X)
         
-        # Creamos y entrenamos el modelo
-        model = create_model(num_classes)
+        # 'spawn': cada worker inicializa TensorFlow con su propio presupuesto de hilos
+        context = multiprocessing.get_context('spawn')
+        results = {}
+        with ProcessPoolExecutor(max_workers=num_processes, mp_context=context) as executor:
+            futures = [
+                executor.submit(_train_fold_worker, fold_no, x_path, y, train_idx, val_idx,
+                                num_classes, input_pipeline, intra_op_threads, model_dir,
+                                run.run_dir if run is not None else None, early_stopping_patience)
+                for fold_no, (train_idx, val_idx) in pending
+            ]
+            for future in as_completed(futures):
+                fold_no, history, val_accuracy, model_path = future.result()
+                print(f'Fold {fold_no}: Precisión de validación = {val_accuracy:.4f}')
+                # Mismo atributo .history que devuelve model.fit
+                results[fold_no] = (SimpleNamespace(history=history), val_accuracy, model_path)
         
-        # Aumento de datos para mejorar generalización
-        data_augmentation = ImageDataGenerator(
-            rotation_range=20,
-            width_shift_range=0.2,
-            height_shift_range=0.2,
-            horizontal_flip=True,
-            zoom_range=0.2
-        )
+        # Antes de borrar el temporal cargamos el mejor modelo (mismo desempate que
+        # train_with_cross_validation: el primer fold con la mejor precisión)
+        if run is None and results:
+            best_no = max(sorted(results), key=lambda fold_no: results[fold_no][1])
+            for fold_no, (history, val_accuracy, model_path) in results.items():
+                model = models.load_model(model_path) if fold_no == best_no else None
+                results[fold_no] = (history, val_accuracy, model)
+    
+    return results
+
+def train_with_cached_features(X, y, num_classes, k_folds=K_FOLDS,
+                               augmented_copies=FEATURE_AUGMENTED_COPIES):
+    """
+    Entrena con validación cruzada sólo la cabeza densa sobre características cacheadas
+    
+    El backbone está congelado, así que su salida se calcula una vez (ver
+    utils/feature_cache.py) en lugar de en cada época de cada fold. El aumento
+    de datos se sustituye por `augmented_copies` variantes precalculadas de
+    cada imagen, que sólo se usan en la parte de entrenamiento de cada fold.
+    
+    Args:
+        X: Datos de imágenes
+        y: Etiquetas
+        num_classes: Número de clases
+        k_folds: Número de particiones para validación cruzada
+        augmented_copies: Variantes aumentadas por imagen (0 = sin aumento)
+    
+    Returns:
+        histories: Historiales de entrenamiento
+        val_accuracies: Precisiones de validación
+        best_model: Mejor modelo completo (backbone + cabeza)
+    """
+    k_folds = adjust_k_folds(X.shape[0], k_folds)
+    
+    augmenter = ImageDataGenerator(**AUGMENTATION_PARAMS)
+    features, augmented = load_or_compute_features(
+        X,
+        create_feature_extractor,
+        augmented_copies=augmented_copies,
+        augment_fn=augmenter.random_transform,
+        batch_size=BATCH_SIZE,
+        cache_key=feature_cache_key(MODEL_ALPHA, IMG_HEIGHT, IMG_WIDTH)
+    )
+    
+    kfold = KFold(n_splits=k_folds, shuffle=True, random_state=42)
+    histories = []
+    val_accuracies = []
+    best_accuracy = 0
+    best_head = None
+    
+    for fold_no, (train_idx, val_idx) in enumerate(kfold.split(features), start=1):
+        print(f'Entrenando fold {fold_no}/{k_folds} (características cacheadas)')
         
-        # Entrenamos el modelo
-        history = model.fit(
-            data_augmentation.flow(X_train, y_train, batch_size=BATCH_SIZE),
-            validation_data=(X_val, y_val),
+        # Las variantes aumentadas sólo se añaden al entrenamiento
+        F_train, y_train = features[train_idx], y[train_idx]
+        if augmented is not None:
+            F_train = np.concatenate([F_train] + [variant[train_idx] for variant in augmented])
+            y_train = np.concatenate([y_train] * (len(augmented) + 1))
+        F_val, y_val = features[val_idx], y[val_idx]
+        
+        head = create_head_model(features.shape[1], num_classes)
+        history = head.fit(
+            F_train, y_train,
+            validation_data=(F_val, y_val),
+            batch_size=BATCH_SIZE,
             epochs=EPOCHS,
+            shuffle=True,
             verbose=1
         )
         
-        # Evaluamos el modelo
-        val_loss, val_accuracy = model.evaluate(X_val, y_val, verbose=0)
+        val_loss, val_accuracy = head.evaluate(F_val, y_val, verbose=0)
         print(f'Fold {fold_no}: Precisión de validación = {val_accuracy:.4f}')
         
         histories.append(history)
         val_accuracies.append(val_accuracy)
         
-        # Guardamos el mejor modelo
         if val_accuracy > best_accuracy:
             best_accuracy = val_accuracy
-            best_model = model
-        
-        fold_no += 1
+            best_head = head
+    
+    # Montamos el modelo completo para guardarlo y servirlo como siempre
+    best_model = assemble_full_model(best_head, num_classes) if best_head is not None else None
     
     return histories, val_accuracies, best_model
 
@@ -188,7 +564,76 @@ def plot_confusion_matrix(y_true, y_pred, class_names):
     
     return cm
 
+def export_and_compare_tflite(best_model, X, y_true, tflite_path='models/best_model.tflite'):
+    """
+    Exporta el mejor modelo a TFLite cuantizado y compara su precisión con Keras
+    
+    Args:
+        best_model: Mejor modelo de Keras entrenado
+        X: Datos de imágenes (también usados como muestra de calibración)
+        y_true: Índices de las clases reales
+    """
+    try:
+        export_tflite_model(
+            best_model,
+            tflite_path,
+            quantization=TFLITE_QUANTIZATION,
+            calibration_data=X,
+            num_calibration_samples=TFLITE_CALIBRATION_SAMPLES
+        )
+        
+        report = compare_tflite_accuracy(
+            best_model,
+            TFLiteModel(tflite_path),
+            X,
+            y_true,
+            report_path='output/tflite_report.txt'
+        )
+        
+        print(f"\nComparación TFLite ({TFLITE_QUANTIZATION}) vs Keras:")
+        print(f"Precisión Keras: {report['keras_accuracy']:.4f}")
+        print(f"Precisión TFLite: {report['tflite_accuracy']:.4f} "
+              f"(diferencia {report['accuracy_delta']:+.4f})")
+        print(f"Latencia: {report['keras_ms_per_image']:.2f} ms -> "
+              f"{report['tflite_ms_per_image']:.2f} ms por imagen")
+        
+    except Exception as e:
+        print(f"Error al exportar el modelo TFLite: {e}")
+        print("Continuando sin el modelo cuantizado...")
+
+def parse_args():
+    """Lee los argumentos de la línea de comandos"""
+    parser = argparse.ArgumentParser(description='Entrena el clasificador de gomitas')
+    parser.add_argument('--mode', choices=['full', 'features'], default='full',
+                        help="'full' entrena el modelo completo con aumento en línea; "
+                             "'features' cachea las salidas del backbone y entrena sólo la cabeza")
+    parser.add_argument('--augmented-copies', type=int, default=FEATURE_AUGMENTED_COPIES,
+                        help='Variantes aumentadas precalculadas por imagen en el modo features')
+    parser.add_argument('--input-pipeline', choices=['tfdata', 'generator'], default='tfdata',
+                        help="Fuente de lotes del modo full: 'tfdata' o 'generator' (ImageDataGenerator.flow)")
+    parser.add_argument('--decode-workers', type=int, default=DECODE_WORKERS,
+                        help='Procesos para decodificar las imágenes nuevas del dataset')
+    parser.add_argument('--heic', choices=['convert', 'stream'], default=HEIC_MODE,
+                        help="Imágenes HEIC: 'convert' las convierte a JPG (sólo las pendientes) o "
+                             "'stream' las decodifica directamente al preparar el dataset")
+    parser.add_argument('--split-mode', choices=SPLIT_MODES, default=SPLIT_MODE,
+                        help="Particiones entrenamiento/prueba: 'manifest' (data/splits.json) o carpetas "
+                             "con 'hardlink', 'symlink' o 'copy'")
+    parser.add_argument('--parallel-folds', type=int, default=1,
+                        help='Folds del modo full entrenados a la vez en procesos separados')
+    parser.add_argument('--run-dir', default=RUN_DIR,
+                        help='Directorio con los puntos de control; una ejecución interrumpida se reanuda desde él')
+    parser.add_argument('--restart', action='store_true',
+                        help='Ignora los puntos de control existentes y empieza de cero')
+    parser.add_argument('--early-stopping-patience', type=int, default=EARLY_STOPPING_PATIENCE,
+                        help='Épocas sin mejorar val_loss antes de detener un fold (0 = desactivado)')
+    parser.add_argument('--benchmark-input', action='store_true',
+                        help='Compara los lotes/s de ambos pipelines de entrada antes de entrenar')
+    return parser.parse_args()
+
 def main():
+    args = parse_args()
+    
     # Creamos directorios necesarios
     os.makedirs('data/entrenamiento', exist_ok=True)
     os.makedirs('data/prueba', exist_ok=True)
@@ -203,39 +648,73 @@ def main():
         print("Ejemplo: data/raw/gomitas_acidul/, data/raw/dulcigomas/, etc.")
         return
     
-    # Convertimos imágenes HEIC a JPG si es necesario
-    try:
-        convert_heic_to_jpg(raw_dir)
-    except Exception as e:
-        print(f"Error durante la conversión de HEIC: {e}")
-        print("Continuando con las imágenes disponibles...")
+    # Convertimos imágenes HEIC a JPG si es necesario (en modo stream se decodifican al preparar el dataset)
+    if args.heic == 'convert':
+        try:
+            convert_heic_to_jpg(raw_dir, num_workers=args.decode_workers)
+        except Exception as e:
+            print(f"Error durante la conversión de HEIC: {e}")
+            print("Continuando con las imágenes disponibles...")
     
     # Preparamos el dataset
-    X, y, class_names = prepare_dataset('data/raw', IMG_HEIGHT, IMG_WIDTH)
+    X, y, class_names = prepare_dataset('data/raw', IMG_HEIGHT, IMG_WIDTH, fast_decode=FAST_DECODE,
+                                        num_workers=args.decode_workers, split_mode=args.split_mode,
+                                        include_heic=args.heic == 'stream')
     num_classes = len(class_names)
     
+    # Comparamos la velocidad de los pipelines de entrada si se solicita
+    if args.benchmark_input:
+        compare_input_pipelines(
+            X, y,
+            batch_size=BATCH_SIZE,
+            augmentation_params=AUGMENTATION_PARAMS,
+            report_path='output/input_pipeline_report.txt'
+        )
+    
     # Entrenamos con validación cruzada
-    histories, val_accuracies, best_model = train_with_cross_validation(X, y, num_classes)
+    if args.mode == 'features':
+        histories, val_accuracies, best_model = train_with_cached_features(
+            X, y, num_classes, augmented_copies=args.augmented_copies
+        )
+    else:
+        # La ejecución sólo se reanuda si la configuración y el dataset coinciden
+        run = TrainingRun(args.run_dir, config={
+            'mode': args.mode,
+            'input_pipeline': args.input_pipeline,
+            'model': model_config(),
+            'k_folds': K_FOLDS,
+            'epochs': EPOCHS,
+            'batch_size': BATCH_SIZE,
+            'learning_rate': LEARNING_RATE,
+            'early_stopping_patience': args.early_stopping_patience,
+            'class_names': class_names,
+            'samples': int(X.shape[0]),
+            'labels_sha1': hashlib.sha1(np.ascontiguousarray(y).tobytes()).hexdigest(),
+        }, restart=args.restart)
+        histories, val_accuracies, best_model = train_with_cross_validation(
+            X, y, num_classes, input_pipeline=args.input_pipeline, parallel_folds=args.parallel_folds,
+            run=run, early_stopping_patience=args.early_stopping_patience
+        )
     
     # Graficamos resultados de validación cruzada
     plot_training_history(histories)
     
-    # Guardamos el mejor modelo
-    best_model.save('models/best_model.h5')
+    # Guardamos el mejor modelo y sus nombres de clases de forma atómica
+    # (el servidor los vigila y recarga en caliente)
+    save_model_artifacts(best_model, class_names, model_config=model_config())
     
     # Evaluamos en todo el conjunto de datos
-    y_pred_probs = best_model.predict(X)
+    y_pred_probs = best_model.predict(make_dataset(X, y, batch_size=BATCH_SIZE, cache=False), verbose=0)
     y_pred = np.argmax(y_pred_probs, axis=1)
     y_true = np.argmax(y, axis=1)
     
+    # Exportamos el modelo cuantizado para servir en CPU
+    if TFLITE_QUANTIZATION and TFLITE_QUANTIZATION != 'none':
+        export_and_compare_tflite(best_model, X, y_true)
+    
     # Generamos y guardamos la matriz de confusión
     cm = plot_confusion_matrix(y_true, y_pred, class_names)
     
-    # Guardamos los nombres de las clases para usar en predicciones futuras
-    with open('models/class_names.txt', 'w') as f:
-        for name in class_names:
-            f.write(f"{name}\n")
-    
     # Imprimimos resumen de resultados
     print("\nResultados del entrenamiento:")
     print(f"Precisión promedio en validación cruzada: {np.mean(val_accuracies):.4f}")
@@ -246,6 +725,11 @@ def main():
         f.write(f"Número de clases: {num_classes}\n")
         f.write(f"Clases: {', '.join(class_names)}\n")
         f.write(f"Tamaño de imagen: {IMG_HEIGHT}x{IMG_WIDTH}\n")
+        f.write(f"Alpha de MobileNetV2: {MODEL_ALPHA:g}\n")
+        f.write(f"Decodificación reducida: {'sí' if FAST_DECODE else 'no'}\n")
+        f.write(f"Modo de entrenamiento: {args.mode}\n")
+        if args.mode == 'full':
+            f.write(f"Pipeline de entrada: {args.input_pipeline}\n")
         f.write(f"Épocas: {EPOCHS}\n")
         f.write(f"Batch size: {BATCH_SIZE}\n")
         f.write(f"Learning rate: {LEARNING_RATE}\n")
@@ -2,16 +2,21 @@
 # -*- coding: utf-8 -*-
 """
 Script para hacer predicciones con el modelo entrenado
+
+Con una sola imagen muestra la predicción y guarda su visualización. Con
+directorios, patrones glob o listas (@lista.txt) carga el modelo una vez,
+clasifica por lotes y escribe los resultados en JSONL o CSV.
+
+Si el daemon de inferencia (predict_daemon.py) está en marcha, las imágenes
+se clasifican con él y este proceso no importa TensorFlow ni carga el modelo;
+la visualización sólo se genera entonces con --plot.
 """
 
 import os
 import sys
 import argparse
-import numpy as np
-import matplotlib.pyplot as plt
-from PIL import Image
-from tensorflow.keras.models import load_model
-from utils.utils import predict_image
+import glob
+from utils.daemon_client import DAEMON_SOCKET, DaemonUnavailable, connect_daemon, iter_daemon_predictions
 
 def parse_args():
     """
@@ -21,20 +26,113 @@ def parse_args():
         args: Argumentos analizados
     """
     parser = argparse.ArgumentParser(description='Predicción de imágenes con el modelo entrenado')
-    parser.add_argument('image_path', help='Ruta a la imagen para predecir')
+    parser.add_argument('inputs', nargs='+',
+                        help="Imágenes, directorios, patrones glob o listas de rutas (@lista.txt, '-' = stdin)")
     parser.add_argument('--model', default='models/best_model.h5', help='Ruta al modelo guardado')
     parser.add_argument('--classes', default='models/class_names.txt', help='Ruta a los nombres de clases')
+    parser.add_argument('--full-decode', action='store_true',
+                        help='Decodificar el JPEG a resolución completa (para comparar con la reducida)')
+    parser.add_argument('--output', default=None,
+                        help='Archivo de resultados .jsonl o .csv (por defecto output/predictions/predictions.jsonl '
+                             'si hay varias imágenes)')
+    parser.add_argument('--batch-size', type=int, default=32, help='Imágenes por lote de inferencia')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Procesos de decodificación (por defecto, todos los núcleos)')
+    parser.add_argument('--resume', action='store_true',
+                        help='Salta las imágenes que ya están en el archivo de resultados')
+    parser.add_argument('--plot', dest='plot', action='store_true', default=None,
+                        help='Guarda la visualización de cada predicción (por defecto sólo con una '
+                             'imagen y sin daemon)')
+    parser.add_argument('--no-plot', dest='plot', action='store_false',
+                        help='No genera la visualización')
+    parser.add_argument('--socket', default=DAEMON_SOCKET,
+                        help='Socket del daemon de inferencia (si está en marcha se usa automáticamente)')
+    parser.add_argument('--no-daemon', action='store_true',
+                        help='Ignora el daemon y carga el modelo en este proceso')
     return parser.parse_args()
 
+def save_visualization(image_path, predicted_class, confidence, output_dir='output/predictions'):
+    """
+    Guarda la imagen con la clase predicha y su confianza
+
+    Returns:
+        Ruta de la visualización
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from PIL import Image
+    
+    img = Image.open(image_path).convert('RGB')
+    plt.figure(figsize=(6, 6))
+    plt.imshow(img)
+    plt.title(f'Predicción: {predicted_class}\nConfianza: {confidence:.2%}')
+    plt.axis('off')
+    plt.tight_layout()
+    
+    os.makedirs(output_dir, exist_ok=True)
+    output_path = os.path.join(
+        output_dir, 
+        f"pred_{os.path.basename(image_path).split('.')[0]}.png"
+    )
+    plt.savefig(output_path)
+    plt.close()
+    return output_path
+
+def local_predictor(args, fast_decode):
+    """
+    Crea la función de predicción en este proceso (importa TensorFlow y carga el modelo)
+
+    Returns:
+        Función (rutas, batch_size) -> iterador de listas de resultados
+    """
+    # El modelo se carga una sola vez para todas las imágenes
+    from utils.batch_predict import predict_paths
+    from utils.model_manager import read_class_names
+    from utils.models_utils import load_prediction_model
+    model = load_prediction_model(args.model)
+    class_names = read_class_names(args.classes)
+    
+    def predict_batches(batch_paths, batch_size=args.batch_size):
+        return predict_paths(model, class_names, batch_paths, batch_size=batch_size,
+                             num_workers=1 if len(batch_paths) == 1 else args.workers,
+                             fast_decode=fast_decode)
+    return predict_batches
+
+def daemon_predictor(args, fast_decode):
+    """
+    Crea la función de predicción con el daemon
+
+    Si el daemon deja de responder a mitad de una ejecución, se carga el
+    modelo en este proceso y se clasifican las imágenes que no tuvieron respuesta.
+
+    Returns:
+        Función (rutas, batch_size) -> iterador de listas de resultados
+    """
+    local = []
+    
+    def predict_batches(batch_paths, batch_size=args.batch_size):
+        # Rutas con respuesta del daemon (una respuesta puede traer menos de un lote)
+        answered = set()
+        if not local:
+            try:
+                for results in iter_daemon_predictions(batch_paths, args.socket, batch_size=batch_size,
+                                                       fast_decode=fast_decode):
+                    answered.update(result['path'] for result in results)
+                    yield results
+                return
+            except (DaemonUnavailable, RuntimeError, OSError, ValueError) as e:
+                print(f"⚠️ El daemon dejó de responder ({e}); se continúa con la inferencia local")
+                local.append(local_predictor(args, fast_decode))
+        remaining = [path for path in batch_paths if path not in answered]
+        if remaining:
+            yield from local[0](remaining, batch_size)
+    return predict_batches
+
 def main():
     """Función principal"""
     args = parse_args()
     
-    # Verificamos que la imagen exista
-    if not os.path.exists(args.image_path):
-        print(f"Error: No se encontró la imagen en {args.image_path}")
-        return 1
-    
     # Verificamos que el modelo exista
     if not os.path.exists(args.model):
         print(f"Error: No se encontró el modelo en {args.model}")
@@ -45,32 +143,65 @@ def main():
         print(f"Error: No se encontró el archivo de clases en {args.classes}")
         return 1
     
-    # Realizamos la predicción
-    predicted_class, confidence = predict_image(
-        args.image_path, args.model, args.classes
-    )
+    # Una sola imagen sin archivo de salida: comportamiento interactivo
+    single = (len(args.inputs) == 1 and args.output is None and not os.path.isdir(args.inputs[0])
+              and not args.inputs[0].startswith('@') and args.inputs[0] != '-'
+              and not glob.has_magic(args.inputs[0]))
     
-    # Mostramos la imagen y la predicción
-    img = Image.open(args.image_path).convert('RGB')
-    plt.figure(figsize=(6, 6))
-    plt.imshow(img)
-    plt.title(f'Predicción: {predicted_class}\nConfianza: {confidence:.2%}')
-    plt.axis('off')
-    plt.tight_layout()
+    if single and not os.path.exists(args.inputs[0]):
+        print(f"Error: No se encontró la imagen en {args.inputs[0]}")
+        return 1
     
-    # Guardamos la visualización
-    output_dir = 'output/predictions'
-    os.makedirs(output_dir, exist_ok=True)
-    output_path = os.path.join(
-        output_dir, 
-        f"pred_{os.path.basename(args.image_path).split('.')[0]}.png"
-    )
-    plt.savefig(output_path)
+    # Las utilidades por lotes importan numpy; el daemon evita además TensorFlow
+    from utils.batch_predict import collect_image_paths, read_results, run_batch_prediction
+    
+    paths = collect_image_paths(args.inputs)
+    if not paths:
+        print("Error: No se encontraron imágenes")
+        return 1
+    
+    fast_decode = False if args.full_decode else None
+    daemon = None if args.no_daemon else connect_daemon(args.model, args.classes, args.socket)
+    
+    if daemon is not None:
+        predict_batches = daemon_predictor(args, fast_decode)
+    else:
+        predict_batches = local_predictor(args, fast_decode)
+    
+    # Con el daemon (invocaciones frecuentes) la visualización es opcional:
+    # importar matplotlib costaría más que la propia predicción
+    plot = args.plot if args.plot is not None else (single and daemon is None)
+    
+    if single:
+        result = next(predict_batches(paths, batch_size=1))[0]
+        if result['error']:
+            print(f"Error al predecir: {result['error']}")
+            return 1
+        
+        print(f"\nResultado de la predicción:")
+        print(f"Clase: {result['class']}")
+        print(f"Confianza: {result['confidence']:.2%}")
+        if plot:
+            output_path = save_visualization(paths[0], result['class'], result['confidence'])
+            print(f"Visualización guardada en: {output_path}")
+        return 0
+    
+    # Modo por lotes
+    output_path = args.output or os.path.join('output', 'predictions', 'predictions.jsonl')
+    if output_path != '-':
+        os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    print(f"Clasificando {len(paths)} imágenes -> {output_path}"
+          f"{' (daemon ' + daemon['version'] + ')' if daemon else ''}")
+    
+    summary = run_batch_prediction(predict_batches, paths, output_path, resume=args.resume)
+    print(f"✅ {summary['images']} imágenes clasificadas en {summary['seconds']:.1f} s "
+          f"({summary['errors']} con error)")
     
-    print(f"\nResultado de la predicción:")
-    print(f"Clase: {predicted_class}")
-    print(f"Confianza: {confidence:.2%}")
-    print(f"Visualización guardada en: {output_path}")
+    # La visualización por imagen es opcional en el modo por lotes
+    if plot and output_path != '-':
+        for result in read_results(output_path):
+            if not result['error']:
+                save_visualization(result['path'], result['class'], float(result['confidence']))
     
     return 0
 
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Daemon de inferencia local para los clientes de línea de comandos
+
+Mantiene el modelo cargado y caliente y escucha en un socket de dominio
+Unix. predict.py lo usa automáticamente si está en marcha, evitando
+importar TensorFlow y cargar el modelo en cada invocación. Las peticiones
+concurrentes se agrupan con el planificador de micro-lotes y el modelo se
+recarga en caliente cuando se reentrena.
+
+Uso:
+    python predict_daemon.py [--socket output/predict_daemon.sock]
+"""
+
+import argparse
+import json
+import os
+import signal
+import socketserver
+import sys
+from utils.batch_predict import decode_batch, build_results
+from utils.batching import MicroBatcher
+from utils.daemon_client import DAEMON_SOCKET, DaemonUnavailable, send_request
+from utils.image_utils import normalize_images
+from utils.model_manager import ModelManager
+from utils.models_utils import load_prediction_model
+
+def parse_args():
+    """
+    Analiza los argumentos de línea de comandos
+
+    Returns:
+        args: Argumentos analizados
+    """
+    parser = argparse.ArgumentParser(description='Daemon de inferencia local (socket Unix)')
+    parser.add_argument('--socket', default=DAEMON_SOCKET, help='Ruta del socket Unix')
+    parser.add_argument('--model', default='models/best_model.h5', help='Ruta al modelo guardado (.h5 o .tflite)')
+    parser.add_argument('--classes', default='models/class_names.txt', help='Ruta a los nombres de clases')
+    parser.add_argument('--batch-size', type=int, default=32,
+                        help='Tamaño máximo del micro-lote de inferencia')
+    parser.add_argument('--batch-wait-ms', type=float, default=5.0,
+                        help='Espera máxima para completar un micro-lote en ms')
+    parser.add_argument('--reload-interval', type=float, default=5.0,
+                        help='Segundos entre comprobaciones de un modelo nuevo (0 = sin recarga)')
+    parser.add_argument('--full-decode', action='store_true',
+                        help='Decodificar los JPEG a resolución completa por defecto')
+    return parser.parse_args()
+
+class PredictionHandler(socketserver.StreamRequestHandler):
+    """Atiende una conexión: una línea JSON por petición y otra por respuesta"""
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                response = self.server.dispatch(json.loads(line))
+            except Exception as e:
+                response = {'error': str(e)}
+            self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+            self.wfile.flush()
+
+class PredictionServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Servidor del daemon: un hilo por conexión y un único modelo compartido
+
+    Args:
+        socket_path: Ruta del socket Unix
+        manager: ModelManager con el modelo cargado
+        batcher: MicroBatcher que agrupa las inferencias concurrentes
+        fast_decode: Decodificación JPEG reducida por defecto
+    """
+
+    daemon_threads = True
+
+    def __init__(self, socket_path, manager, batcher, fast_decode=None):
+        self.manager = manager
+        self.batcher = batcher
+        self.fast_decode = fast_decode
+        super().__init__(socket_path, PredictionHandler)
+
+    def dispatch(self, request):
+        """
+        Ejecuta una petición
+
+        Returns:
+            Diccionario de la respuesta
+        """
+        current = self.manager.current()
+        if current is None:
+            return {'error': 'No hay modelo cargado'}
+
+        if request.get('cmd') == 'ping':
+            return {
+                'version': current.version,
+                'model_path': os.path.realpath(self.manager.model_path),
+                'class_names_path': os.path.realpath(self.manager.class_names_path),
+                'input_shape': list(current.model.input_shape[1:]),
+                'pid': os.getpid(),
+            }
+
+        if request.get('cmd') == 'predict':
+            fast_decode = request.get('fast_decode')
+            if fast_decode is None:
+                fast_decode = self.fast_decode
+            images, valid, errors = decode_batch(request.get('paths', []), current.img_height,
+                                                 current.img_width, fast_decode)
+            predictions = self.batcher.predict(current.model, normalize_images(images)) if len(images) else []
+            return {'version': current.version,
+                    'results': build_results(valid, predictions, current.class_names, errors)}
+
+        return {'error': f"Comando desconocido: {request.get('cmd')}"}
+
+def remove_stale_socket(socket_path):
+    """
+    Borra el socket de un daemon anterior que ya no está en marcha
+
+    Returns:
+        False si ya hay otro daemon escuchando en ese socket
+    """
+    if not os.path.exists(socket_path):
+        return True
+    try:
+        send_request({'cmd': 'ping'}, socket_path, timeout=2)
+        return False
+    except (DaemonUnavailable, RuntimeError, OSError, ValueError):
+        os.remove(socket_path)
+        return True
+
+def main():
+    """Función principal"""
+    args = parse_args()
+
+    if not remove_stale_socket(args.socket):
+        print(f"Error: Ya hay un daemon escuchando en {args.socket}")
+        return 1
+
+    # Cargamos y calentamos el modelo antes de aceptar conexiones
+    manager = ModelManager(load_prediction_model, args.model, args.classes,
+                           poll_interval=args.reload_interval)
+    if not manager.load():
+        return 1
+    manager.start_watching()
+    batcher = MicroBatcher(max_batch_size=args.batch_size, max_wait_ms=args.batch_wait_ms)
+
+    os.makedirs(os.path.dirname(args.socket) or '.', exist_ok=True)
+    server = PredictionServer(args.socket, manager, batcher,
+                              fast_decode=False if args.full_decode else None)
+    # Sólo el usuario que arranca el daemon puede usarlo
+    os.chmod(args.socket, 0o600)
+
+    # SIGTERM (p. ej. systemd) cierra el daemon igual que Ctrl+C
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    print(f"✅ Daemon de inferencia escuchando en {args.socket} (modelo {manager.current().version})")
+    try:
+        server.serve_forever()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        server.server_close()
+        manager.stop_watching()
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+        print("Daemon detenido")
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Servidor de producción: varios procesos worker con gunicorn
+
+- Precarga el código (y el modelo TFLite) en el proceso maestro para que los
+  workers compartan las páginas de solo lectura tras el fork.
+- Reparte los núcleos entre workers fijando los hilos intra-op/inter-op de
+  TensorFlow (y del intérprete TFLite) de cada proceso, para que N workers
+  no sobresuscriban la CPU.
+"""
+
+import os
+
+import controller
+from utils.models_utils import configure_tensorflow_threads
+
+def default_worker_settings(cpu_count=None, workers=None, intra_op_threads=None, inter_op_threads=None):
+    """
+    Calcula valores por defecto a partir del número de CPUs
+
+    Se usa un worker por cada 2 núcleos (mínimo 1) y se reparten los núcleos
+    entre los workers para los hilos intra-op; un único hilo inter-op basta
+    para un modelo secuencial como MobileNetV2.
+
+    Args:
+        cpu_count: Número de CPUs (None = os.cpu_count())
+        workers: Número de workers (None = automático)
+        intra_op_threads: Hilos intra-op por worker (None = automático)
+        inter_op_threads: Hilos inter-op por worker (None = automático)
+
+    Returns:
+        workers, intra_op_threads, inter_op_threads
+    """
+    cpu_count = cpu_count or os.cpu_count() or 1
+    workers = workers or max(1, cpu_count // 2)
+    intra_op_threads = intra_op_threads or max(1, cpu_count // workers)
+    inter_op_threads = inter_op_threads or 1
+    return workers, intra_op_threads, inter_op_threads
+
+def run_production_server(host, port, workers=None, intra_op_threads=None, inter_op_threads=None,
+                          threads_per_worker=None, async_mode=False, timeout=120, tflite_threads=None):
+    """
+    Inicia el servidor de producción con gunicorn
+
+    Args:
+        host: Host del servidor
+        port: Puerto del servidor
+        workers: Número de procesos worker
+        intra_op_threads: Hilos intra-op de TensorFlow por worker
+        inter_op_threads: Hilos inter-op de TensorFlow por worker
+        threads_per_worker: Hilos de petición por worker (modo WSGI)
+        async_mode: Usa workers ASGI (uvicorn) en lugar de WSGI
+        timeout: Segundos antes de reiniciar un worker bloqueado
+        tflite_threads: Hilos del intérprete TFLite indicados por el usuario
+            (None = TFLITE_NUM_THREADS o, si no está definida, los intra-op)
+    """
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        raise ImportError('El modo producción requiere gunicorn. Instale: pip install gunicorn')
+
+    workers, intra_op_threads, inter_op_threads = default_worker_settings(
+        workers=workers, intra_op_threads=intra_op_threads, inter_op_threads=inter_op_threads
+    )
+    # Hilos suficientes por worker para que el micro-batching pueda formar lotes
+    threads_per_worker = threads_per_worker or max(4, controller.BATCH_MAX_SIZE)
+
+    # Límite para los procesos hijos antes de que nadie inicialice TensorFlow
+    os.environ['TF_NUM_INTRAOP_THREADS'] = str(intra_op_threads)
+    os.environ['TF_NUM_INTEROP_THREADS'] = str(inter_op_threads)
+    os.environ['OMP_NUM_THREADS'] = str(intra_op_threads)
+    # Un número de hilos TFLite explícito (--tflite-threads o la variable) se respeta
+    if not tflite_threads and 'TFLITE_NUM_THREADS' not in os.environ:
+        controller.TFLITE_NUM_THREADS = intra_op_threads
+
+    # Precarga en el maestro: los pesos TFLite se comparten entre workers (copy-on-write)
+    controller.preload_model_content()
+
+    def post_fork(server, worker):
+        """Configura cada worker recién creado"""
+        controller.reset_after_fork()
+        if controller.MODEL_BACKEND != 'tflite':
+            configure_tensorflow_threads(intra_op_threads, inter_op_threads)
+        # Cargamos (y calentamos) el modelo antes de aceptar peticiones
+        controller.load_model_if_needed()
+
+    options = {
+        'bind': f"{host}:{port}",
+        'workers': workers,
+        'preload_app': True,
+        'timeout': timeout,
+        'post_fork': post_fork,
+        'limit_request_line': 8190,
+    }
+    if async_mode:
+        options['worker_class'] = 'uvicorn.workers.UvicornWorker'
+    else:
+        options['worker_class'] = 'gthread'
+        options['threads'] = threads_per_worker
+
+    class ProductionServer(BaseApplication):
+        """Aplicación gunicorn configurada desde Python"""
+
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            if async_mode:
+                from asgi_controller import create_app
+                return create_app()
+            return controller.app
+
+    print(f"Iniciando servidor de producción en http://{host}:{port}")
+    print(f"Workers: {workers} ({'ASGI' if async_mode else f'WSGI, {threads_per_worker} hilos'}) | "
+          f"TensorFlow por worker: {intra_op_threads} intra-op, {inter_op_threads} inter-op")
+
+    ProductionServer().run()
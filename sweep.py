@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Barrido de precisión frente a latencia del backbone MobileNetV2
+
+Para cada combinación de multiplicador de anchura (alpha) y tamaño de
+entrada se calculan una vez las características del backbone congelado
+(ver utils/feature_cache.py), se entrena la cabeza densa con validación
+cruzada y se mide la latencia de inferencia en CPU y la memoria (RSS del
+proceso durante la inferencia, parámetros y tamaño en disco) del modelo
+completo. El resultado es un informe con el frente de Pareto (ninguna otra
+configuración es a la vez más precisa y más rápida) y una configuración
+recomendada: la más rápida cuya precisión queda a `--tolerance` de la mejor.
+
+La configuración elegida se aplica al entrenar:
+    MODEL_ALPHA=0.5 IMG_SIZE=128 python main.py
+y main.py la guarda en models/model_config.json junto al modelo, de donde
+la leen el servidor y los scripts de predicción.
+
+Uso:
+    python sweep.py [--alphas 0.35,0.5,0.75,1.0] [--sizes 96,128,160,192,224]
+"""
+
+import argparse
+import gc
+import json
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+import tensorflow as tf
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+from sklearn.model_selection import KFold
+from main import (create_model, create_feature_extractor, create_head_model, adjust_k_folds,
+                  BATCH_SIZE, EPOCHS, K_FOLDS)
+from utils.utils import prepare_dataset
+from utils.dataset_cache import DATASET_CACHE_DIR
+from utils.feature_cache import load_or_compute_features, feature_cache_key
+from utils.image_utils import FAST_DECODE
+
+# Valores con pesos de ImageNet disponibles para MobileNetV2
+DEFAULT_ALPHAS = [0.35, 0.5, 0.75, 1.0]
+DEFAULT_SIZES = [96, 128, 160, 192, 224]
+# Directorio de resultados
+SWEEP_DIR = os.path.join('output', 'sweep')
+
+def parse_args():
+    """
+    Analiza los argumentos de línea de comandos
+
+    Returns:
+        args: Argumentos analizados
+    """
+    parser = argparse.ArgumentParser(description='Barrido de alpha y resolución de MobileNetV2')
+    parser.add_argument('--alphas', default=','.join(str(a) for a in DEFAULT_ALPHAS),
+                        help='Multiplicadores de anchura separados por comas')
+    parser.add_argument('--sizes', default=','.join(str(s) for s in DEFAULT_SIZES),
+                        help='Tamaños de entrada (lado en píxeles) separados por comas')
+    parser.add_argument('--data-dir', default='data/raw', help='Directorio con las imágenes por clase')
+    parser.add_argument('--k-folds', type=int, default=K_FOLDS, help='Folds de la validación cruzada')
+    parser.add_argument('--epochs', type=int, default=EPOCHS, help='Épocas de la cabeza en cada fold')
+    parser.add_argument('--latency-repeats', type=int, default=50, help='Inferencias medidas por configuración')
+    parser.add_argument('--tolerance', type=float, default=0.01,
+                        help='Pérdida de precisión aceptable frente a la mejor para la recomendación')
+    parser.add_argument('--output-dir', default=SWEEP_DIR, help='Directorio del informe')
+    return parser.parse_args()
+
+def cross_validate_head(features, y, num_classes, k_folds, epochs):
+    """
+    Precisión de la cabeza densa con validación cruzada sobre características fijas
+
+    Returns:
+        Lista de precisiones de validación por fold
+    """
+    kfold = KFold(n_splits=adjust_k_folds(len(features), k_folds), shuffle=True, random_state=42)
+    accuracies = []
+    for train_idx, val_idx in kfold.split(features):
+        head = create_head_model(features.shape[1], num_classes)
+        head.fit(features[train_idx], y[train_idx], batch_size=BATCH_SIZE, epochs=epochs,
+                 shuffle=True, verbose=0)
+        _, accuracy = head.evaluate(features[val_idx], y[val_idx], verbose=0)
+        accuracies.append(float(accuracy))
+    return accuracies
+
+def rss_mb():
+    """
+    Memoria residente (RSS) actual del proceso en MB
+
+    Lee /proc/self/statm (Linux); en otros sistemas devuelve el pico de RSS
+    del proceso, que sólo crece y por tanto sobrestima las diferencias.
+    """
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+    except (OSError, ValueError, AttributeError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss está en bytes en macOS y en KB en Linux
+        return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+def measure_model(build_model, img_size, repeats):
+    """
+    Latencia de inferencia en CPU y memoria del modelo completo
+
+    La memoria en ejecución es el aumento del RSS del proceso desde antes de
+    crear el modelo hasta el pico observado durante las inferencias (pesos,
+    activaciones y búferes de TensorFlow), tras liberar el modelo anterior.
+
+    Args:
+        build_model: Función sin argumentos que crea el modelo
+        img_size: Lado de la imagen de entrada
+        repeats: Inferencias medidas con lote de 1
+
+    Returns:
+        Diccionario con latencias en ms (lote de 1: p50/p95; lote de 32: imágenes/s),
+        memoria en ejecución en MB, número de parámetros y tamaño del archivo .h5 en MB
+    """
+    # Liberamos los modelos de configuraciones anteriores antes de medir la base
+    tf.keras.backend.clear_session()
+    gc.collect()
+    rss_before = rss_mb()
+    peak_rss = rss_before
+
+    model = build_model()
+    rng = np.random.default_rng(0)
+    single = rng.random((1, img_size, img_size, 3), dtype=np.float32)
+    batch = rng.random((BATCH_SIZE, img_size, img_size, 3), dtype=np.float32)
+
+    # Llamada directa: predict() añade su propia sobrecarga por llamada
+    for _ in range(5):
+        model(single, training=False)
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        model(single, training=False)
+        samples.append((time.perf_counter() - start) * 1000.0)
+    peak_rss = max(peak_rss, rss_mb())
+
+    model(batch, training=False)
+    start = time.perf_counter()
+    for _ in range(5):
+        model(batch, training=False)
+        peak_rss = max(peak_rss, rss_mb())
+    batch_seconds = (time.perf_counter() - start) / 5
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'model.h5')
+        model.save(path)
+        size_mb = os.path.getsize(path) / 1024 / 1024
+
+    return {
+        'latency_ms_p50': float(np.percentile(samples, 50)),
+        'latency_ms_p95': float(np.percentile(samples, 95)),
+        'batch_images_per_sec': BATCH_SIZE / batch_seconds,
+        'runtime_memory_mb': peak_rss - rss_before,
+        'params': int(model.count_params()),
+        'model_size_mb': size_mb,
+    }
+
+def pareto_front(results):
+    """
+    Marca las configuraciones que no están dominadas
+
+    Una configuración domina a otra si es al menos igual de precisa y de
+    rápida (latencia p50) y estrictamente mejor en alguna de las dos.
+    """
+    for result in results:
+        result['pareto'] = not any(
+            other is not result
+            and other['accuracy'] >= result['accuracy']
+            and other['latency_ms_p50'] <= result['latency_ms_p50']
+            and (other['accuracy'] > result['accuracy'] or other['latency_ms_p50'] < result['latency_ms_p50'])
+            for other in results
+        )
+    return results
+
+def recommend(results, tolerance):
+    """La configuración más rápida cuya precisión queda a `tolerance` de la mejor"""
+    best_accuracy = max(result['accuracy'] for result in results)
+    candidates = [result for result in results if result['accuracy'] >= best_accuracy - tolerance]
+    return min(candidates, key=lambda result: result['latency_ms_p50'])
+
+def plot_sweep(results, chosen, output_path):
+    """Gráfica de precisión frente a latencia con el frente de Pareto"""
+    plt.figure(figsize=(9, 6))
+    for result in results:
+        plt.scatter(result['latency_ms_p50'], result['accuracy'],
+                    c='tab:red' if result['pareto'] else 'tab:gray', s=20 + result['img_size'] / 2)
+        plt.annotate(f"α{result['alpha']:g}/{result['img_size']}",
+                     (result['latency_ms_p50'], result['accuracy']), fontsize=8,
+                     xytext=(4, 4), textcoords='offset points')
+    front = sorted((r for r in results if r['pareto']), key=lambda r: r['latency_ms_p50'])
+    plt.plot([r['latency_ms_p50'] for r in front], [r['accuracy'] for r in front], 'r--', linewidth=1)
+    plt.scatter(chosen['latency_ms_p50'], chosen['accuracy'], marker='*', s=300, c='gold',
+                edgecolors='black', label='Recomendada')
+    plt.xlabel('Latencia p50 en CPU, lote de 1 (ms)')
+    plt.ylabel('Precisión media de validación cruzada')
+    plt.title('MobileNetV2: precisión frente a latencia')
+    plt.legend()
+    plt.grid(alpha=0.3)
+    plt.tight_layout()
+    plt.savefig(output_path)
+    plt.close()
+
+def write_report(results, chosen, output_dir, args):
+    """Guarda el informe en JSON y en texto, la gráfica y la configuración recomendada"""
+    report = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'k_folds': args.k_folds,
+        'epochs': args.epochs,
+        'tolerance': args.tolerance,
+        'results': results,
+        'recommended': {'alpha': chosen['alpha'], 'img_height': chosen['img_size'],
+                        'img_width': chosen['img_size']},
+    }
+    with open(os.path.join(output_dir, 'sweep_report.json'), 'w') as f:
+        json.dump(report, f, indent=2)
+
+    with open(os.path.join(output_dir, 'sweep_report.txt'), 'w') as f:
+        f.write(f"{'alpha':>6} {'tamaño':>6} {'precisión':>10} {'p50 ms':>8} {'p95 ms':>8} "
+                f"{'img/s':>7} {'RSS MB':>7} {'MB':>6} {'Pareto':>6}\n")
+        for r in sorted(results, key=lambda r: r['latency_ms_p50']):
+            marker = '*' if r is chosen else ''
+            f.write(f"{r['alpha']:>6g} {r['img_size']:>6} {r['accuracy']:>10.4f} {r['latency_ms_p50']:>8.2f} "
+                    f"{r['latency_ms_p95']:>8.2f} {r['batch_images_per_sec']:>7.1f} {r['runtime_memory_mb']:>7.1f} "
+                    f"{r['model_size_mb']:>6.1f} "
+                    f"{'sí' if r['pareto'] else '':>6}{marker}\n")
+        f.write(f"\nRecomendada (*): alpha {chosen['alpha']:g}, {chosen['img_size']}x{chosen['img_size']}\n")
+        f.write(f"Entrenar con: MODEL_ALPHA={chosen['alpha']:g} IMG_SIZE={chosen['img_size']} python main.py\n")
+
+    plot_sweep(results, chosen, os.path.join(output_dir, 'sweep_pareto.png'))
+
+def main():
+    """Función principal"""
+    args = parse_args()
+    alphas = [float(alpha) for alpha in args.alphas.split(',')]
+    sizes = [int(size) for size in args.sizes.split(',')]
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    results = []
+    for img_size in sizes:
+        # Una caché del dataset por tamaño: cambiar de tamaño no invalida las demás
+        X, y, class_names = prepare_dataset(args.data_dir, img_size, img_size, fast_decode=FAST_DECODE,
+                                            cache_dir=os.path.join(DATASET_CACHE_DIR, f'sweep_{img_size}'))
+        num_classes = len(class_names)
+
+        for alpha in alphas:
+            print(f"\n=== alpha {alpha:g}, {img_size}x{img_size} ===")
+            features, _ = load_or_compute_features(
+                X,
+                lambda: create_feature_extractor(alpha=alpha, img_size=img_size),
+                batch_size=BATCH_SIZE,
+                cache_key=feature_cache_key(alpha, img_size, img_size)
+            )
+            accuracies = cross_validate_head(features, y, num_classes, args.k_folds, args.epochs)
+
+            # La latencia no depende de los pesos de la cabeza: basta el modelo sin entrenar
+            measurements = measure_model(lambda: create_model(num_classes, alpha=alpha, img_size=img_size),
+                                         img_size, args.latency_repeats)
+            result = {
+                'alpha': alpha,
+                'img_size': img_size,
+                'accuracy': float(np.mean(accuracies)),
+                'accuracy_std': float(np.std(accuracies)),
+                'fold_accuracies': accuracies,
+                'feature_dim': int(features.shape[1]),
+            }
+            result.update(measurements)
+            results.append(result)
+            print(f"Precisión {result['accuracy']:.4f} ± {result['accuracy_std']:.4f}, "
+                  f"latencia p50 {result['latency_ms_p50']:.2f} ms, memoria {result['runtime_memory_mb']:.0f} MB "
+                  f"(archivo {result['model_size_mb']:.1f} MB)")
+
+    pareto_front(results)
+    chosen = recommend(results, args.tolerance)
+    write_report(results, chosen, args.output_dir, args)
+
+    print(f"\n✅ Informe guardado en {args.output_dir}")
+    print(f"Recomendada: alpha {chosen['alpha']:g}, {chosen['img_size']}x{chosen['img_size']} "
+          f"(precisión {chosen['accuracy']:.4f}, p50 {chosen['latency_ms_p50']:.2f} ms)")
+    print(f"Para entrenarla: MODEL_ALPHA={chosen['alpha']:g} IMG_SIZE={chosen['img_size']} python main.py")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Predicción por lotes de muchas imágenes
+
+El modelo se carga una sola vez; las imágenes se decodifican en un pool de
+procesos que va por delante de la inferencia (se mantienen `prefetch` lotes
+en curso) y los resultados se escriben en JSONL o CSV a medida que termina
+cada lote, así que una ejecución interrumpida se puede reanudar.
+"""
+
+import csv
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from utils.image_utils import load_image_array, normalize_images
+
+# Extensiones que se buscan al recorrer directorios
+PREDICT_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.heic', '.heif')
+# Campos de cada resultado
+RESULT_FIELDS = ['path', 'class', 'confidence', 'error']
+
+def collect_image_paths(inputs):
+    """
+    Expande las entradas de la línea de comandos en una lista de imágenes
+
+    Args:
+        inputs: Rutas de imágenes, directorios (se recorren recursivamente),
+            patrones glob o archivos de lista (@lista.txt, una ruta por línea;
+            '-' lee la lista de la entrada estándar)
+
+    Returns:
+        Lista de rutas sin duplicados, en el orden de las entradas
+    """
+    paths = []
+    for item in inputs:
+        if item == '-':
+            paths.extend(line.strip() for line in sys.stdin if line.strip())
+        elif item.startswith('@'):
+            with open(item[1:], 'r') as f:
+                paths.extend(line.strip() for line in f if line.strip())
+        elif os.path.isdir(item):
+            for root, _, files in os.walk(item):
+                paths.extend(os.path.join(root, name) for name in sorted(files)
+                             if name.lower().endswith(PREDICT_EXTENSIONS))
+        elif glob.has_magic(item):
+            paths.extend(sorted(glob.glob(item, recursive=True)))
+        else:
+            paths.append(item)
+    return list(dict.fromkeys(paths))
+
+def decode_batch(paths, img_height, img_width, fast_decode):
+    """
+    Decodifica un lote de imágenes en uint8 (se ejecuta en un worker o en el daemon)
+
+    Returns:
+        images: Array uint8 con las imágenes que se pudieron leer
+        valid: Rutas de esas imágenes
+        errors: Lista de (ruta, mensaje de error)
+    """
+    images, valid, errors = [], [], []
+    for path in paths:
+        try:
+            images.append(load_image_array(path, img_height, img_width,
+                                           fast_decode=fast_decode, normalize=False))
+            valid.append(path)
+        except Exception as e:
+            errors.append((path, str(e)))
+    images = np.stack(images) if images else np.zeros((0, img_height, img_width, 3), dtype=np.uint8)
+    return images, valid, errors
+
+def iter_decoded_batches(paths, img_height, img_width, batch_size=32, num_workers=None,
+                         fast_decode=None, prefetch=None):
+    """
+    Decodifica las imágenes por lotes adelantándose al consumidor
+
+    Args:
+        paths: Rutas de las imágenes
+        img_height: Altura de entrada del modelo
+        img_width: Anchura de entrada del modelo
+        batch_size: Imágenes por lote
+        num_workers: Procesos de decodificación (None = todos los núcleos)
+        fast_decode: Decodificación JPEG reducida (None = valor de FAST_DECODE)
+        prefetch: Lotes en curso como máximo (None = 2 por worker); limita la memoria
+
+    Yields:
+        (imágenes uint8, rutas válidas, errores) en el orden de `paths`
+    """
+    batches = [paths[i:i + batch_size] for i in range(0, len(paths), batch_size)]
+    num_workers = num_workers or os.cpu_count() or 1
+
+    if num_workers <= 1 or len(batches) <= 1:
+        for batch in batches:
+            yield decode_batch(batch, img_height, img_width, fast_decode)
+        return
+
+    prefetch = prefetch or 2 * num_workers
+    # 'spawn': los workers no heredan el estado de TensorFlow del proceso principal
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=num_workers, mp_context=context) as executor:
+        pending = deque()
+        remaining = iter(batches)
+        for batch in remaining:
+            pending.append(executor.submit(decode_batch, batch, img_height, img_width, fast_decode))
+            if len(pending) >= prefetch:
+                break
+        while pending:
+            result = pending.popleft().result()
+            batch = next(remaining, None)
+            if batch is not None:
+                pending.append(executor.submit(decode_batch, batch, img_height, img_width, fast_decode))
+            yield result
+
+def predict_paths(model, class_names, paths, img_height=None, img_width=None, batch_size=32,
+                  num_workers=None, fast_decode=None, prefetch=None):
+    """
+    Clasifica una lista de imágenes por lotes
+
+    Args:
+        model: Modelo ya cargado (ver load_prediction_model)
+        class_names: Nombres de las clases
+        paths: Rutas de las imágenes
+        img_height: Altura de entrada (None = la del modelo)
+        img_width: Anchura de entrada (None = la del modelo)
+        batch_size: Imágenes por lote de inferencia
+        num_workers: Procesos de decodificación
+        fast_decode: Decodificación JPEG reducida (None = valor de FAST_DECODE)
+        prefetch: Lotes decodificados por adelantado como máximo
+
+    Yields:
+        Lista de resultados de cada lote (diccionarios con RESULT_FIELDS)
+    """
+    img_height = img_height or model.input_shape[1]
+    img_width = img_width or model.input_shape[2]
+    for images, valid, errors in iter_decoded_batches(paths, img_height, img_width, batch_size,
+                                                      num_workers, fast_decode, prefetch):
+        predictions = model.predict(normalize_images(images), verbose=0) if len(images) else []
+        yield build_results(valid, predictions, class_names, errors)
+
+def build_results(paths, predictions, class_names, errors=()):
+    """
+    Convierte las probabilidades de un lote en resultados
+
+    Args:
+        paths: Rutas de las imágenes predichas
+        predictions: Probabilidades por imagen (mismo orden que paths)
+        class_names: Nombres de las clases
+        errors: Lista de (ruta, mensaje de error) de las imágenes que fallaron
+
+    Returns:
+        Lista de diccionarios con RESULT_FIELDS
+    """
+    results = [{'path': path, 'class': None, 'confidence': None, 'error': message}
+               for path, message in errors]
+    for path, probs in zip(paths, predictions):
+        idx = int(np.argmax(probs))
+        results.append({'path': path, 'class': class_names[idx],
+                        'confidence': float(probs[idx]), 'error': None})
+    return results
+
+class ResultWriter:
+    """
+    Escribe resultados en JSONL o CSV (según la extensión) a medida que llegan
+
+    Args:
+        output_path: Ruta del archivo de salida (.jsonl o .csv; '-' = salida estándar en JSONL)
+        append: Añade al archivo existente en lugar de sobrescribirlo
+    """
+
+    def __init__(self, output_path, append=False):
+        self.format = 'csv' if output_path.lower().endswith('.csv') else 'jsonl'
+        write_header = True
+        if output_path == '-':
+            self._file = sys.stdout
+        else:
+            write_header = not (append and os.path.exists(output_path) and os.path.getsize(output_path))
+            self._file = open(output_path, 'a' if append else 'w', newline='')
+        if self.format == 'csv':
+            self._csv = csv.DictWriter(self._file, fieldnames=RESULT_FIELDS)
+            if write_header:
+                self._csv.writeheader()
+
+    def write(self, results):
+        """Escribe los resultados de un lote y vacía el buffer"""
+        for result in results:
+            if self.format == 'csv':
+                self._csv.writerow(result)
+            else:
+                self._file.write(json.dumps(result, ensure_ascii=False) + '\n')
+        self._file.flush()
+
+    def close(self):
+        """Cierra el archivo de salida"""
+        if self._file is not sys.stdout:
+            self._file.close()
+
+def read_results(output_path):
+    """
+    Lee un archivo de resultados JSONL o CSV
+
+    Yields:
+        Diccionario de cada resultado (se ignoran las líneas incompletas)
+    """
+    if output_path == '-' or not os.path.exists(output_path):
+        return
+    with open(output_path, 'r', newline='') as f:
+        if output_path.lower().endswith('.csv'):
+            yield from csv.DictReader(f)
+            return
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                # Última línea a medio escribir de una ejecución interrumpida
+                continue
+
+def read_done_paths(output_path):
+    """
+    Rutas ya clasificadas en un archivo de resultados anterior
+
+    Returns:
+        Conjunto de rutas (vacío si el archivo no existe)
+    """
+    return {result['path'] for result in read_results(output_path) if 'path' in result}
+
+def run_batch_prediction(predict_batches, paths, output_path, resume=False):
+    """
+    Clasifica las imágenes y va escribiendo los resultados
+
+    Args:
+        predict_batches: Función que recibe las rutas y produce los resultados
+            lote a lote (predict_paths con el modelo local o el cliente del daemon)
+        paths: Rutas de las imágenes
+        output_path: Archivo de resultados (.jsonl o .csv)
+        resume: Salta las imágenes que ya están en output_path y añade al final
+
+    Returns:
+        Diccionario con el número de imágenes clasificadas, errores y segundos
+    """
+    if resume:
+        done = read_done_paths(output_path)
+        if done:
+            print(f"Reanudando: {len(done)} imágenes ya clasificadas")
+        paths = [path for path in paths if path not in done]
+
+    writer = ResultWriter(output_path, append=resume)
+    processed = errors = 0
+    start = time.perf_counter()
+    try:
+        for results in predict_batches(paths):
+            writer.write(results)
+            processed += len(results)
+            errors += sum(1 for result in results if result['error'])
+            elapsed = time.perf_counter() - start
+            print(f"Clasificadas {processed}/{len(paths)} imágenes ({processed / elapsed:.1f} img/s)",
+                  end='\r', file=sys.stderr)
+    finally:
+        writer.close()
+    print(file=sys.stderr)
+
+    return {'images': processed, 'errors': errors, 'seconds': time.perf_counter() - start}
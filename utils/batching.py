@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Planificador de micro-lotes (micro-batching) para la inferencia del modelo
+
+Agrupa las peticiones concurrentes en un solo tensor para ejecutar una única
+pasada hacia adelante y devuelve a cada llamador su porción de resultados.
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+class _BatchRequest:
+    """Petición pendiente dentro de la cola del planificador"""
+
+    __slots__ = ('model', 'inputs', 'future')
+
+    def __init__(self, model, inputs, future):
+        self.model = model
+        self.inputs = inputs
+        self.future = future
+
+class MicroBatcher:
+    """
+    Agrupa peticiones de predicción concurrentes en lotes
+
+    Un hilo trabajador toma la primera petición de la cola y espera como máximo
+    `max_wait_ms` milisegundos a que lleguen más, hasta reunir `max_batch_size`
+    imágenes. Después ejecuta `model.predict` una sola vez y reparte las filas
+    del resultado entre los llamadores.
+
+    Args:
+        max_batch_size: Número máximo de imágenes por lote
+        max_wait_ms: Tiempo máximo de espera para completar un lote (milisegundos)
+        on_batch: Función opcional on_batch(tamaño_lote, segundos) llamada tras
+            cada pasada del modelo (p. ej. para métricas)
+    """
+
+    def __init__(self, max_batch_size=16, max_wait_ms=5.0, on_batch=None):
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.on_batch = on_batch
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _ensure_worker(self):
+        """Arranca el hilo trabajador si todavía no está en marcha"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name='micro-batcher', daemon=True
+                )
+                self._thread.start()
+
+    def submit(self, model, inputs):
+        """
+        Encola un lote de imágenes sin bloquear
+
+        Args:
+            model: Modelo con método predict (Keras o compatible)
+            inputs: Array de forma (n, alto, ancho, canales)
+
+        Returns:
+            future: Future que se resuelve con un array de forma (n, num_clases)
+        """
+        future = Future()
+        self._ensure_worker()
+        self._queue.put(_BatchRequest(model, inputs, future))
+        return future
+
+    def predict(self, model, inputs):
+        """
+        Encola un lote de imágenes y espera sus predicciones
+
+        Args:
+            model: Modelo con método predict (Keras o compatible)
+            inputs: Array de forma (n, alto, ancho, canales)
+
+        Returns:
+            predictions: Array de forma (n, num_clases) con las filas de este llamador
+        """
+        return self.submit(model, inputs).result()
+
+    def _collect(self):
+        """
+        Reúne las peticiones que formarán el siguiente lote
+
+        Returns:
+            requests: Lista de peticiones pendientes
+        """
+        first = self._queue.get()
+        requests = [first]
+        size = len(first.inputs)
+        deadline = time.monotonic() + self.max_wait
+
+        while size < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    # Sin esperar: sólo tomamos lo que ya esté en la cola
+                    item = self._queue.get_nowait()
+                else:
+                    item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            requests.append(item)
+            size += len(item.inputs)
+
+        return requests
+
+    def _run(self):
+        """Bucle principal del hilo trabajador"""
+        while True:
+            requests = self._collect()
+
+            # Agrupamos por modelo para no mezclar versiones distintas en un lote
+            groups = {}
+            for req in requests:
+                groups.setdefault(id(req.model), []).append(req)
+
+            for group in groups.values():
+                self._process(group)
+
+    def _process(self, requests):
+        """
+        Ejecuta una sola inferencia para un grupo de peticiones
+
+        Args:
+            requests: Peticiones que comparten el mismo modelo
+        """
+        model = requests[0].model
+        try:
+            if len(requests) == 1:
+                batch = requests[0].inputs
+            else:
+                batch = np.concatenate([req.inputs for req in requests], axis=0)
+
+            start = time.perf_counter()
+            predictions = model.predict(batch, verbose=0)
+            if self.on_batch is not None:
+                self.on_batch(len(batch), time.perf_counter() - start)
+
+            # Repartimos a cada llamador su porción del resultado
+            offset = 0
+            for req in requests:
+                count = len(req.inputs)
+                req.future.set_result(predictions[offset:offset + count])
+                offset += count
+        except Exception as e:
+            for req in requests:
+                if not req.future.done():
+                    req.future.set_exception(e)
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Puntos de control del entrenamiento con validación cruzada
+
+Cada ejecución usa un directorio (por defecto output/run) con:
+- run.json: configuración de la ejecución (para no mezclar ejecuciones distintas)
+- fold_<n>/last.h5 y fold_<n>/progress.json: último estado de un fold a medias
+  (incluido el de la parada temprana; sus mejores pesos, en best.weights.h5)
+- fold_<n>/model.h5 y fold_<n>/result.json: modelo y resultado de un fold terminado
+
+Al reiniciar se saltan los folds terminados y el fold a medias continúa
+desde la última época guardada (con el estado del optimizador).
+"""
+
+import json
+import os
+import time
+import tensorflow as tf
+
+def _write_json(path, data):
+    """Escribe un JSON de forma atómica"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+def _read_json(path, default=None):
+    """Lee un JSON o devuelve `default` si no existe"""
+    if not os.path.exists(path):
+        return default
+    with open(path, 'r') as f:
+        return json.load(f)
+
+class ResumableEarlyStopping(tf.keras.callbacks.Callback):
+    """
+    Parada temprana por val_loss cuyo estado sobrevive a una interrupción
+
+    Equivale a EarlyStopping(restore_best_weights=True), pero la mejor
+    pérdida y las épocas sin mejora se guardan con el punto de control de
+    la época (ver EpochCheckpoint) y los mejores pesos en disco, de modo
+    que un fold reanudado se comporta igual que uno sin interrumpir.
+
+    Args:
+        patience: Épocas sin mejorar antes de parar
+        fold_dir: Directorio del fold (None = mejores pesos sólo en memoria)
+        state: Estado guardado de una ejecución anterior (ver state())
+        monitor: Métrica vigilada (menor es mejor)
+    """
+
+    def __init__(self, patience, fold_dir=None, state=None, monitor='val_loss'):
+        super().__init__()
+        self.patience = patience
+        self.monitor = monitor
+        self.fold_dir = fold_dir
+        state = state or {}
+        self.best = state.get('best', float('inf'))
+        self.wait = state.get('wait', 0)
+        self.best_epoch = state.get('best_epoch')
+        self.best_weights = None
+
+    def _weights_path(self):
+        return os.path.join(self.fold_dir, 'best.weights.h5')
+
+    def state(self):
+        """Estado serializable (mejor valor, épocas sin mejora y época del mejor)"""
+        return {'best': self.best, 'wait': self.wait, 'best_epoch': self.best_epoch}
+
+    def on_epoch_end(self, epoch, logs=None):
+        current = (logs or {}).get(self.monitor)
+        if current is None:
+            return
+        if current < self.best:
+            self.best = float(current)
+            self.wait = 0
+            self.best_epoch = epoch
+            if self.fold_dir:
+                tmp_path = os.path.join(self.fold_dir, '.tmp_best.weights.h5')
+                self.model.save_weights(tmp_path)
+                os.replace(tmp_path, self._weights_path())
+            else:
+                self.best_weights = self.model.get_weights()
+        else:
+            self.wait += 1
+            if self.wait >= self.patience:
+                self.model.stop_training = True
+                print(f"Parada temprana: {self.monitor} sin mejorar en {self.wait} épocas")
+
+    def on_train_end(self, logs=None):
+        # Volvemos a los mejores pesos, también si se obtuvieron antes de reanudar
+        if self.best_weights is not None:
+            self.model.set_weights(self.best_weights)
+        elif self.fold_dir and self.best_epoch is not None and os.path.exists(self._weights_path()):
+            self.model.load_weights(self._weights_path())
+
+class EpochCheckpoint(tf.keras.callbacks.Callback):
+    """
+    Guarda el modelo y el historial al final de cada época
+
+    El modelo se escribe en un archivo temporal y se renombra antes de
+    actualizar progress.json, así que el progreso nunca apunta a un modelo
+    a medio escribir.
+
+    Args:
+        fold_dir: Directorio del fold
+        previous_history: Historial de las épocas de una ejecución anterior
+        early_stopping: ResumableEarlyStopping cuyo estado se guarda con la
+            época (debe ir antes que este callback en la lista)
+    """
+
+    def __init__(self, fold_dir, previous_history=None, early_stopping=None):
+        super().__init__()
+        self.fold_dir = fold_dir
+        self.history = {key: list(values) for key, values in (previous_history or {}).items()}
+        self.early_stopping = early_stopping
+
+    def on_epoch_end(self, epoch, logs=None):
+        for key, value in (logs or {}).items():
+            self.history.setdefault(key, []).append(float(value))
+
+        model_path = os.path.join(self.fold_dir, 'last.h5')
+        tmp_path = os.path.join(self.fold_dir, '.tmp_last.h5')
+        self.model.save(tmp_path)
+        os.replace(tmp_path, model_path)
+        progress = {
+            'epoch': epoch + 1,
+            'history': self.history,
+            'updated_at': time.time(),
+        }
+        if self.early_stopping is not None:
+            progress['early_stopping'] = self.early_stopping.state()
+        _write_json(os.path.join(self.fold_dir, 'progress.json'), progress)
+
+class TrainingRun:
+    """
+    Estado persistente de una ejecución de validación cruzada
+
+    Args:
+        run_dir: Directorio de la ejecución
+        config: Configuración de la ejecución. Si no coincide con la guardada,
+            el directorio anterior se aparta y se empieza de cero. None para
+            abrir una ejecución existente sin comprobarla (procesos worker).
+        restart: Aparta la ejecución anterior aunque la configuración coincida
+    """
+
+    def __init__(self, run_dir, config=None, restart=False):
+        self.run_dir = run_dir
+        run_path = os.path.join(run_dir, 'run.json')
+
+        if config is not None:
+            saved = _read_json(run_path)
+            if saved is not None and (restart or saved.get('config') != config):
+                # Conservamos la ejecución anterior por si se quiere consultar
+                archived = f"{run_dir.rstrip(os.sep)}.{time.strftime('%Y%m%d-%H%M%S')}"
+                os.replace(run_dir, archived)
+                reason = 'reinicio solicitado' if restart else 'la configuración cambió'
+                print(f"⚠️ Nueva ejecución ({reason}); la anterior se movió a {archived}")
+            os.makedirs(run_dir, exist_ok=True)
+            if not os.path.exists(run_path):
+                _write_json(run_path, {'config': config, 'created_at': time.time()})
+
+        os.makedirs(run_dir, exist_ok=True)
+
+    def fold_dir(self, fold_no):
+        """Directorio de un fold (se crea si no existe)"""
+        path = os.path.join(self.run_dir, f'fold_{fold_no}')
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def completed_folds(self):
+        """
+        Resultados de los folds terminados
+
+        Returns:
+            Diccionario fold_no -> {'val_accuracy', 'history', 'model_path'}
+        """
+        folds = {}
+        for name in os.listdir(self.run_dir):
+            if not name.startswith('fold_'):
+                continue
+            result = _read_json(os.path.join(self.run_dir, name, 'result.json'))
+            if result is not None:
+                folds[int(name[len('fold_'):])] = result
+        return folds
+
+    def resume_state(self, fold_no):
+        """
+        Estado de un fold a medias
+
+        Returns:
+            (ruta del modelo, época inicial, historial previo) o None
+        """
+        fold_dir = os.path.join(self.run_dir, f'fold_{fold_no}')
+        progress = _read_json(os.path.join(fold_dir, 'progress.json'))
+        model_path = os.path.join(fold_dir, 'last.h5')
+        if progress is None or not os.path.exists(model_path):
+            return None
+        return model_path, progress['epoch'], progress['history']
+
+    def checkpoint_callback(self, fold_no, previous_history=None, early_stopping=None):
+        """Callback que guarda el fold (y la parada temprana) al final de cada época"""
+        return EpochCheckpoint(self.fold_dir(fold_no), previous_history, early_stopping)
+
+    def early_stopping_callback(self, fold_no, patience):
+        """
+        Parada temprana del fold, con el estado guardado si el fold se reanuda
+
+        Returns:
+            ResumableEarlyStopping
+        """
+        fold_dir = self.fold_dir(fold_no)
+        state = None
+        if self.resume_state(fold_no) is not None:
+            state = _read_json(os.path.join(fold_dir, 'progress.json')).get('early_stopping')
+        return ResumableEarlyStopping(patience, fold_dir, state)
+
+    def record_fold(self, fold_no, model, history, val_accuracy):
+        """
+        Guarda el modelo final de un fold y lo marca como terminado
+
+        Args:
+            fold_no: Número del fold
+            model: Modelo entrenado
+            history: Historial completo (diccionario métrica -> valores)
+            val_accuracy: Precisión de validación
+
+        Returns:
+            Ruta del modelo guardado
+        """
+        fold_dir = self.fold_dir(fold_no)
+        model_path = os.path.join(fold_dir, 'model.h5')
+        tmp_path = os.path.join(fold_dir, '.tmp_model.h5')
+        model.save(tmp_path)
+        os.replace(tmp_path, model_path)
+
+        # Un archivo por fold: los folds paralelos no compiten por el mismo
+        _write_json(os.path.join(fold_dir, 'result.json'), {
+            'val_accuracy': float(val_accuracy),
+            'history': history,
+            'model_path': model_path,
+            'finished_at': time.time(),
+        })
+
+        # El punto de control intermedio ya no hace falta
+        for name in ('last.h5', 'progress.json', 'best.weights.h5'):
+            try:
+                os.remove(os.path.join(fold_dir, name))
+            except OSError:
+                pass
+        return model_path
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cliente del daemon de inferencia local (predict_daemon.py)
+
+Sólo usa la biblioteca estándar: un cliente que encuentra el daemon en
+marcha no importa TensorFlow ni numpy. El protocolo es una línea JSON por
+petición y otra por respuesta sobre un socket de dominio Unix.
+"""
+
+import json
+import os
+import socket
+
+# Socket por defecto del daemon
+DAEMON_SOCKET = os.environ.get('PREDICT_DAEMON_SOCKET', os.path.join('output', 'predict_daemon.sock'))
+# Segundos de espera para conectar (si no responde, se usa la inferencia local)
+CONNECT_TIMEOUT = 0.5
+
+class DaemonUnavailable(Exception):
+    """El daemon no está en marcha o no sirve el modelo pedido"""
+
+def send_request(payload, socket_path=DAEMON_SOCKET, timeout=None):
+    """
+    Envía una petición al daemon y espera su respuesta
+
+    Args:
+        payload: Diccionario de la petición
+        socket_path: Ruta del socket del daemon
+        timeout: Segundos de espera de la respuesta (None = sin límite)
+
+    Returns:
+        Diccionario de la respuesta
+
+    Raises:
+        DaemonUnavailable: Si no hay daemon escuchando en el socket
+    """
+    if not hasattr(socket, 'AF_UNIX') or not os.path.exists(socket_path):
+        raise DaemonUnavailable(f"No hay daemon en {socket_path}")
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(CONNECT_TIMEOUT)
+        try:
+            sock.connect(socket_path)
+        except OSError as e:
+            # Socket huérfano de un daemon que ya no existe
+            raise DaemonUnavailable(f"No se pudo conectar con {socket_path}: {e}")
+        sock.settimeout(timeout)
+        sock.sendall(json.dumps(payload).encode('utf-8') + b'\n')
+        with sock.makefile('rb') as stream:
+            line = stream.readline()
+    finally:
+        sock.close()
+
+    if not line:
+        raise DaemonUnavailable("El daemon cerró la conexión sin responder")
+    response = json.loads(line)
+    if 'error' in response:
+        raise RuntimeError(f"Error del daemon: {response['error']}")
+    return response
+
+def connect_daemon(model_path, class_names_path, socket_path=DAEMON_SOCKET):
+    """
+    Comprueba que el daemon está en marcha y sirve el mismo modelo
+
+    Args:
+        model_path: Ruta del modelo que se quiere usar
+        class_names_path: Ruta de los nombres de clases
+        socket_path: Ruta del socket del daemon
+
+    Returns:
+        Respuesta del ping (versión, rutas y tamaño de entrada) o None si no
+        se puede usar el daemon
+    """
+    try:
+        info = send_request({'cmd': 'ping'}, socket_path, timeout=CONNECT_TIMEOUT * 4)
+    except (DaemonUnavailable, RuntimeError, OSError, ValueError):
+        return None
+    # Con otro modelo los resultados no serían los esperados
+    if (info.get('model_path') != os.path.realpath(model_path)
+            or info.get('class_names_path') != os.path.realpath(class_names_path)):
+        print(f"⚠️ El daemon sirve {info.get('model_path')}; se usa la inferencia local")
+        return None
+    return info
+
+def iter_daemon_predictions(paths, socket_path=DAEMON_SOCKET, batch_size=32, fast_decode=None):
+    """
+    Clasifica imágenes con el daemon, por lotes
+
+    Las rutas se envían absolutas (el daemon puede tener otro directorio de
+    trabajo) y los resultados conservan la ruta original.
+
+    Args:
+        paths: Rutas de las imágenes
+        socket_path: Ruta del socket del daemon
+        batch_size: Imágenes por petición
+        fast_decode: Decodificación JPEG reducida (None = valor por defecto del daemon)
+
+    Yields:
+        Lista de resultados de cada lote (mismo formato que batch_predict.predict_paths)
+    """
+    for i in range(0, len(paths), batch_size):
+        batch = paths[i:i + batch_size]
+        absolute = {os.path.abspath(path): path for path in batch}
+        response = send_request({'cmd': 'predict', 'paths': list(absolute), 'fast_decode': fast_decode},
+                                socket_path)
+        for result in response['results']:
+            result['path'] = absolute.get(result['path'], result['path'])
+        yield response['results']
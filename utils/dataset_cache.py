@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Caché incremental del dataset decodificado
+
+El manifiesto (data/cache/manifest.json) registra, por cada imagen de
+data/raw, su tamaño, fecha de modificación, hash del contenido, clase,
+partición (entrenamiento/prueba) y la fila que ocupa en el array de
+imágenes. Las imágenes decodificadas se guardan en un .npy uint8 que se
+abre con memoria mapeada.
+
+En cada ejecución sólo se leen (para calcular el hash) los archivos cuyo
+tamaño o fecha cambiaron y sólo se decodifican los nuevos o modificados;
+el resto se copia desde el array anterior. Las particiones se deciden con
+el hash del contenido y se conservan entre ejecuciones.
+"""
+
+import hashlib
+import json
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from utils.image_utils import load_image_array
+
+# Directorio por defecto de la caché del dataset
+DATASET_CACHE_DIR = os.path.join('data', 'cache')
+# Versión del formato del manifiesto
+MANIFEST_VERSION = 1
+
+def file_sha1(path, chunk_size=1024 * 1024):
+    """
+    Calcula el hash SHA-1 del contenido de un archivo
+
+    Returns:
+        Cadena hexadecimal
+    """
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def assign_split(content_hash, test_split):
+    """
+    Asigna una partición estable a partir del hash del contenido
+
+    Args:
+        content_hash: Hash hexadecimal de la imagen
+        test_split: Proporción esperada del conjunto de prueba
+
+    Returns:
+        'test' o 'train'
+    """
+    return 'test' if int(content_hash[:8], 16) / 0xFFFFFFFF < test_split else 'train'
+
+def allocate_image_array(directory, shape):
+    """
+    Crea un .npy uint8 en disco y lo abre con memoria mapeada para escritura
+
+    Los procesos de decodificación escriben directamente en sus filas, así
+    que los resultados no se devuelven ni se copian al proceso principal.
+
+    Args:
+        directory: Directorio donde crear el archivo
+        shape: Forma del array (n, alto, ancho, 3)
+
+    Returns:
+        np.memmap (su ruta está en el atributo filename)
+    """
+    os.makedirs(directory, exist_ok=True)
+    fd, path = tempfile.mkstemp(prefix='.building_', suffix='.npy', dir=directory)
+    os.close(fd)
+    return np.lib.format.open_memmap(path, mode='w+', dtype=np.uint8, shape=tuple(shape))
+
+def _decode_chunk(array_path, items, img_height, img_width, fast_decode):
+    """
+    Decodifica un bloque de imágenes en sus filas del array (se ejecuta en un worker)
+
+    Returns:
+        Lista de (fila, ruta, mensaje de error) de las imágenes que fallaron
+    """
+    X = np.load(array_path, mmap_mode='r+')
+    errors = []
+    for row, path in items:
+        try:
+            X[row] = load_image_array(path, img_height, img_width,
+                                      fast_decode=fast_decode, normalize=False)
+        except Exception as e:
+            errors.append((row, path, str(e)))
+    X.flush()
+    return errors
+
+def decode_into_array(X, items, fast_decode=None, num_workers=None, chunk_size=32):
+    """
+    Decodifica imágenes en paralelo escribiendo en las filas indicadas de X
+
+    Args:
+        X: Array creado con allocate_image_array
+        items: Lista de (fila, ruta)
+        fast_decode: Usa la decodificación reducida (None = valor de FAST_DECODE)
+        num_workers: Procesos de decodificación (None = todos los núcleos)
+        chunk_size: Imágenes por tarea enviada a un worker
+
+    Returns:
+        Diccionario fila -> mensaje de error de las imágenes que fallaron
+    """
+    img_height, img_width = X.shape[1:3]
+    num_workers = num_workers or os.cpu_count() or 1
+    chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+    errors = {}
+
+    def report(chunk_errors):
+        for row, path, message in chunk_errors:
+            print(f"Error procesando {path}: {message}")
+            errors[row] = message
+
+    # Con poco trabajo no compensa arrancar procesos
+    if num_workers <= 1 or len(chunks) <= 1:
+        for chunk in chunks:
+            report(_decode_chunk(X.filename, chunk, img_height, img_width, fast_decode))
+        return errors
+
+    X.flush()
+    # 'spawn': los workers no heredan el estado de TensorFlow del proceso principal
+    context = multiprocessing.get_context('spawn')
+    done = 0
+    with ProcessPoolExecutor(max_workers=min(num_workers, len(chunks)), mp_context=context) as executor:
+        futures = {executor.submit(_decode_chunk, X.filename, chunk, img_height, img_width, fast_decode): chunk
+                   for chunk in chunks}
+        for future in as_completed(futures):
+            report(future.result())
+            done += len(futures[future])
+            print(f"Decodificadas {done}/{len(items)} imágenes", end='\r')
+    print()
+    return errors
+
+def _manifest_path(cache_dir):
+    """Ruta del manifiesto"""
+    return os.path.join(cache_dir, 'manifest.json')
+
+def load_manifest(cache_dir):
+    """
+    Lee el manifiesto y abre los arrays del dataset que describe
+
+    Args:
+        cache_dir: Directorio de la caché
+
+    Returns:
+        manifest: Diccionario del manifiesto (vacío si no existe o no es válido)
+        X: Imágenes mapeadas en memoria (solo lectura) o None
+        y: Índices de clase o None
+    """
+    manifest_path = _manifest_path(cache_dir)
+    if not os.path.exists(manifest_path):
+        return {}, None, None
+    try:
+        with open(manifest_path, 'r') as f:
+            manifest = json.load(f)
+        if manifest.get('version') != MANIFEST_VERSION:
+            return {}, None, None
+        X = np.load(os.path.join(cache_dir, manifest['arrays']['X']), mmap_mode='r')
+        y = np.load(os.path.join(cache_dir, manifest['arrays']['y']))
+    except (OSError, ValueError, KeyError) as e:
+        print(f"⚠️ Caché del dataset inválida, se reconstruye: {e}")
+        return {}, None, None
+    return manifest, X, y
+
+def save_dataset(cache_dir, manifest, X, y):
+    """
+    Guarda los arrays del dataset y el manifiesto que los describe
+
+    Cada versión escribe arrays con nombre propio y después sustituye el
+    manifiesto de forma atómica, así que una interrupción nunca deja un
+    manifiesto que apunte a arrays de otra versión.
+
+    Args:
+        cache_dir: Directorio de la caché
+        manifest: Diccionario del manifiesto
+        X: Imágenes uint8 de forma (n, alto, ancho, 3)
+        y: Índices de clase de forma (n,)
+
+    Returns:
+        X: Imágenes mapeadas en memoria (solo lectura) desde el array guardado,
+            igual que las devuelve load_dataset
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    previous = manifest.get('arrays', {})
+
+    build = hashlib.sha1(json.dumps(manifest['files'], sort_keys=True).encode('utf-8')).hexdigest()[:12]
+    arrays = {'X': f"dataset_{build}_X.npy", 'y': f"dataset_{build}_y.npy"}
+    for name, array in (('X', X), ('y', y)):
+        path = os.path.join(cache_dir, arrays[name])
+        if isinstance(array, np.memmap) and os.path.dirname(os.path.abspath(array.filename)) == \
+                os.path.abspath(cache_dir):
+            # Ya está escrito en disco (allocate_image_array): sólo se renombra
+            array.flush()
+            os.replace(array.filename, path)
+        else:
+            np.save(path + '.tmp.npy', array)
+            os.replace(path + '.tmp.npy', path)
+
+    manifest['version'] = MANIFEST_VERSION
+    manifest['samples'] = int(len(X))
+    manifest['arrays'] = arrays
+
+    manifest_path = _manifest_path(cache_dir)
+    with open(manifest_path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(manifest_path + '.tmp', manifest_path)
+
+    # Borramos los arrays de la versión anterior
+    for name in previous.values():
+        if name not in arrays.values():
+            try:
+                os.remove(os.path.join(cache_dir, name))
+            except OSError:
+                pass
+
+    print(f"Dataset guardado en caché: {arrays['X']} ({X.nbytes / 1024 / 1024:.1f} MB)")
+
+    # Un memmap renombrado conserva la ruta temporal en .filename: lo reabrimos
+    # desde la ruta definitiva para que otros procesos puedan abrirlo
+    return np.load(os.path.join(cache_dir, arrays['X']), mmap_mode='r')
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Caché en disco de las características del backbone congelado
+
+Con MobileNetV2 congelado, la salida del backbone para una imagen no cambia
+entre épocas ni entre folds. Se calcula una sola vez (más, opcionalmente,
+algunas variantes aumentadas) y el entrenamiento de la validación cruzada
+trabaja sólo sobre la cabeza densa con esos vectores.
+"""
+
+import hashlib
+import json
+import os
+import time
+import numpy as np
+from utils.image_utils import normalize_images
+
+# Directorio por defecto de la caché de características
+FEATURE_CACHE_DIR = os.path.join('data', 'cache', 'features')
+
+def dataset_fingerprint(X, extra=None):
+    """
+    Calcula una huella del dataset para invalidar la caché cuando cambia
+
+    Args:
+        X: Imágenes del dataset
+        extra: Parámetros adicionales que afectan a las características
+
+    Returns:
+        Cadena hexadecimal corta
+    """
+    digest = hashlib.sha1()
+    digest.update(repr((X.shape, str(X.dtype), extra)).encode('utf-8'))
+    # Recorremos por bloques para no duplicar en memoria un dataset grande
+    for i in range(0, len(X), 256):
+        digest.update(np.ascontiguousarray(X[i:i + 256]).tobytes())
+    return digest.hexdigest()[:16]
+
+def feature_cache_key(alpha, img_height, img_width):
+    """
+    Identifica el backbone MobileNetV2 y el tamaño de entrada en la caché
+
+    Args:
+        alpha: Multiplicador de anchura del backbone
+        img_height: Altura de entrada
+        img_width: Anchura de entrada
+
+    Returns:
+        Texto para el parámetro cache_key
+    """
+    # Con el alpha por defecto se conserva la clave anterior (y las cachés ya calculadas)
+    prefix = 'mobilenetv2' if float(alpha) == 1.0 else f'mobilenetv2-a{float(alpha):g}'
+    return f"{prefix}-imagenet-avg-{img_height}x{img_width}"
+
+def _save_array(path, array):
+    """Guarda un array de forma atómica (escritura temporal y renombrado)"""
+    tmp_path = path + '.tmp.npy'
+    np.save(tmp_path, array)
+    os.replace(tmp_path, path)
+
+def compute_features(backbone, X, batch_size=64, transform=None):
+    """
+    Pasa las imágenes por el backbone por lotes
+
+    Args:
+        backbone: Modelo de Keras que devuelve un vector por imagen
+        X: Imágenes (uint8 o normalizadas) de forma (n, alto, ancho, 3)
+        batch_size: Tamaño del lote de inferencia
+        transform: Función opcional aplicada a cada imagen antes del backbone
+            (por ejemplo, un aumento de datos aleatorio)
+
+    Returns:
+        Array float32 de forma (n, dimensión)
+    """
+    outputs = []
+    for i in range(0, len(X), batch_size):
+        batch = normalize_images(X[i:i + batch_size])
+        if transform is not None:
+            batch = np.stack([transform(image) for image in batch])
+        outputs.append(backbone.predict(batch, verbose=0).astype(np.float32))
+    return np.concatenate(outputs, axis=0)
+
+def load_or_compute_features(X, backbone_fn, cache_dir=FEATURE_CACHE_DIR, augmented_copies=0,
+                             augment_fn=None, batch_size=64, cache_key=None, seed=42):
+    """
+    Obtiene las características del dataset desde la caché o las calcula
+
+    Args:
+        X: Imágenes (uint8 o normalizadas) de forma (n, alto, ancho, 3)
+        backbone_fn: Función sin argumentos que crea el backbone (sólo se
+            llama si hay que calcular algo)
+        cache_dir: Directorio de la caché
+        augmented_copies: Número de variantes aumentadas por imagen
+        augment_fn: Función que aumenta una imagen (necesaria si augmented_copies > 0)
+        batch_size: Tamaño del lote de inferencia
+        cache_key: Texto que identifica el backbone y el preprocesamiento
+        seed: Semilla para que las variantes aumentadas sean reproducibles
+
+    Returns:
+        features: Array de forma (n, dimensión)
+        augmented: Array de forma (augmented_copies, n, dimensión) o None
+    """
+    if augmented_copies > 0 and augment_fn is None:
+        raise ValueError("Se necesita augment_fn para calcular variantes aumentadas")
+
+    os.makedirs(cache_dir, exist_ok=True)
+    fingerprint = dataset_fingerprint(X, cache_key)
+    features_path = os.path.join(cache_dir, f"features_{fingerprint}.npy")
+    augmented_path = os.path.join(cache_dir, f"features_{fingerprint}_aug{augmented_copies}_s{seed}.npy")
+    meta_path = os.path.join(cache_dir, f"features_{fingerprint}.json")
+
+    features = np.load(features_path) if os.path.exists(features_path) else None
+    augmented = None
+    if augmented_copies > 0 and os.path.exists(augmented_path):
+        augmented = np.load(augmented_path)
+
+    if features is not None and (augmented_copies == 0 or augmented is not None):
+        print(f"Características cargadas de la caché ({features_path})")
+        return features, augmented
+
+    backbone = backbone_fn()
+    start = time.perf_counter()
+
+    if features is None:
+        print(f"Calculando características del backbone para {len(X)} imágenes...")
+        features = compute_features(backbone, X, batch_size=batch_size)
+        _save_array(features_path, features)
+
+    if augmented_copies > 0 and augmented is None:
+        np.random.seed(seed)
+        variants = []
+        for copy in range(augmented_copies):
+            print(f"Calculando variante aumentada {copy + 1}/{augmented_copies}...")
+            variants.append(compute_features(backbone, X, batch_size=batch_size, transform=augment_fn))
+        augmented = np.stack(variants)
+        _save_array(augmented_path, augmented)
+
+    with open(meta_path, 'w') as f:
+        json.dump({
+            'samples': int(len(X)),
+            'feature_dim': int(features.shape[1]),
+            'cache_key': cache_key,
+            'augmented_copies': int(augmented_copies),
+            'seconds': round(time.perf_counter() - start, 2),
+        }, f, indent=2)
+
+    print(f"Características guardadas en {cache_dir} ({time.perf_counter() - start:.1f} s)")
+    return features, augmented
+
+def load_or_compute_row_features(X, backbone_fn, cache_key, cache_dir=FEATURE_CACHE_DIR, batch_size=64):
+    """
+    Obtiene las características imagen a imagen, reutilizando las ya calculadas
+
+    A diferencia de load_or_compute_features, la caché se indexa por el hash
+    de cada imagen decodificada: al añadir imágenes (por ejemplo, una clase
+    nueva) sólo se pasan por el backbone las que no se habían visto.
+
+    Args:
+        X: Imágenes (uint8 o normalizadas) de forma (n, alto, ancho, 3)
+        backbone_fn: Función sin argumentos que crea el backbone
+        cache_key: Texto que identifica el backbone y el preprocesamiento
+        cache_dir: Directorio de la caché
+        batch_size: Tamaño del lote de inferencia
+
+    Returns:
+        Array float32 de forma (n, dimensión)
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    store_name = hashlib.sha1(cache_key.encode('utf-8')).hexdigest()[:12]
+    store_path = os.path.join(cache_dir, f"rows_{store_name}.npz")
+
+    keys = [hashlib.sha1(np.ascontiguousarray(X[i]).tobytes()).hexdigest() for i in range(len(X))]
+
+    known = {}
+    if os.path.exists(store_path):
+        with np.load(store_path) as store:
+            known = dict(zip(store['keys'].tolist(), store['features']))
+
+    missing = sorted({i for i, key in enumerate(keys) if key not in known})
+    print(f"Características: {len(keys) - len(missing)} en caché, {len(missing)} por calcular")
+
+    if missing:
+        features = compute_features(backbone_fn(), X[missing], batch_size=batch_size)
+        for i, feature in zip(missing, features):
+            known[keys[i]] = feature
+
+        store_keys = list(known)
+        tmp_path = store_path[:-len('.npz')] + '.tmp.npz'
+        np.savez(tmp_path, keys=np.array(store_keys), features=np.stack([known[key] for key in store_keys]))
+        os.replace(tmp_path, store_path)
+
+    return np.stack([known[key] for key in keys])
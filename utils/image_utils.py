@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Utilidades de decodificación de imágenes compartidas por el servidor,
+predict.py y la preparación del dataset
+
+Incluye la decodificación rápida de JPEG a resolución reducida (modo draft
+de Pillow / escalado DCT) y la lectura de HEIC desde memoria.
+"""
+
+import io
+import os
+import numpy as np
+from PIL import Image
+
+# Decodificación rápida activada por defecto (FAST_DECODE=0 usa decodificación completa)
+FAST_DECODE = os.environ.get('FAST_DECODE', '1').lower() not in ('0', 'false', 'no')
+
+def is_heic_data(header):
+    """
+    Verifica si los primeros bytes de un archivo corresponden a HEIC/HEIF
+
+    Args:
+        header: Primeros bytes del archivo (al menos 12)
+
+    Returns:
+        True si tiene los bytes característicos de HEIC/HEIF
+    """
+    return b'ftyp' in header and (b'heic' in header or b'heif' in header or b'mif1' in header)
+
+def decode_heic_bytes(image_bytes):
+    """
+    Decodifica una imagen HEIC/HEIF directamente desde memoria
+
+    Args:
+        image_bytes: Contenido del archivo HEIC
+
+    Returns:
+        Imagen PIL en modo RGB
+    """
+    try:
+        # Intentamos importar pillow_heif primero
+        try:
+            import pillow_heif
+            pillow_heif.register_heif_opener()
+
+            # Al registrar el opener, PIL puede abrir datos HEIC directamente
+            return Image.open(io.BytesIO(image_bytes)).convert('RGB')
+
+        except ImportError:
+            # Si no está disponible pillow_heif, intentamos con pyheif
+            try:
+                import pyheif
+
+                # pyheif acepta directamente los bytes del archivo
+                heif_file = pyheif.read(image_bytes)
+
+                # Convertimos a PIL Image
+                img = Image.frombytes(
+                    heif_file.mode,
+                    heif_file.size,
+                    heif_file.data,
+                    "raw",
+                    heif_file.mode,
+                    heif_file.stride,
+                )
+                return img.convert('RGB')
+
+            except ImportError:
+                # Si ninguna librería está disponible
+                raise ImportError('No se puede procesar HEIC. Instale pillow_heif o pyheif')
+    except Exception as e:
+        raise Exception(f'Error al convertir imagen HEIC: {str(e)}')
+
+def heic_decoder_available():
+    """
+    Comprueba si hay alguna librería para decodificar HEIC en Python
+
+    Returns:
+        True si pillow_heif o pyheif están instalados
+    """
+    for module in ('pillow_heif', 'pyheif'):
+        try:
+            __import__(module)
+            return True
+        except ImportError:
+            continue
+    return False
+
+def convert_heic_file(heic_path, jpg_path):
+    """
+    Convierte un archivo HEIC a JPG (se puede ejecutar en un proceso worker)
+
+    El JPG se escribe en un archivo temporal y se renombra, para que una
+    conversión interrumpida no deje un JPG truncado que parezca actualizado.
+
+    Args:
+        heic_path: Ruta del archivo HEIC
+        jpg_path: Ruta del JPG de salida
+
+    Returns:
+        (heic_path, mensaje de error o None)
+    """
+    try:
+        with open(heic_path, 'rb') as f:
+            img = decode_heic_bytes(f.read())
+        tmp_path = os.path.join(os.path.dirname(jpg_path), '.tmp_' + os.path.basename(jpg_path))
+        img.save(tmp_path, 'JPEG')
+        os.replace(tmp_path, jpg_path)
+        return heic_path, None
+    except Exception as e:
+        return heic_path, str(e)
+
+def open_image(source, target_size=None, fast_decode=None):
+    """
+    Abre una imagen en RGB, decodificando JPEG a resolución reducida si es posible
+
+    Con `fast_decode` y un `target_size`, el decodificador JPEG escala en el
+    dominio DCT (1/2, 1/4 o 1/8) hasta el menor tamaño que sigue siendo mayor
+    o igual que el objetivo, de modo que el redimensionado final parte de una
+    imagen mucho más pequeña.
+
+    Args:
+        source: Ruta, bytes o archivo abierto
+        target_size: Tamaño final (ancho, alto) o None para decodificar completa
+        fast_decode: Usa la decodificación reducida (None = valor de FAST_DECODE)
+
+    Returns:
+        Imagen PIL en modo RGB
+    """
+    if fast_decode is None:
+        fast_decode = FAST_DECODE
+
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        image_bytes = bytes(source)
+        if is_heic_data(image_bytes[:12]):
+            return decode_heic_bytes(image_bytes)
+        source = io.BytesIO(image_bytes)
+    elif isinstance(source, str) and source.lower().endswith(('.heic', '.heif')):
+        with open(source, 'rb') as f:
+            return decode_heic_bytes(f.read())
+
+    img = Image.open(source)
+
+    # draft sólo tiene efecto en JPEG; en otros formatos no hace nada
+    if fast_decode and target_size is not None and img.format == 'JPEG':
+        img.draft('RGB', tuple(target_size))
+
+    return img.convert('RGB')
+
+def normalize_images(images):
+    """
+    Convierte imágenes uint8 a float32 en [0, 1] (las flotantes sólo se convierten a float32)
+
+    El dataset se guarda en uint8 y se normaliza por lotes justo antes de
+    usarlo, para no mantener en memoria una copia en coma flotante.
+
+    Args:
+        images: Array de imágenes (uint8 o flotante)
+
+    Returns:
+        Array float32
+    """
+    images = np.asarray(images)
+    if np.issubdtype(images.dtype, np.integer):
+        return images.astype(np.float32) / 255.0
+    return images.astype(np.float32, copy=False)
+
+def load_image_array(source, img_height, img_width, fast_decode=None, normalize=True):
+    """
+    Decodifica, redimensiona y (opcionalmente) normaliza una imagen para el modelo
+
+    Args:
+        source: Ruta, bytes o archivo abierto
+        img_height: Altura objetivo
+        img_width: Anchura objetivo
+        fast_decode: Usa la decodificación reducida (None = valor de FAST_DECODE)
+        normalize: Si es True devuelve valores en [0, 1]; si no, uint8
+
+    Returns:
+        Array de forma (alto, ancho, 3)
+    """
+    img = open_image(source, target_size=(img_width, img_height), fast_decode=fast_decode)
+    img = img.resize((img_width, img_height))
+    img_array = np.asarray(img)
+    if normalize:
+        return img_array / 255.0
+    return img_array
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Añadir clases al modelo sin repetir la validación cruzada completa
+
+Se carga el modelo en servicio, se amplía su capa softmax conservando los
+pesos de las clases existentes y se ajusta sólo la cabeza densa sobre las
+características del backbone congelado, que se calculan una vez por imagen
+y se reutilizan entre ejecuciones (ver load_or_compute_row_features).
+"""
+
+import os
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras import layers, models, optimizers
+from sklearn.model_selection import train_test_split
+from utils.utils import prepare_dataset
+from utils.feature_cache import load_or_compute_row_features, feature_cache_key
+from utils.model_manager import read_class_names
+from utils.models_utils import save_model_artifacts, export_tflite_model, read_model_config
+
+# Épocas de ajuste de la cabeza al añadir clases
+INCREMENTAL_EPOCHS = 10
+
+def split_model(model):
+    """
+    Separa un modelo entrenado en extractor de características y cabeza densa
+
+    El modelo tiene la estructura de main.create_model(): backbone, pooling
+    global y capas densas.
+
+    Args:
+        model: Modelo completo cargado de best_model.h5
+
+    Returns:
+        feature_extractor: Backbone + pooling (comparte las capas del modelo)
+        head_layers: Capas de la cabeza, en orden
+    """
+    backbone, pooling = model.layers[0], model.layers[1]
+    feature_extractor = models.Sequential([backbone, pooling])
+    return feature_extractor, model.layers[2:]
+
+def widen_head(head_layers, feature_dim, num_classes, seed=42):
+    """
+    Crea una cabeza con más salidas conservando los pesos de las clases existentes
+
+    Las capas ocultas copian sus pesos y la capa final copia las columnas de
+    las clases antiguas; las columnas nuevas empiezan con la inicialización
+    por defecto y el sesgo medio de las clases antiguas.
+
+    Args:
+        head_layers: Capas de la cabeza entrenada (la última es la softmax)
+        feature_dim: Dimensión de las características del backbone
+        num_classes: Número total de clases (antiguas + nuevas)
+        seed: Semilla de la inicialización de las columnas nuevas
+
+    Returns:
+        Modelo secuencial con la cabeza ampliada (sin compilar)
+    """
+    tf.random.set_seed(seed)
+    new_layers = [layer.__class__.from_config(layer.get_config()) for layer in head_layers[:-1]]
+    old_output = head_layers[-1]
+    output_config = old_output.get_config()
+    output_config['units'] = num_classes
+    new_output = layers.Dense.from_config(output_config)
+
+    head = models.Sequential([layers.Input(shape=(feature_dim,))] + new_layers + [new_output])
+
+    for new_layer, old_layer in zip(new_layers, head_layers[:-1]):
+        new_layer.set_weights(old_layer.get_weights())
+
+    old_kernel, old_bias = old_output.get_weights()
+    kernel, bias = new_output.get_weights()
+    old_count = old_kernel.shape[1]
+    kernel[:, :old_count] = old_kernel
+    bias[:old_count] = old_bias
+    bias[old_count:] = old_bias.mean()
+    new_output.set_weights([kernel, bias])
+
+    return head
+
+def incremental_add_class(raw_dir, model_path, class_names_path, img_height=None, img_width=None,
+                          epochs=INCREMENTAL_EPOCHS, batch_size=32, learning_rate=0.001,
+                          validation_split=0.2, tflite_path=None, tflite_quantization='int8',
+                          num_workers=None):
+    """
+    Amplía el modelo en servicio con las clases nuevas de `raw_dir`
+
+    Args:
+        raw_dir: Directorio raw con todas las clases (incluidas las nuevas)
+        model_path: Ruta del modelo actual (best_model.h5)
+        class_names_path: Ruta de los nombres de clases actuales
+        img_height: Altura de entrada del modelo (None = la del modelo cargado)
+        img_width: Anchura de entrada del modelo (None = la del modelo cargado)
+        epochs: Épocas de ajuste de la cabeza
+        batch_size: Tamaño del lote
+        learning_rate: Tasa de aprendizaje del ajuste
+        validation_split: Fracción reservada para medir la precisión
+        tflite_path: Si existe, también se vuelve a exportar el modelo TFLite
+        tflite_quantization: Cuantización del modelo TFLite
+        num_workers: Procesos para decodificar las imágenes nuevas
+
+    Returns:
+        Diccionario con las clases nuevas y la precisión de validación
+    """
+    old_class_names = read_class_names(class_names_path)
+    model = models.load_model(model_path)
+    model_config_path = os.path.join(os.path.dirname(model_path), 'model_config.json')
+    model_config = read_model_config(model_config_path)
+    img_height = img_height or model.input_shape[1]
+    img_width = img_width or model.input_shape[2]
+
+    # El dataset incremental sólo decodifica las imágenes nuevas
+    X, y_encoded, dataset_classes = prepare_dataset(raw_dir, img_height, img_width, num_workers=num_workers)
+
+    missing = [name for name in old_class_names if name not in dataset_classes]
+    if missing:
+        raise ValueError(f"Faltan clases del modelo actual en {raw_dir}: {', '.join(missing)}. "
+                         f"Reentrene con main.py.")
+    new_classes = [name for name in dataset_classes if name not in old_class_names]
+    if not new_classes:
+        print("No hay clases nuevas que añadir.")
+        return {'new_classes': [], 'val_accuracy': None}
+
+    # Las clases existentes conservan su índice; las nuevas van al final
+    class_names = old_class_names + new_classes
+    remap = np.array([class_names.index(name) for name in dataset_classes])
+    y = remap[np.argmax(y_encoded, axis=1)]
+
+    print(f"Añadiendo {len(new_classes)} clase(s): {', '.join(new_classes)} "
+          f"({len(old_class_names)} -> {len(class_names)} clases)")
+
+    feature_extractor, head_layers = split_model(model)
+    features = load_or_compute_row_features(
+        X,
+        lambda: feature_extractor,
+        cache_key=feature_cache_key(model_config['alpha'], img_height, img_width),
+        batch_size=batch_size
+    )
+
+    head = widen_head(head_layers, features.shape[1], len(class_names))
+    head.compile(
+        optimizer=optimizers.Adam(learning_rate=learning_rate),
+        loss='categorical_crossentropy',
+        metrics=['accuracy']
+    )
+
+    y_onehot = tf.keras.utils.to_categorical(y, num_classes=len(class_names))
+    F_train, F_val, y_train, y_val = train_test_split(
+        features, y_onehot, test_size=validation_split, stratify=y, random_state=42
+    )
+    head.fit(F_train, y_train, validation_data=(F_val, y_val),
+             batch_size=batch_size, epochs=epochs, shuffle=True, verbose=1)
+    val_loss, val_accuracy = head.evaluate(F_val, y_val, verbose=0)
+    print(f"Precisión de validación tras añadir las clases: {val_accuracy:.4f}")
+
+    # Modelo completo con la misma estructura que produce main.py
+    full_model = models.Sequential(list(feature_extractor.layers) + list(head.layers))
+    full_model.compile(
+        optimizer=optimizers.Adam(learning_rate=learning_rate),
+        loss='categorical_crossentropy',
+        metrics=['accuracy']
+    )
+
+    # Escritura atómica: el servidor recarga el par modelo + clases en caliente
+    save_model_artifacts(full_model, class_names, model_path=model_path, class_names_path=class_names_path,
+                         model_config=model_config, model_config_path=model_config_path)
+    print(f"Modelo actualizado: {model_path} ({len(class_names)} clases)")
+
+    # Un TFLite desactualizado tendría menos salidas que nombres de clases
+    if tflite_path and os.path.exists(tflite_path):
+        export_tflite_model(full_model, tflite_path, quantization=tflite_quantization, calibration_data=X)
+
+    return {'new_classes': new_classes, 'val_accuracy': float(val_accuracy)}
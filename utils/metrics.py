@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Métricas del servidor en formato de texto de Prometheus
+
+Implementación mínima sin dependencias: contadores e histogramas en memoria
+protegidos por un cerrojo. Registrar una observación cuesta una búsqueda
+binaria y una suma; el texto sólo se genera cuando alguien consulta el
+endpoint, así que sin scraper el coste es despreciable.
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Cubetas de latencia en segundos (1 ms a 10 s)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Cubetas para tamaños de lote
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+def _format_labels(label_names, label_values, extra=None):
+    """Formatea las etiquetas como {a="x",b="y"}"""
+    pairs = list(zip(label_names, label_values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = []
+    for name, value in pairs:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        escaped.append(f'{name}="{value}"')
+    return '{' + ','.join(escaped) + '}'
+
+def _format_value(value):
+    """Formatea un número como lo espera Prometheus"""
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+class Counter:
+    """
+    Contador monótono con etiquetas
+
+    Args:
+        name: Nombre de la métrica
+        documentation: Descripción (línea HELP)
+        label_names: Nombres de las etiquetas
+    """
+
+    metric_type = 'counter'
+
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        """Incrementa el contador para las etiquetas dadas"""
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def set_total(self, *label_values, value):
+        """Fija el total de un contador que mantiene otro componente"""
+        with self._lock:
+            self._values[label_values] = value
+
+    def samples(self):
+        """Devuelve las líneas de texto de la métrica"""
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}"
+                for labels, value in items]
+
+class Gauge(Counter):
+    """Valor instantáneo con etiquetas (puede subir o bajar)"""
+
+    metric_type = 'gauge'
+
+    def set(self, *label_values, value):
+        """Fija el valor para las etiquetas dadas"""
+        with self._lock:
+            self._values[label_values] = value
+
+    def clear(self):
+        """Elimina todas las series"""
+        with self._lock:
+            self._values.clear()
+
+class Histogram:
+    """
+    Histograma acumulativo con etiquetas
+
+    Args:
+        name: Nombre de la métrica
+        documentation: Descripción (línea HELP)
+        label_names: Nombres de las etiquetas
+        buckets: Límites superiores de las cubetas (ordenados)
+    """
+
+    metric_type = 'histogram'
+
+    def __init__(self, name, documentation, label_names=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._series = {}  # etiquetas -> [conteos por cubeta..., suma, total]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        """Registra una observación"""
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = [0] * (len(self.buckets) + 2)
+                self._series[label_values] = series
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, *label_values):
+        """Mide la duración del bloque en segundos"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *label_values)
+
+    def samples(self):
+        """Devuelve las líneas de texto de la métrica"""
+        with self._lock:
+            items = sorted((labels, list(series)) for labels, series in self._series.items())
+        lines = []
+        for labels, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                label_text = _format_labels(self.label_names, labels, ('le', _format_value(bound)))
+                lines.append(f"{self.name}_bucket{label_text} {cumulative}")
+            label_text = _format_labels(self.label_names, labels, ('le', '+Inf'))
+            lines.append(f"{self.name}_bucket{label_text} {series[-1]}")
+            label_text = _format_labels(self.label_names, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{label_text} {series[-1]}")
+        return lines
+
+class MetricsRegistry:
+    """Conjunto de métricas que se exportan juntas"""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        """Añade una métrica al registro y la devuelve"""
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        """
+        Añade una función que actualiza métricas justo antes de exportarlas
+
+        Sirve para valores que se leen de otros componentes (caché, modelo)
+        sólo cuando hay un scraper, en lugar de mantenerlos en cada petición.
+        """
+        self._collectors.append(collector)
+
+    def render(self):
+        """
+        Genera el texto de todas las métricas
+
+        Returns:
+            Texto en formato de exposición de Prometheus (versión 0.0.4)
+        """
+        for collector in self._collectors:
+            try:
+                collector()
+            except Exception as e:
+                print(f"Error al recoger métricas: {e}")
+
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.metric_type}")
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+# Tipo de contenido del formato de texto de Prometheus
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Registro y métricas del servidor
+registry = MetricsRegistry()
+
+REQUEST_SECONDS = registry.register(Histogram(
+    'gomitas_request_seconds', 'Duración total de las peticiones HTTP', ('endpoint',)))
+REQUESTS_TOTAL = registry.register(Counter(
+    'gomitas_requests_total', 'Peticiones HTTP atendidas', ('endpoint', 'status')))
+ERRORS_TOTAL = registry.register(Counter(
+    'gomitas_request_errors_total', 'Peticiones HTTP con respuesta de error (>= 400)', ('endpoint', 'status')))
+STAGE_SECONDS = registry.register(Histogram(
+    'gomitas_stage_seconds', 'Duración de cada etapa de la predicción', ('stage',)))
+BATCH_SIZE = registry.register(Histogram(
+    'gomitas_inference_batch_size', 'Imágenes por pasada del modelo', (), buckets=BATCH_SIZE_BUCKETS))
+BATCH_SECONDS = registry.register(Histogram(
+    'gomitas_inference_batch_seconds', 'Duración de cada pasada del modelo (lote completo)'))
+MODEL_INFO = registry.register(Gauge(
+    'gomitas_model_info', 'Versión del modelo en servicio (valor 1)', ('backend', 'version')))
+CACHE_EVENTS = registry.register(Counter(
+    'gomitas_prediction_cache_events_total', 'Eventos de la caché de predicciones', ('event',)))
+CACHE_ENTRIES = registry.register(Gauge(
+    'gomitas_prediction_cache_entries', 'Resultados guardados en la caché de predicciones'))
+
+def observe_batch(batch_size, seconds):
+    """Registra una pasada del modelo (callback del planificador de micro-lotes)"""
+    BATCH_SIZE.observe(batch_size)
+    BATCH_SECONDS.observe(seconds)
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Gestor del modelo en servicio con recarga en caliente
+
+Vigila el par de artefactos (modelo + nombres de clases). Cuando cambian,
+carga y calienta la nueva versión en segundo plano y la sustituye de forma
+atómica. Las peticiones en curso terminan con la versión que tomaron al
+empezar, porque conservan su propia referencia.
+"""
+
+import hashlib
+import os
+import threading
+import time
+import numpy as np
+
+class ModelVersion:
+    """
+    Versión inmutable del modelo en servicio
+
+    Args:
+        model: Modelo cargado (Keras o TFLiteModel)
+        class_names: Nombres de las clases en el orden de salida del modelo
+        version: Identificador corto de la versión
+
+    El tamaño de entrada (img_height, img_width) se toma del modelo: cada
+    petición preprocesa con el de la versión que tomó al empezar.
+    """
+
+    __slots__ = ('model', 'class_names', 'version', 'loaded_at', 'img_height', 'img_width')
+
+    def __init__(self, model, class_names, version):
+        self.model = model
+        self.class_names = tuple(class_names)
+        self.version = version
+        self.loaded_at = time.time()
+        self.img_height, self.img_width = (int(d) for d in model.input_shape[1:3])
+
+def read_class_names(class_names_path):
+    """
+    Lee el archivo de nombres de clases
+
+    Returns:
+        Lista de nombres (sin líneas vacías)
+    """
+    with open(class_names_path, 'r') as f:
+        return [line.strip() for line in f.readlines() if line.strip()]
+
+class ModelManager:
+    """
+    Carga, vigila y recarga en caliente el modelo y sus nombres de clases
+
+    Args:
+        loader: Función que recibe la ruta del modelo y devuelve el modelo cargado
+        model_path: Ruta del archivo del modelo
+        class_names_path: Ruta del archivo de nombres de clases
+        poll_interval: Segundos entre comprobaciones de cambios (0 = sin vigilancia)
+    """
+
+    def __init__(self, loader, model_path, class_names_path, poll_interval=5.0):
+        self.loader = loader
+        self.model_path = model_path
+        self.class_names_path = class_names_path
+        self.poll_interval = max(0.0, float(poll_interval))
+        self._current = None
+        self._fingerprint_loaded = None
+        self._fingerprint_failed = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.reloads = 0
+        self.failed_reloads = 0
+
+    def _fingerprint(self):
+        """
+        Huella de los artefactos (fecha de modificación y tamaño)
+
+        Returns:
+            Tupla comparable o None si falta algún archivo
+        """
+        try:
+            model_stat = os.stat(self.model_path)
+            names_stat = os.stat(self.class_names_path)
+        except OSError:
+            return None
+        return (model_stat.st_mtime_ns, model_stat.st_size,
+                names_stat.st_mtime_ns, names_stat.st_size)
+
+    def current(self):
+        """
+        Devuelve la versión en servicio
+
+        Returns:
+            ModelVersion o None si todavía no hay modelo cargado
+        """
+        return self._current
+
+    def _load_version(self, fingerprint):
+        """
+        Carga, valida y calienta una versión del modelo
+
+        Returns:
+            ModelVersion lista para servir
+        """
+        class_names = read_class_names(self.class_names_path)
+        if not class_names:
+            raise ValueError(f"No hay nombres de clases en {self.class_names_path}")
+
+        model = self.loader(self.model_path)
+
+        # Calentamos el modelo con una inferencia de prueba y validamos el par
+        input_shape = tuple(model.input_shape[1:])
+        output = model.predict(np.zeros((1,) + input_shape, dtype=np.float32), verbose=0)
+        if output.shape[-1] != len(class_names):
+            raise ValueError(f"El modelo tiene {output.shape[-1]} salidas pero hay "
+                             f"{len(class_names)} nombres de clases")
+
+        version = hashlib.sha1(repr(fingerprint).encode('utf-8')).hexdigest()[:12]
+        return ModelVersion(model, class_names, version)
+
+    def load(self):
+        """
+        Carga la versión actual de forma síncrona
+
+        Returns:
+            True si hay un modelo en servicio
+        """
+        fingerprint = self._fingerprint()
+        if fingerprint is None:
+            print(f"Error al cargar el modelo: no se encontró {self.model_path} o {self.class_names_path}")
+            return self._current is not None
+        try:
+            new_version = self._load_version(fingerprint)
+        except Exception as e:
+            print(f"Error al cargar el modelo: {e}")
+            return self._current is not None
+
+        with self._lock:
+            self._current = new_version
+            self._fingerprint_loaded = fingerprint
+        print(f"Modelo cargado correctamente (versión {new_version.version})")
+        return True
+
+    def start_watching(self):
+        """Arranca el hilo que vigila los artefactos (si poll_interval > 0)"""
+        if self.poll_interval <= 0:
+            return
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name='model-watcher', daemon=True)
+        self._thread.start()
+
+    def stop_watching(self):
+        """Detiene el hilo de vigilancia"""
+        self._stop.set()
+
+    def _watch(self):
+        """Bucle de vigilancia: recarga cuando el par de archivos cambia y se estabiliza"""
+        candidate = None
+        while not self._stop.wait(self.poll_interval):
+            fingerprint = self._fingerprint()
+            if fingerprint is None or fingerprint in (self._fingerprint_loaded, self._fingerprint_failed):
+                candidate = None
+                continue
+
+            # Esperamos a que los archivos dejen de cambiar (escritura en curso)
+            if fingerprint != candidate:
+                candidate = fingerprint
+                continue
+
+            try:
+                new_version = self._load_version(fingerprint)
+            except Exception as e:
+                self.failed_reloads += 1
+                print(f"⚠️ No se pudo recargar el modelo, se mantiene la versión actual: {e}")
+                # No reintentamos hasta que los archivos vuelvan a cambiar
+                self._fingerprint_failed = fingerprint
+                candidate = None
+                continue
+
+            with self._lock:
+                old_version = self._current
+                self._current = new_version
+                self._fingerprint_loaded = fingerprint
+            self.reloads += 1
+            candidate = None
+            print(f"🔄 Modelo recargado: {old_version.version if old_version else '-'} -> "
+                  f"{new_version.version}")
@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Utilidades para exportar y servir el modelo entrenado
+Incluye la exportación a TensorFlow Lite cuantizado y su intérprete
+"""
+
+import json
+import os
+import threading
+import time
+import numpy as np
+from utils.image_utils import normalize_images
+
+# Tipos de cuantización post-entrenamiento soportados
+TFLITE_QUANTIZATIONS = ('int8', 'float16', 'none')
+# Configuración del modelo guardada junto a sus artefactos
+MODEL_CONFIG_PATH = 'models/model_config.json'
+# Configuración de los modelos entrenados antes de guardar model_config.json
+DEFAULT_MODEL_CONFIG = {'backbone': 'mobilenet_v2', 'alpha': 1.0, 'img_height': 224, 'img_width': 224}
+
+def read_model_config(model_config_path=MODEL_CONFIG_PATH):
+    """
+    Lee la configuración (backbone, alpha y tamaño de entrada) del modelo guardado
+
+    Args:
+        model_config_path: Ruta de model_config.json
+
+    Returns:
+        Diccionario con DEFAULT_MODEL_CONFIG completado con lo guardado
+    """
+    config = dict(DEFAULT_MODEL_CONFIG)
+    if os.path.exists(model_config_path):
+        with open(model_config_path, 'r') as f:
+            config.update(json.load(f))
+    return config
+
+def configure_tensorflow_threads(intra_op_threads=None, inter_op_threads=None):
+    """
+    Limita los hilos de TensorFlow de este proceso
+
+    Debe llamarse antes de ejecutar cualquier operación de TensorFlow; con
+    varios procesos evita que los pools de hilos compitan por los mismos núcleos.
+
+    Args:
+        intra_op_threads: Hilos para paralelizar una operación (None = sin cambios)
+        inter_op_threads: Hilos para ejecutar operaciones en paralelo (None = sin cambios)
+    """
+    # Las variables de entorno cubren también OpenMP/oneDNN y procesos hijos
+    if intra_op_threads:
+        os.environ['TF_NUM_INTRAOP_THREADS'] = str(intra_op_threads)
+        os.environ['OMP_NUM_THREADS'] = str(intra_op_threads)
+    if inter_op_threads:
+        os.environ['TF_NUM_INTEROP_THREADS'] = str(inter_op_threads)
+
+    import tensorflow as tf
+    try:
+        if intra_op_threads:
+            tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+        if inter_op_threads:
+            tf.config.threading.set_inter_op_parallelism_threads(inter_op_threads)
+    except RuntimeError as e:
+        # TensorFlow ya se inicializó en este proceso: sólo aplican las variables
+        print(f"⚠️ No se pudieron cambiar los hilos de TensorFlow: {e}")
+
+def save_model_artifacts(best_model, class_names, model_path='models/best_model.h5',
+                         class_names_path='models/class_names.txt', model_config=None,
+                         model_config_path=MODEL_CONFIG_PATH):
+    """
+    Guarda el modelo y los nombres de clases sustituyendo los archivos de forma atómica
+
+    Se escribe primero en archivos temporales y después se renombran, para que
+    el servidor nunca lea un archivo a medio escribir.
+
+    Args:
+        best_model: Modelo entrenado
+        class_names: Nombres de las clases
+        model_path: Ruta del modelo
+        class_names_path: Ruta de los nombres de clases
+        model_config: Configuración del modelo (ver read_model_config) o None
+            para no modificar model_config.json
+        model_config_path: Ruta de model_config.json
+    """
+    tmp_model_path = os.path.join(os.path.dirname(model_path), '.tmp_' + os.path.basename(model_path))
+    best_model.save(tmp_model_path)
+
+    # Guardamos los nombres de las clases para usar en predicciones futuras
+    tmp_names_path = class_names_path + '.tmp'
+    with open(tmp_names_path, 'w') as f:
+        for name in class_names:
+            f.write(f"{name}\n")
+
+    if model_config is not None:
+        tmp_config_path = model_config_path + '.tmp'
+        with open(tmp_config_path, 'w') as f:
+            json.dump(model_config, f, indent=2)
+
+    os.replace(tmp_model_path, model_path)
+    os.replace(tmp_names_path, class_names_path)
+    if model_config is not None:
+        os.replace(tmp_config_path, model_config_path)
+
+def _get_interpreter_class():
+    """
+    Obtiene la clase del intérprete de TFLite
+
+    Se prefiere tflite_runtime (mucho más ligero) y, si no está instalado,
+    se usa el intérprete incluido en TensorFlow.
+
+    Returns:
+        Clase Interpreter
+    """
+    try:
+        from tflite_runtime.interpreter import Interpreter
+        return Interpreter
+    except ImportError:
+        import tensorflow as tf
+        return tf.lite.Interpreter
+
+def export_tflite_model(model, output_path, quantization='int8', calibration_data=None,
+                        num_calibration_samples=100):
+    """
+    Exporta un modelo de Keras a TensorFlow Lite con cuantización post-entrenamiento
+
+    Args:
+        model: Modelo de Keras entrenado
+        output_path: Ruta del archivo .tflite de salida
+        quantization: 'int8', 'float16' o 'none'
+        calibration_data: Imágenes (uint8 o normalizadas) para calibrar la cuantización int8
+        num_calibration_samples: Número máximo de imágenes usadas para calibrar
+
+    Returns:
+        output_path: Ruta del modelo exportado
+    """
+    import tensorflow as tf
+
+    if quantization not in TFLITE_QUANTIZATIONS:
+        raise ValueError(f"Cuantización no soportada: {quantization}. "
+                         f"Opciones: {', '.join(TFLITE_QUANTIZATIONS)}")
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+
+    if quantization == 'float16':
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_types = [tf.float16]
+
+    elif quantization == 'int8':
+        if calibration_data is None or len(calibration_data) == 0:
+            raise ValueError("La cuantización int8 requiere imágenes de calibración")
+
+        # Tomamos una muestra aleatoria reproducible para calibrar los rangos
+        rng = np.random.default_rng(42)
+        count = min(num_calibration_samples, len(calibration_data))
+        sample_indices = rng.choice(len(calibration_data), size=count, replace=False)
+
+        def representative_dataset():
+            for idx in sample_indices:
+                yield [normalize_images(calibration_data[idx:idx + 1])]
+
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        # Mantenemos entrada y salida en float32 para no cambiar el preprocesamiento
+
+    tflite_model = converter.convert()
+
+    # Escritura atómica: el servidor puede estar vigilando este archivo
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    tmp_path = output_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(tflite_model)
+    os.replace(tmp_path, output_path)
+
+    print(f"Modelo TFLite ({quantization}) guardado en {output_path} "
+          f"({len(tflite_model) / 1024 / 1024:.2f} MB)")
+
+    return output_path
+
+class TFLiteModel:
+    """
+    Envoltorio del intérprete de TFLite con la misma interfaz predict que Keras
+
+    El intérprete no es seguro entre hilos, por lo que las invocaciones se
+    serializan con un cerrojo (el micro-batching agrupa las peticiones antes).
+
+    Args:
+        model_path: Ruta al archivo .tflite
+        num_threads: Hilos de cómputo del intérprete (None = valor por defecto)
+        model_content: Contenido del modelo ya leído en memoria (opcional). Permite
+            compartir los pesos entre procesos creados con fork sin copiarlos.
+    """
+
+    def __init__(self, model_path, num_threads=None, model_content=None):
+        Interpreter = _get_interpreter_class()
+        self.model_path = model_path
+        self.num_threads = num_threads
+        # Conservamos la referencia al buffer mientras viva el intérprete
+        self._model_content = model_content
+        if model_content is not None:
+            self._interpreter = Interpreter(model_content=model_content, num_threads=num_threads)
+        else:
+            self._interpreter = Interpreter(model_path=model_path, num_threads=num_threads)
+        self._interpreter.allocate_tensors()
+        self._input = self._interpreter.get_input_details()[0]
+        self._output = self._interpreter.get_output_details()[0]
+        self._batch_size = int(self._input['shape'][0])
+        self._lock = threading.Lock()
+
+    @property
+    def input_shape(self):
+        """Forma de la entrada del modelo (None en la dimensión del lote)"""
+        return (None,) + tuple(int(d) for d in self._input['shape'][1:])
+
+    def _resize_batch(self, batch_size):
+        """Ajusta la dimensión del lote del tensor de entrada"""
+        if batch_size != self._batch_size:
+            shape = [batch_size] + [int(d) for d in self._input['shape'][1:]]
+            self._interpreter.resize_tensor_input(self._input['index'], shape)
+            self._interpreter.allocate_tensors()
+            self._input = self._interpreter.get_input_details()[0]
+            self._output = self._interpreter.get_output_details()[0]
+            self._batch_size = batch_size
+
+    def predict(self, inputs, verbose=0):
+        """
+        Realiza la inferencia de un lote de imágenes
+
+        Args:
+            inputs: Array de forma (n, alto, ancho, 3) con valores en [0, 1]
+            verbose: Ignorado, se mantiene por compatibilidad con Keras
+
+        Returns:
+            predictions: Array de forma (n, num_clases)
+        """
+        inputs = np.asarray(inputs)
+
+        with self._lock:
+            self._resize_batch(len(inputs))
+
+            # Cuantizamos la entrada si el modelo la espera en enteros
+            input_dtype = self._input['dtype']
+            if np.issubdtype(input_dtype, np.integer):
+                scale, zero_point = self._input['quantization']
+                inputs = np.round(inputs / scale + zero_point)
+                info = np.iinfo(input_dtype)
+                inputs = np.clip(inputs, info.min, info.max)
+            self._interpreter.set_tensor(self._input['index'], inputs.astype(input_dtype))
+
+            self._interpreter.invoke()
+
+            output = self._interpreter.get_tensor(self._output['index']).copy()
+
+        # Decuantizamos la salida si es entera
+        if np.issubdtype(output.dtype, np.integer):
+            scale, zero_point = self._output['quantization']
+            output = (output.astype(np.float32) - zero_point) * scale
+
+        return output
+
+def load_prediction_model(model_path):
+    """
+    Carga el modelo para predecir: TFLite si la ruta termina en .tflite, Keras si no
+
+    Args:
+        model_path: Ruta del modelo (.h5 o .tflite)
+
+    Returns:
+        Objeto con el método predict(lote, verbose=0)
+    """
+    if model_path.endswith('.tflite'):
+        return TFLiteModel(model_path)
+    from tensorflow.keras.models import load_model
+    return load_model(model_path)
+
+def _predict_in_batches(model, X, batch_size=32):
+    """
+    Predice un conjunto de imágenes por lotes midiendo el tiempo total
+
+    Returns:
+        predictions: Probabilidades por imagen
+        elapsed: Segundos empleados
+    """
+    outputs = []
+    start = time.perf_counter()
+    for i in range(0, len(X), batch_size):
+        batch = normalize_images(X[i:i + batch_size])
+        outputs.append(model.predict(batch, verbose=0))
+    elapsed = time.perf_counter() - start
+    return np.concatenate(outputs, axis=0), elapsed
+
+def compare_tflite_accuracy(keras_model, tflite_model, X, y_true, report_path=None):
+    """
+    Compara la precisión del modelo TFLite cuantizado con el modelo de Keras
+
+    Args:
+        keras_model: Modelo de Keras original
+        tflite_model: Instancia de TFLiteModel
+        X: Imágenes (uint8 o normalizadas)
+        y_true: Índices de las clases reales
+        report_path: Ruta donde guardar el reporte de texto (opcional)
+
+    Returns:
+        report: Diccionario con las métricas de la comparación
+    """
+    keras_probs, keras_time = _predict_in_batches(keras_model, X)
+    tflite_probs, tflite_time = _predict_in_batches(tflite_model, X)
+
+    keras_pred = np.argmax(keras_probs, axis=1)
+    tflite_pred = np.argmax(tflite_probs, axis=1)
+
+    keras_accuracy = float(np.mean(keras_pred == y_true))
+    tflite_accuracy = float(np.mean(tflite_pred == y_true))
+
+    report = {
+        'samples': int(len(X)),
+        'keras_accuracy': keras_accuracy,
+        'tflite_accuracy': tflite_accuracy,
+        'accuracy_delta': tflite_accuracy - keras_accuracy,
+        'top1_agreement': float(np.mean(keras_pred == tflite_pred)),
+        'mean_abs_prob_diff': float(np.mean(np.abs(keras_probs - tflite_probs))),
+        'keras_ms_per_image': keras_time / max(1, len(X)) * 1000,
+        'tflite_ms_per_image': tflite_time / max(1, len(X)) * 1000,
+        'tflite_size_mb': os.path.getsize(tflite_model.model_path) / 1024 / 1024,
+    }
+
+    if report_path:
+        os.makedirs(os.path.dirname(report_path) or '.', exist_ok=True)
+        with open(report_path, 'w') as f:
+            f.write(f"Modelo TFLite: {tflite_model.model_path}\n")
+            f.write(f"Imágenes evaluadas: {report['samples']}\n")
+            f.write(f"Precisión Keras: {keras_accuracy:.4f}\n")
+            f.write(f"Precisión TFLite: {tflite_accuracy:.4f}\n")
+            f.write(f"Diferencia de precisión: {report['accuracy_delta']:+.4f}\n")
+            f.write(f"Coincidencia top-1: {report['top1_agreement']:.4f}\n")
+            f.write(f"Diferencia media de probabilidades: {report['mean_abs_prob_diff']:.6f}\n")
+            f.write(f"Latencia Keras (ms/imagen): {report['keras_ms_per_image']:.2f}\n")
+            f.write(f"Latencia TFLite (ms/imagen): {report['tflite_ms_per_image']:.2f}\n")
+            f.write(f"Tamaño TFLite (MB): {report['tflite_size_mb']:.2f}\n")
+
+    return report
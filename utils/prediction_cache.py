@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Caché de predicciones direccionada por contenido
+
+Guarda los resultados por hash de los bytes de la imagen y la versión del
+modelo, con límite de tamaño (LRU) y caducidad (TTL). Las peticiones
+idénticas que llegan mientras otra está en curso esperan su resultado en
+lugar de repetir la inferencia.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+class PredictionCache:
+    """
+    Caché LRU con TTL y coalescencia de peticiones en curso
+
+    Args:
+        max_entries: Número máximo de resultados guardados (0 desactiva la caché)
+        ttl_seconds: Segundos de validez de cada resultado (0 = sin caducidad)
+    """
+
+    def __init__(self, max_entries=1024, ttl_seconds=3600):
+        self.max_entries = max(0, int(max_entries))
+        self.ttl = max(0.0, float(ttl_seconds))
+        self._entries = OrderedDict()  # clave -> (instante de expiración, valor)
+        self._inflight = {}  # clave -> Future de la petición en curso
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def make_key(image_bytes, model_version):
+        """
+        Calcula la clave de caché de una imagen
+
+        Args:
+            image_bytes: Bytes originales de la imagen
+            model_version: Identificador de la versión del modelo
+
+        Returns:
+            Clave hexadecimal SHA-256
+        """
+        digest = hashlib.sha256()
+        digest.update(str(model_version).encode('utf-8'))
+        digest.update(b'\0')
+        digest.update(image_bytes)
+        return digest.hexdigest()
+
+    def _lookup(self, key):
+        """Busca una clave válida (debe llamarse con el cerrojo tomado)"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        expires_at, value = entry
+        if expires_at is not None and expires_at < time.monotonic():
+            del self._entries[key]
+            self.expirations += 1
+            return False, None
+        self._entries.move_to_end(key)
+        return True, value
+
+    def _store(self, key, value):
+        """Guarda un valor y expulsa los más antiguos (con el cerrojo tomado)"""
+        if self.max_entries == 0:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, key):
+        """
+        Obtiene un resultado de la caché
+
+        Returns:
+            El valor guardado o None si no existe o caducó
+        """
+        with self._lock:
+            found, value = self._lookup(key)
+            if found:
+                self.hits += 1
+                return value
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        """Guarda un resultado en la caché"""
+        with self._lock:
+            self._store(key, value)
+
+    def record_coalesced(self):
+        """Cuenta una petición servida por otra idéntica en curso"""
+        with self._lock:
+            self.coalesced += 1
+
+    def get_or_compute(self, key, compute):
+        """
+        Devuelve el resultado guardado o lo calcula una sola vez
+
+        Si otra petición ya está calculando la misma clave, se espera su
+        resultado en lugar de repetir el cálculo.
+
+        Args:
+            key: Clave de caché
+            compute: Función sin argumentos que calcula el resultado
+
+        Returns:
+            Resultado guardado o recién calculado
+        """
+        with self._lock:
+            found, value = self._lookup(key)
+            if found:
+                self.hits += 1
+                return value
+
+            pending = self._inflight.get(key)
+            if pending is not None:
+                self.coalesced += 1
+            else:
+                self.misses += 1
+                future = Future()
+                self._inflight[key] = future
+
+        if pending is not None:
+            return pending.result()
+
+        try:
+            value = compute()
+        except BaseException as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            self._store(key, value)
+            self._inflight.pop(key, None)
+        future.set_result(value)
+        return value
+
+    def clear(self):
+        """Vacía la caché (las peticiones en curso no se ven afectadas)"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Devuelve los contadores de uso de la caché
+
+        Returns:
+            Diccionario con aciertos, fallos, tamaño y configuración
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'enabled': self.max_entries > 0,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'in_flight': len(self._inflight),
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
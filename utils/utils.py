@@ -5,102 +5,197 @@ Utilidades para el procesamiento de imágenes y preparación de datos
 """
 
 import os
+import sys
+import json
 import numpy as np
 import glob
 from PIL import Image
 import subprocess
+import tempfile
 from tensorflow.keras.utils import to_categorical
-from sklearn.model_selection import train_test_split
 import shutil
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import matplotlib.pyplot as plt
+from utils.image_utils import FAST_DECODE, load_image_array, heic_decoder_available, convert_heic_file
+from utils.dataset_cache import (DATASET_CACHE_DIR, file_sha1, assign_split, load_manifest, save_dataset,
+                                 allocate_image_array, decode_into_array)
 
-def convert_heic_to_jpg(data_dir):
+# Extensiones de imagen que se usan para entrenar
+IMAGE_PATTERNS = ['*.jpg', '*.JPG', '*.jpeg', '*.JPEG', '*.png', '*.PNG']
+# Extensiones HEIC (se convierten a JPG o se decodifican en memoria)
+HEIC_PATTERNS = ['*.heic', '*.HEIC', '*.heif', '*.HEIF']
+
+# Representación de las particiones entrenamiento/prueba:
+# 'manifest' (sólo data/splits.json) o carpetas con 'hardlink', 'symlink' o 'copy'
+SPLIT_MODES = ('manifest', 'hardlink', 'symlink', 'copy')
+SPLIT_MODE = os.environ.get('SPLIT_MODE', 'manifest')
+SPLITS_PATH = os.path.join('data', 'splits.json')
+
+def find_heic_files(data_dir):
     """
-    Convierte imágenes HEIC a JPG utilizando varios métodos alternativos
+    Busca los archivos HEIC/HEIF de las carpetas de clases
     
     Args:
-        data_dir: Directorio con imágenes HEIC
-    """
-    print("Buscando imágenes HEIC para convertir...")
+        data_dir: Directorio con una carpeta por clase
     
-    # Buscamos todos los archivos HEIC
+    Returns:
+        Lista ordenada de rutas
+    """
     heic_files = []
-    for folder in os.listdir(data_dir):
+    for folder in sorted(os.listdir(data_dir)):
         folder_path = os.path.join(data_dir, folder)
         if os.path.isdir(folder_path):
-            heic_files.extend(glob.glob(os.path.join(folder_path, "*.heic")))
-            heic_files.extend(glob.glob(os.path.join(folder_path, "*.HEIC")))
+            for ext in HEIC_PATTERNS:
+                heic_files.extend(glob.glob(os.path.join(folder_path, ext)))
+    return sorted(set(heic_files))
+
+def heic_jpg_path(heic_file):
+    """Ruta del JPG que corresponde a un archivo HEIC"""
+    return os.path.splitext(heic_file)[0] + ".jpg"
+
+def is_converted(heic_file):
+    """
+    Indica si el JPG de un archivo HEIC existe y es posterior al HEIC
+    
+    Returns:
+        True si no hace falta volver a convertirlo
+    """
+    jpg_file = heic_jpg_path(heic_file)
+    return os.path.exists(jpg_file) and os.path.getmtime(jpg_file) >= os.path.getmtime(heic_file)
+
+def _run_converter(command, files):
+    """
+    Ejecuta una herramienta externa de conversión sobre un bloque de archivos
+    
+    Returns:
+        Lista de (ruta, mensaje de error) de los archivos que fallaron
+    """
+    try:
+        subprocess.run(command, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except (subprocess.CalledProcessError, OSError) as e:
+        return [(heic_file, str(e)) for heic_file in files]
+    return [(heic_file, "no se generó el JPG") for heic_file in files if not is_converted(heic_file)]
+
+def _run_converters(commands, num_workers):
+    """
+    Ejecuta varias llamadas a herramientas externas en paralelo
+    
+    Args:
+        commands: Lista de (comando, archivos que convierte)
+        num_workers: Llamadas simultáneas
+    
+    Returns:
+        Lista de (ruta, mensaje de error)
+    """
+    # Los procesos externos no necesitan el GIL: bastan hilos para lanzarlos
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        results = executor.map(lambda item: _run_converter(*item), commands)
+        return [error for chunk_errors in results for error in chunk_errors]
+
+def convert_heic_to_jpg(data_dir, num_workers=None, force=False, chunk_size=16):
+    """
+    Convierte imágenes HEIC a JPG utilizando varios métodos alternativos
+    
+    La conversión es idempotente: se saltan los HEIC cuyo JPG ya existe y es
+    más reciente. Los pendientes se convierten en paralelo (procesos con
+    pillow-heif/pyheif o, si no están, varias llamadas simultáneas a sips o
+    ImageMagick, esta última con un bloque de archivos por llamada).
+    
+    Args:
+        data_dir: Directorio con imágenes HEIC
+        num_workers: Conversiones en paralelo (None = todos los núcleos)
+        force: Vuelve a convertir aunque el JPG esté actualizado
+        chunk_size: Archivos por tarea (y por llamada a la herramienta externa)
+    """
+    print("Buscando imágenes HEIC para convertir...")
     
+    heic_files = find_heic_files(data_dir)
     if not heic_files:
         print("No se encontraron archivos HEIC para convertir.")
         return
     
-    print(f"Se encontraron {len(heic_files)} archivos HEIC.")
-    
-    # Método 1: Intentar con pillow-heif (más común)
-    try:
-        import pillow_heif
-        pillow_heif.register_heif_opener()
-        
-        print("Usando pillow-heif para convertir imágenes...")
-        
-        for heic_file in heic_files:
-            try:
-                # Abrimos el archivo HEIC con PIL (ahora soporta HEIC gracias a pillow_heif)
-                img = Image.open(heic_file)
-                
-                # Guardamos como JPG
-                jpg_file = os.path.splitext(heic_file)[0] + ".jpg"
-                img.save(jpg_file, "JPEG")
-                print(f"Convertido: {heic_file} -> {jpg_file}")
-                
-            except Exception as e:
-                print(f"Error al convertir {heic_file} con pillow-heif: {e}")
-        
+    pending = [f for f in heic_files if force or not is_converted(f)]
+    print(f"Se encontraron {len(heic_files)} archivos HEIC "
+          f"({len(heic_files) - len(pending)} ya convertidos).")
+    if not pending:
         return
-        
-    except ImportError:
-        print("pillow-heif no disponible, intentando método alternativo...")
     
-    # Método 2: Intentar con sips (solo MacOS)
-    if sys.platform == 'darwin':  # MacOS
-        print("Intentando convertir con sips (herramienta nativa de MacOS)...")
-        
-        for heic_file in heic_files:
-            try:
-                jpg_file = os.path.splitext(heic_file)[0] + ".jpg"
-                subprocess.run(['sips', '-s', 'format', 'jpeg', heic_file, '--out', jpg_file], 
-                              check=True, stdout=subprocess.PIPE)
-                print(f"Convertido: {heic_file} -> {jpg_file}")
-            except Exception as e:
-                print(f"Error al convertir {heic_file} con sips: {e}")
-        
-        return
+    num_workers = num_workers or os.cpu_count() or 1
+    chunks = [pending[i:i + chunk_size] for i in range(0, len(pending), chunk_size)]
+    errors = []
     
-    # Método 3: Usar ImageMagick si está disponible
-    try:
-        subprocess.run(['convert', '--version'], check=True, stdout=subprocess.PIPE)
-        print("Intentando convertir con ImageMagick...")
-        
-        for heic_file in heic_files:
-            try:
-                jpg_file = os.path.splitext(heic_file)[0] + ".jpg"
-                subprocess.run(['convert', heic_file, jpg_file], check=True, stdout=subprocess.PIPE)
-                print(f"Convertido: {heic_file} -> {jpg_file}")
-            except Exception as e:
-                print(f"Error al convertir {heic_file} con ImageMagick: {e}")
-        
+    # Método 1: pillow-heif o pyheif en procesos worker
+    if heic_decoder_available():
+        print(f"Convirtiendo {len(pending)} imágenes con {min(num_workers, len(pending))} procesos...")
+        tasks = [(heic_file, heic_jpg_path(heic_file)) for heic_file in pending]
+        if num_workers <= 1 or len(chunks) <= 1:
+            results = [convert_heic_file(*task) for task in tasks]
+        else:
+            # 'spawn': los workers no heredan el estado de TensorFlow del proceso principal
+            context = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(max_workers=min(num_workers, len(chunks)), mp_context=context) as executor:
+                results = list(executor.map(convert_heic_file, *zip(*tasks), chunksize=chunk_size))
+        errors = [(heic_file, message) for heic_file, message in results if message]
+    
+    # Método 2: sips (solo MacOS), varias llamadas en paralelo
+    elif sys.platform == 'darwin':
+        print("pillow-heif no disponible, convirtiendo con sips (herramienta nativa de MacOS)...")
+        commands = [(['sips', '-s', 'format', 'jpeg', heic_file, '--out', heic_jpg_path(heic_file)], [heic_file])
+                    for heic_file in pending]
+        errors = _run_converters(commands, num_workers)
+    
+    # Método 3: ImageMagick (mogrify escribe el .jpg junto a cada HEIC)
+    elif shutil.which('mogrify'):
+        print("pillow-heif no disponible, convirtiendo con ImageMagick...")
+        commands = [(['mogrify', '-format', 'jpg'] + chunk, chunk) for chunk in chunks]
+        errors = _run_converters(commands, num_workers)
+    
+    else:
+        print("\n¡IMPORTANTE! No se pudieron convertir los archivos HEIC a JPG.")
+        print("Por favor, convierta manualmente los archivos HEIC a JPG antes de continuar,")
+        print("instale pillow-heif o use el modo --heic stream (también requiere pillow-heif).")
+        print("También puede usar herramientas como 'sips' en MacOS o aplicaciones como iPhoto, Preview, etc.")
         return
-    except (subprocess.CalledProcessError, FileNotFoundError):
-        print("ImageMagick no disponible...")
     
-    print("\n¡IMPORTANTE! No se pudieron convertir los archivos HEIC a JPG.")
-    print("Por favor, convierta manualmente los archivos HEIC a JPG antes de continuar.")
-    print("También puede usar herramientas como 'sips' en MacOS o aplicaciones como iPhoto, Preview, etc.")
+    for heic_file, message in errors:
+        print(f"Error al convertir {heic_file}: {message}")
+    print(f"✅ Convertidos {len(pending) - len(errors)}/{len(pending)} archivos HEIC")
+
+def list_class_images(folder_path, include_heic=False):
+    """
+    Lista las imágenes jpg o png de la carpeta de una clase
+    
+    Args:
+        folder_path: Carpeta de la clase
+        include_heic: Incluye también los HEIC que no tienen un JPG convertido
+            (se decodifican en memoria al preparar el dataset)
+    
+    Returns:
+        Lista de rutas
+    """
+    image_files = []
+    for ext in IMAGE_PATTERNS:
+        image_files.extend(glob.glob(os.path.join(folder_path, ext)))
+    if include_heic:
+        converted = {os.path.splitext(f)[0] for f in image_files}
+        for ext in HEIC_PATTERNS:
+            image_files.extend(f for f in glob.glob(os.path.join(folder_path, ext))
+                               if os.path.splitext(f)[0] not in converted)
+    return sorted(set(image_files))
 
-def prepare_dataset(data_dir, img_height, img_width, test_split=0.2, min_samples=5):
+def prepare_dataset(data_dir, img_height, img_width, test_split=0.2, min_samples=5, fast_decode=None,
+                    cache_dir=DATASET_CACHE_DIR, num_workers=None, split_mode=None, include_heic=False):
     """
-    Prepara el conjunto de datos para entrenamiento
+    Prepara el conjunto de datos para entrenamiento de forma incremental
+    
+    Un manifiesto en `cache_dir` guarda por cada imagen su tamaño, fecha,
+    hash del contenido, partición y fila en el array decodificado. Sólo se
+    decodifican las imágenes nuevas o modificadas; las eliminadas se quitan.
+    Las particiones se publican en data/splits.json (y, si se piden carpetas,
+    como enlaces en data/entrenamiento y data/prueba). Las imágenes se devuelven
+    en uint8 (la normalización a [0, 1] se hace por lotes al usarlas, ver
+    normalize_images) y, si nada cambió, con memoria mapeada desde la caché.
     
     Args:
         data_dir: Directorio con las imágenes por clase
@@ -108,17 +203,19 @@ def prepare_dataset(data_dir, img_height, img_width, test_split=0.2, min_samples
         img_width: Anchura objetivo de las imágenes
         test_split: Proporción para conjunto de prueba
         min_samples: Número mínimo de imágenes requeridas por clase
+        fast_decode: Decodifica JPEG a resolución reducida antes de redimensionar
+            (None = valor de FAST_DECODE; False = decodificación completa)
+        cache_dir: Directorio de la caché del dataset (None = sin caché)
+        num_workers: Procesos de decodificación en paralelo (None = todos los núcleos)
+        split_mode: Representación de las particiones, ver SPLIT_MODES (None = SPLIT_MODE)
+        include_heic: Decodifica los HEIC sin convertir directamente en el dataset,
+            sin escribir un JPG intermedio (ver convert_heic_to_jpg)
     
     Returns:
-        X: Datos de imágenes
+        X: Datos de imágenes (uint8)
         y: Etiquetas codificadas
         class_names: Nombres de las clases
     """
-    X = []  # Datos de imágenes
-    y = []  # Etiquetas
-    class_names = []  # Nombres de clases
-    valid_class_indices = []  # Índices de clases válidas
-    
     print("\n=== Preparando conjunto de datos ===")
     
     # Verificamos que exista el directorio
@@ -132,26 +229,34 @@ def prepare_dataset(data_dir, img_height, img_width, test_split=0.2, min_samples
     if not folders:
         raise ValueError(f"No se encontraron carpetas de clases en {data_dir}")
     
-    # Creamos directorios principales si no existen
-    os.makedirs("data/entrenamiento", exist_ok=True)
-    os.makedirs("data/prueba", exist_ok=True)
-    
-    # Procesamos cada clase
-    for idx, folder in enumerate(folders):
-        folder_path = os.path.join(data_dir, folder)
-        
-        print(f"\nProcesando clase: {folder} (índice {idx})")
-        
-        # Creamos directorios para entrenamiento y prueba
-        train_dir = os.path.join("data/entrenamiento", folder)
-        test_dir = os.path.join("data/prueba", folder)
-        os.makedirs(train_dir, exist_ok=True)
-        os.makedirs(test_dir, exist_ok=True)
-        
-        # Obtenemos todas las imágenes jpg o png
-        image_files = []
-        for ext in ['*.jpg', '*.JPG', '*.jpeg', '*.JPEG', '*.png', '*.PNG']:
-            image_files.extend(glob.glob(os.path.join(folder_path, ext)))
+    if fast_decode is None:
+        fast_decode = FAST_DECODE
+    split_mode = split_mode or SPLIT_MODE
+    if split_mode not in SPLIT_MODES:
+        raise ValueError(f"Modo de particiones no soportado: {split_mode}. Opciones: {', '.join(SPLIT_MODES)}")
+    params = {
+        'size': [img_height, img_width],
+        'fast_decode': bool(fast_decode),
+        'test_split': test_split,
+    }
+    
+    # Estado de la ejecución anterior
+    if cache_dir:
+        old_manifest, old_X, old_y = load_manifest(cache_dir)
+    else:
+        old_manifest, old_X, old_y = {}, None, None
+    old_params = old_manifest.get('params', {})
+    old_files = old_manifest.get('files', {})
+    # Las filas decodificadas sólo se reutilizan si el tamaño y el decodificador coinciden
+    reuse_rows = (old_X is not None and old_params.get('size') == params['size']
+                  and old_params.get('fast_decode') == params['fast_decode'])
+    keep_splits = old_params.get('test_split') == test_split
+    
+    # Recorremos los archivos: el hash sólo se recalcula si cambió el tamaño o la fecha
+    files = {}
+    to_decode = []
+    for folder in folders:
+        image_files = list_class_images(os.path.join(data_dir, folder), include_heic=include_heic)
         
         # Verificamos si hay suficientes imágenes
         if len(image_files) < min_samples:
@@ -159,92 +264,296 @@ def prepare_dataset(data_dir, img_height, img_width, test_split=0.2, min_samples
                   f"se requieren al menos {min_samples}. Esta clase será ignorada.")
             continue
         
-        print(f"Encontradas {len(image_files)} imágenes")
-        
-        # Dividimos en entrenamiento y prueba
-        if len(image_files) >= 2:  # Necesitamos al menos 2 imágenes para dividir
-            # Calculamos el número real de muestras de prueba
-            n_test = max(1, int(len(image_files) * test_split))
-            n_train = len(image_files) - n_test
-            
-            print(f"Dividiendo en {n_train} imágenes de entrenamiento y {n_test} de prueba")
+        for path in image_files:
+            rel_path = os.path.relpath(path, data_dir)
+            stat = os.stat(path)
+            old = old_files.get(rel_path)
+            if old and old['size'] == stat.st_size and old['mtime_ns'] == stat.st_mtime_ns:
+                content_hash = old['sha1']
+            else:
+                content_hash = file_sha1(path)
             
-            # Mezclamos y dividimos manualmente si hay pocas imágenes
-            if len(image_files) < 10:
-                np.random.seed(42)
-                np.random.shuffle(image_files)
-                train_files = image_files[:-n_test]
-                test_files = image_files[-n_test:]
+            entry = {
+                'class': folder,
+                'size': stat.st_size,
+                'mtime_ns': stat.st_mtime_ns,
+                'sha1': content_hash,
+                # La partición de una ruta ya conocida no cambia entre ejecuciones
+                'split': old['split'] if old and keep_splits else assign_split(content_hash, test_split),
+            }
+            if reuse_rows and old and old['sha1'] == content_hash and (
+                    old.get('row') is not None or old.get('error')):
+                entry['old_row'] = old.get('row')
+                if old.get('error'):
+                    entry['error'] = old['error']
             else:
-                train_files, test_files = train_test_split(
-                    image_files, test_size=n_test/len(image_files), random_state=42
-                )
-        else:
-            # Si solo hay una imagen, la usamos para entrenamiento y prueba
-            train_files = image_files
-            test_files = image_files
-            print("⚠️ Advertencia: Solo hay una imagen, se usará para entrenamiento y prueba")
-        
-        # Copiamos archivos a carpetas de entrenamiento y prueba
-        for file in train_files:
-            dest = os.path.join(train_dir, os.path.basename(file))
-            shutil.copy(file, dest)
-        
-        for file in test_files:
-            dest = os.path.join(test_dir, os.path.basename(file))
-            shutil.copy(file, dest)
-        
-        # Procesamos cada imagen
-        class_X = []  # Imágenes de esta clase
-        class_y = []  # Etiquetas de esta clase
-        
-        for img_path in image_files:
-            try:
-                img = Image.open(img_path).convert('RGB')
-                img = img.resize((img_width, img_height))
-                img_array = np.array(img) / 255.0  # Normalización
-                
-                class_X.append(img_array)
-                class_y.append(idx)
-                
-            except Exception as e:
-                print(f"Error procesando {img_path}: {e}")
-        
-        # Solo añadimos la clase si se procesaron suficientes imágenes
-        if len(class_X) >= min_samples:
-            X.extend(class_X)
-            y.extend(class_y)
-            class_names.append(folder)
-            valid_class_indices.append(idx)
-            print(f"✓ Clase '{folder}' añadida con {len(class_X)} imágenes")
-        else:
-            print(f"⚠️ Advertencia: No se pudieron procesar suficientes imágenes para '{folder}', "
-                  f"se requieren al menos {min_samples}. Esta clase será ignorada.")
+                to_decode.append(rel_path)
+            files[rel_path] = entry
     
-    # Verificamos si hay suficientes clases
+    removed = [rel_path for rel_path in old_files if rel_path not in files]
+    print(f"Imágenes: {len(files)} ({len(to_decode)} nuevas o modificadas, {len(removed)} eliminadas)")
+    
+    # Filas previstas del nuevo array (suponiendo que lo nuevo se decodifica bien)
+    class_names = select_classes(files, folders, min_samples, report=False)
     if len(class_names) == 0:
         raise ValueError("No se encontraron clases con suficientes imágenes para entrenar")
+    rows = dataset_rows(files, class_names)
+    unchanged = (
+        not to_decode and not removed and old_X is not None
+        and class_names == old_manifest.get('class_names')
+        and [files[rel_path]['old_row'] for rel_path in rows] == list(range(len(old_X)))
+        and all(files[rel_path]['split'] == old_files[rel_path]['split'] for rel_path in files)
+    )
+    
+    if unchanged:
+        select_classes(files, folders, min_samples)
+        publish_splits(data_dir, files, old_files, class_names, split_mode)
+        print(f"\n✅ Dataset sin cambios, cargado de la caché: {len(old_X)} imágenes en {len(class_names)} clases")
+        return old_X, to_categorical(old_y, num_classes=len(class_names)), class_names
+    
+    # Reservamos el array final en disco: las filas conocidas se copian del
+    # anterior y los workers escriben las nuevas directamente en su sitio
+    X = allocate_image_array(cache_dir or tempfile.gettempdir(), (len(rows), img_height, img_width, 3))
+    new_items = []
+    for row, rel_path in enumerate(rows):
+        entry = files[rel_path]
+        if 'old_row' in entry:
+            X[row] = old_X[entry['old_row']]
+        else:
+            new_items.append((row, os.path.join(data_dir, rel_path)))
     
-    # Ajustamos índices si algunas clases fueron ignoradas
-    if len(valid_class_indices) < len(folders):
-        # Creamos un mapa de índice original a nuevo índice
-        idx_map = {old_idx: new_idx for new_idx, old_idx in enumerate(valid_class_indices)}
-        # Remapeamos las etiquetas
-        y = [idx_map[label] for label in y]
+    errors = decode_into_array(X, new_items, fast_decode=fast_decode, num_workers=num_workers)
     
-    # Convertimos a arrays de numpy
-    X = np.array(X)
-    y = np.array(y)
+    # Si algo falló, quitamos esas filas (y las clases que se queden sin suficientes imágenes)
+    for row, message in errors.items():
+        files[rows[row]]['error'] = message
+    for entry in files.values():
+        entry.pop('skipped', None)
+    class_names = select_classes(files, folders, min_samples)
+    
+    # Verificamos si hay suficientes clases
+    if len(class_names) == 0:
+        raise ValueError("No se encontraron clases con suficientes imágenes para entrenar")
     
-    # Codificamos etiquetas en one-hot
-    y_encoded = to_categorical(y, num_classes=len(class_names))
+    final_rows = dataset_rows(files, class_names)
+    if final_rows != rows:
+        position = {rel_path: row for row, rel_path in enumerate(rows)}
+        building = X
+        X = building[[position[rel_path] for rel_path in final_rows]]
+        building_path = building.filename
+        del building
+        os.remove(building_path)
+        rows = final_rows
+    
+    y = np.empty(len(rows), dtype=np.int64)
+    for row, rel_path in enumerate(rows):
+        y[row] = class_names.index(files[rel_path]['class'])
+        files[rel_path]['row'] = row
+    
+    # Publicamos las particiones (sólo las diferencias)
+    publish_splits(data_dir, files, old_files, class_names, split_mode)
+    
+    for entry in files.values():
+        entry.pop('old_row', None)
+        entry.pop('skipped', None)
+        entry.setdefault('row', None)
+    
+    if cache_dir:
+        X = save_dataset(cache_dir, {
+            'params': params,
+            'class_names': class_names,
+            'files': files,
+            'arrays': old_manifest.get('arrays', {}),
+        }, X, y)
+    elif isinstance(X, np.memmap):
+        # Sin caché: pasamos el resultado a memoria y borramos el archivo temporal
+        building_path = X.filename
+        X = np.array(X)
+        os.remove(building_path)
     
     print(f"\n✅ Dataset preparado: {X.shape[0]} imágenes en {len(class_names)} clases")
     
     # Visualizamos algunas imágenes de ejemplo por clase
     visualize_examples(X, y, class_names)
     
-    return X, y_encoded, class_names
+    return X, to_categorical(y, num_classes=len(class_names)), class_names
+
+def select_classes(files, folders, min_samples, report=True):
+    """
+    Elige las clases con suficientes imágenes válidas y asegura ambas particiones
+    
+    Marca como 'skipped' las entradas de las clases descartadas.
+    
+    Args:
+        files: Entradas del manifiesto
+        folders: Carpetas de clases en orden
+        min_samples: Número mínimo de imágenes por clase
+        report: Muestra los avisos y el resumen por clase
+    
+    Returns:
+        Lista de nombres de clases incluidas
+    """
+    class_names = []
+    for folder in folders:
+        class_files = sorted(rel_path for rel_path, entry in files.items()
+                             if entry['class'] == folder and not entry.get('error'))
+        if not class_files:
+            continue
+        if len(class_files) < min_samples:
+            if report:
+                print(f"⚠️ Advertencia: No se pudieron procesar suficientes imágenes para '{folder}', "
+                      f"se requieren al menos {min_samples}. Esta clase será ignorada.")
+            for rel_path in class_files:
+                files[rel_path]['skipped'] = True
+            continue
+        
+        # Cada clase necesita al menos una imagen en cada partición
+        splits = [files[rel_path]['split'] for rel_path in class_files]
+        for missing in ('test', 'train'):
+            if missing not in splits:
+                candidates = sorted(class_files, key=lambda rel_path: files[rel_path]['sha1'])
+                moved = candidates[0] if missing == 'test' else candidates[-1]
+                files[moved]['split'] = missing
+                splits = [files[rel_path]['split'] for rel_path in class_files]
+        
+        class_names.append(folder)
+        if report:
+            n_test = splits.count('test')
+            print(f"✓ Clase '{folder}': {len(class_files) - n_test} imágenes de entrenamiento y {n_test} de prueba")
+    return class_names
+
+def dataset_rows(files, class_names):
+    """
+    Orden de las filas del dataset: por clase y por ruta
+    
+    Returns:
+        Lista de rutas relativas
+    """
+    return [rel_path for folder in class_names
+            for rel_path in sorted(rel_path for rel_path, entry in files.items()
+                                   if entry['class'] == folder and not entry.get('error')
+                                   and not entry.get('skipped'))]
+
+def publish_splits(data_dir, files, old_files, class_names, split_mode):
+    """Escribe data/splits.json y, si el modo lo pide, actualiza las carpetas de particiones"""
+    write_split_manifest(files, class_names)
+    if split_mode != 'manifest':
+        sync_split_dirs(data_dir, files, old_files, class_names, mode=split_mode)
+
+def write_split_manifest(files, class_names, path=SPLITS_PATH):
+    """
+    Escribe la pertenencia a entrenamiento/prueba como un archivo JSON
+    
+    Es la representación por defecto de las particiones: sólo metadatos,
+    reproducible y sin duplicar imágenes. Las rutas son relativas a data/raw.
+    El archivo sólo se reescribe si su contenido cambia.
+    
+    Args:
+        files: Entradas del manifiesto del dataset
+        class_names: Clases incluidas en el dataset
+        path: Ruta del archivo de particiones
+    
+    Returns:
+        True si el archivo se actualizó
+    """
+    splits = {'train': {name: [] for name in class_names}, 'test': {name: [] for name in class_names}}
+    for rel_path, entry in sorted(files.items()):
+        if entry['class'] in class_names and not entry.get('error') and not entry.get('skipped'):
+            splits[entry['split']][entry['class']].append({'path': rel_path, 'sha1': entry['sha1']})
+    
+    content = json.dumps(splits, indent=1, sort_keys=True)
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            if f.read() == content:
+                return False
+    
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path + '.tmp', 'w') as f:
+        f.write(content)
+    os.replace(path + '.tmp', path)
+    return True
+
+def _place_file(source, dest, mode):
+    """
+    Coloca una imagen en la carpeta de su partición
+    
+    Args:
+        source: Imagen original en data/raw
+        dest: Ruta dentro de data/entrenamiento o data/prueba
+        mode: 'hardlink', 'symlink' o 'copy'
+    
+    Returns:
+        Modo realmente usado (un enlace duro entre sistemas de archivos
+        distintos no es posible y se sustituye por un enlace simbólico)
+    """
+    # Nunca se escribe sobre el destino: si es un enlace duro, modificaría el original
+    if os.path.lexists(dest):
+        os.remove(dest)
+    if mode == 'hardlink':
+        try:
+            os.link(source, dest)
+            return mode
+        except OSError:
+            mode = 'symlink'
+    if mode == 'symlink':
+        os.symlink(os.path.abspath(source), dest)
+        return mode
+    shutil.copy(source, dest)
+    return mode
+
+def sync_split_dirs(data_dir, files, old_files, class_names, mode='hardlink',
+                    train_root="data/entrenamiento", test_root="data/prueba"):
+    """
+    Actualiza data/entrenamiento y data/prueba según el manifiesto
+    
+    Sólo toca las imágenes nuevas, modificadas o que cambiaron de partición,
+    y borra las de las imágenes eliminadas. Con enlaces (por defecto) el
+    coste es sólo de metadatos: no se duplica ningún byte de imagen.
+    
+    Args:
+        data_dir: Directorio con las imágenes por clase
+        files: Entradas actuales del manifiesto
+        old_files: Entradas del manifiesto anterior
+        class_names: Clases incluidas en el dataset
+        mode: 'hardlink', 'symlink' o 'copy'
+        train_root: Carpeta de entrenamiento
+        test_root: Carpeta de prueba
+    """
+    def destination(entry, rel_path):
+        root = test_root if entry['split'] == 'test' else train_root
+        return os.path.join(root, entry['class'], os.path.basename(rel_path))
+    
+    placed = 0
+    removed = 0
+    used_modes = set()
+    
+    # Quitamos las entradas que ya no corresponden
+    for rel_path, old in old_files.items():
+        if old.get('row') is None:
+            continue
+        entry = files.get(rel_path)
+        if (entry is None or entry['class'] not in class_names or entry.get('error')
+                or entry.get('skipped') or entry['split'] != old['split']):
+            old_dest = destination(old, rel_path)
+            if os.path.lexists(old_dest):
+                os.remove(old_dest)
+                removed += 1
+    
+    # Enlazamos (o copiamos) lo nuevo o modificado
+    for rel_path, entry in files.items():
+        if entry['class'] not in class_names or entry.get('error') or entry.get('skipped'):
+            continue
+        old = old_files.get(rel_path)
+        dest = destination(entry, rel_path)
+        if old is None or old['sha1'] != entry['sha1'] or old['split'] != entry['split'] \
+                or not os.path.exists(dest):
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            used_modes.add(_place_file(os.path.join(data_dir, rel_path), dest, mode))
+            placed += 1
+    
+    if placed or removed:
+        print(f"Particiones actualizadas ({', '.join(sorted(used_modes)) or mode}): "
+              f"{placed} nuevas, {removed} eliminadas")
 
 def visualize_examples(X, y, class_names, samples_per_class=3):
     """
@@ -318,7 +627,8 @@ def add_new_class(data_dir, raw_dir, model_path, class_names_path):
         print(f"Error al añadir nueva clase: {e}")
         return False
 
-def predict_image(image_path, model_path, class_names_path, img_height=224, img_width=224):
+def predict_image(image_path, model_path, class_names_path, img_height=None, img_width=None,
+                  fast_decode=None):
     """
     Predice la clase de una imagen
     
@@ -326,30 +636,33 @@ def predict_image(image_path, model_path, class_names_path, img_height=224, img_
         image_path: Ruta a la imagen
         model_path: Ruta al modelo guardado
         class_names_path: Ruta a los nombres de clases guardados
-        img_height: Altura de la imagen
-        img_width: Anchura de la imagen
+        img_height: Altura de la imagen (None = la de entrada del modelo)
+        img_width: Anchura de la imagen (None = la de entrada del modelo)
+        fast_decode: Decodifica JPEG a resolución reducida (None = valor de FAST_DECODE)
     
     Returns:
         predicted_class: Nombre de la clase predicha
         confidence: Confianza de la predicción
     """
-    from tensorflow.keras.models import load_model
-    
     try:
-        # Cargamos el modelo
-        model = load_model(model_path)
+        # Cargamos el modelo (TFLite si la ruta apunta a un archivo .tflite).
+        # Para muchas imágenes, utils.batch_predict lo carga una sola vez
+        from utils.models_utils import load_prediction_model
+        model = load_prediction_model(model_path)
+        img_height = img_height or model.input_shape[1]
+        img_width = img_width or model.input_shape[2]
         
         # Cargamos los nombres de las clases
         with open(class_names_path, 'r') as f:
             class_names = [line.strip() for line in f.readlines()]
         
         # Procesamos la imagen
-        img = Image.open(image_path).convert('RGB')
-        img = img.resize((img_width, img_height))
-        img_array = np.expand_dims(np.array(img) / 255.0, axis=0)
+        img_array = np.expand_dims(
+            load_image_array(image_path, img_height, img_width, fast_decode=fast_decode), axis=0
+        )
         
         # Realizamos la predicción
-        predictions = model.predict(img_array)
+        predictions = model.predict(img_array, verbose=0)
         predicted_idx = np.argmax(predictions[0])
         confidence = predictions[0][predicted_idx]
         